@@ -1,8 +1,30 @@
 import logging
 
 functional = {
+    # If True, scripts can start before every light has been discovered.
+    'async_discover': False,
     'default_num_lights': None,
+    'discovery_threads': 16,
+    'discovery_wait_time': 10, # seconds
+
+    # Don't send a color or power that a light has already reached, or that
+    # a recent read shows it already has.
+    'elide_redundant': False,
     'light_gc_time': 20 * 60, # seconds (20 minutes)
+
+    # Scripts run on a pool of at most max_job_threads threads. No more than
+    # max_background_jobs of them run in the background at once; a request
+    # for another waits up to background_wait_time for one to finish.
+    'max_background_jobs': 3,
+    'max_dispatch_threads': 16,
+    'max_job_threads': 4,
+    'background_wait_time': 0, # seconds
+
+    # Run scripts as coroutines on one event loop instead of on threads.
+    'async_jobs': False,
+
+    # Run the optimizer over the code for each script before executing it.
+    'optimize': True,
     'sleep_time': 0.01, # seconds
 
     'generated_path': 'generated',
@@ -15,9 +37,19 @@ functional = {
     # Ignored unless log_to_console is False.
     'log_file_name': '/var/log/lights/lights.log',
 
+    # If None, compiled programs are cached only in memory.
+    'program_cache_path': None,
+
     'refresh_sleep_time': 600, # seconds
     'failure_sleep_time': 120, # seconds
     'script_path': 'scripts',
     'single_light_discover': False,
+
+    # Script files at least this many bytes start running while they're
+    # still being parsed. None disables this.
+    'stream_threshold': 100000,
+
+    # Seconds that a light's color and power are cached. Zero disables it.
+    'state_cache_ttl': 5,
     'use_fakes': False
 }
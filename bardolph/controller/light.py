@@ -1,18 +1,232 @@
+import copy
 import logging
+import threading
 import time
 
 from lifxlan.errors import WorkflowException
 
 from bardolph.lib.color import rounded_color
 
+
+class CacheStats:
+    """
+    Counts of reads from StateCache objects. A hit was served from the cache.
+    A miss found nothing cached, and a stale read found a value that had been
+    cached for longer than the time-to-live. Both of the latter require a
+    round-trip to the light.
+
+    Also counts the commands that were not sent because the light already
+    had the requested state.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+        self._suppressed = 0
+
+    @property
+    def hits(self) -> int:
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        return self._misses
+
+    @property
+    def stale(self) -> int:
+        return self._stale
+
+    @property
+    def suppressed(self) -> int:
+        return self._suppressed
+
+    def count_hit(self):
+        with self._lock:
+            self._hits += 1
+
+    def count_miss(self):
+        with self._lock:
+            self._misses += 1
+
+    def count_stale(self):
+        with self._lock:
+            self._stale += 1
+
+    def count_suppressed(self):
+        with self._lock:
+            self._suppressed += 1
+
+    def reset(self):
+        with self._lock:
+            self._hits = self._misses = self._stale = self._suppressed = 0
+
+
+class StateCache:
+    """
+    Most recently known state of a light, such as its color and power. Values
+    come either from reading the light or from commands sent to it. A value
+    is returned by get() only if it was stored within ttl seconds. If ttl is
+    zero, nothing is cached.
+
+    A value that was read from the light, rather than assumed from a command,
+    is confirmed. Only a confirmed value shows that the light really is in
+    that state.
+    """
+    def __init__(self, ttl, stats):
+        self._ttl = ttl
+        self._stats = stats
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        if self._ttl <= 0.0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key, None)
+        if entry is None:
+            self._stats.count_miss()
+            return None
+        value, timestamp, _ = entry
+        if time.time() - timestamp > self._ttl:
+            self._stats.count_stale()
+            return None
+        self._stats.count_hit()
+        return copy.copy(value)
+
+    def put(self, key, value, confirmed=False):
+        if self._ttl > 0.0:
+            with self._lock:
+                self._entries[key] = (
+                    copy.copy(value), time.time(), confirmed)
+
+    def confirmed(self, key):
+        """
+        The value for key if it was read from the light within ttl seconds,
+        otherwise None. Not counted in the stats.
+        """
+        with self._lock:
+            entry = self._entries.get(key, None)
+        if entry is None or not self._is_confirmed(entry):
+            return None
+        return copy.copy(entry[0])
+
+    def confirmed_zones(self):
+        """
+        List of (first_zone, colors) for each confirmed read of a light's
+        zones, where colors holds the colors of consecutive zones starting
+        with first_zone.
+        """
+        with self._lock:
+            entries = [(key, entry) for key, entry in self._entries.items()
+                       if key[0] == 'zones']
+        return [(key[1] or 0, entry[0]) for key, entry in entries
+                if self._is_confirmed(entry)]
+
+    def _is_confirmed(self, entry) -> bool:
+        _, timestamp, confirmed = entry
+        return confirmed and time.time() - timestamp <= self._ttl
+
+    def invalidate(self, *keys):
+        with self._lock:
+            if len(keys) == 0:
+                self._entries.clear()
+            else:
+                for key in keys:
+                    self._entries.pop(key, None)
+
+    def invalidate_zones(self):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == 'zones']:
+                del self._entries[key]
+
+
+class CommandHistory:
+    """
+    The most recent color and power sent to a light, and to each of its
+    zones, along with the time at which the light should have reached them.
+    A command is redundant if it asks for a state that the light has already
+    reached. Zones that haven't been set individually have the color most
+    recently set for the whole light.
+    """
+    def __init__(self):
+        self._targets = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, value, duration):
+        # duration is in milliseconds.
+        reached = time.time() + duration / 1000.0
+        with self._lock:
+            self._targets[key] = (copy.copy(value), reached)
+
+    def record_zones(self, first_zone, last_zone, color, duration):
+        reached = time.time() + duration / 1000.0
+        with self._lock:
+            self._targets.pop('color', None)
+            for zone in range(first_zone, last_zone):
+                self._targets[('zone', zone)] = (copy.copy(color), reached)
+
+    def record_zone_colors(self, first_zone, colors, duration):
+        reached = time.time() + duration / 1000.0
+        with self._lock:
+            self._targets.pop('color', None)
+            for zone, color in enumerate(colors, first_zone):
+                self._targets[('zone', zone)] = (copy.copy(color), reached)
+
+    def forget(self, key):
+        with self._lock:
+            self._targets.pop(key, None)
+
+    def forget_zones(self):
+        with self._lock:
+            for key in [key for key in self._targets if key[0] == 'zone']:
+                del self._targets[key]
+
+    def is_reached(self, key, value) -> bool:
+        with self._lock:
+            return self._is_reached(key, value)
+
+    def zones_reached(self, first_zone, last_zone, color) -> bool:
+        with self._lock:
+            return all(
+                self._is_reached(('zone', zone), color)
+                for zone in range(first_zone, last_zone))
+
+    def zone_colors_reached(self, first_zone, colors) -> bool:
+        with self._lock:
+            return all(
+                self._is_reached(('zone', zone), color)
+                for zone, color in enumerate(colors, first_zone))
+
+    def _is_reached(self, key, value) -> bool:
+        target = self._targets.get(key, None)
+        if target is None and key[0] == 'zone':
+            target = self._targets.get('color', None)
+        return (target is not None
+                and target[0] == value and time.time() >= target[1])
+
+
 class Light:
-    def __init__(self, lifx_light):
+    def __init__(self, lifx_light, state_ttl=0.0, cache_stats=None,
+                 elide=False):
+        """
+        state_ttl: how long, in seconds, the color and power of the light are
+            cached. Zero disables caching.
+        cache_stats: shared CacheStats that counts reads from the cache.
+        elide: if True, don't send a command that would only repeat one that
+            was sent previously, or a color or power that a read from the
+            light, within the last state_ttl seconds, shows that it already
+            has. Turning the power off is always sent.
+        """
         self._impl = lifx_light
         self._name = lifx_light.get_label()
         self._group = lifx_light.get_group()
         self._location = lifx_light.get_location()
         self._multizone = lifx_light.supports_multizone()
         self._birth = time.time()
+        self._stats = cache_stats or CacheStats()
+        self._cache = StateCache(state_ttl, self._stats)
+        self._history = CommandHistory() if elide else None
 
     def __repr__(self):
         fmt = 'Light(_name="{}", _group="{}", _location="{}", _multizone={}, '
@@ -43,41 +257,196 @@ class Light:
         #seconds
         return time.time() - self._birth
 
-    def set_color(self, color, duration, rapid=True):
+    def set_color(self, color, duration, rapid=True) -> bool:
+        color = rounded_color(color)
+        if self.color_is_current(color):
+            self._stats.count_suppressed()
+            return True
         try:
-            self._impl.set_color(rounded_color(color), duration, rapid)
+            self._impl.set_color(color, duration, rapid)
         except WorkflowException as ex:
             logging.warning("In set_color(): {}".format(ex))
+            self._cache.invalidate('color')
+            self._forget('color')
+            return False
+        self.color_was_set(color, duration)
+        return True
+
+    def color_is_current(self, color) -> bool:
+        """
+        True if the light has already been set to color, or a recent read
+        shows that it has color.
+        """
+        if self._history is None:
+            return False
+        if self._history.is_reached('color', color):
+            return True
+        actual = self._cache.confirmed('color')
+        return actual is not None and list(actual) == color
+
+    def color_was_set(self, color, duration=0):
+        # Also called when the color was set by a command sent to all lights.
+        # During a transition, the color has to be read from the light.
+        if duration > 0:
+            self._cache.invalidate('color')
+        else:
+            self._cache.put('color', color)
+        self._cache.invalidate_zones()
+        if self._history is not None:
+            self._history.record('color', color, duration)
+            self._history.forget_zones()
 
     def get_color(self):
+        color = self._cache.get('color')
+        if color is not None:
+            return color
         try:
-            return self._impl.get_color()
+            color = self._impl.get_color()
+            self._cache.put('color', color, True)
+            self._check_reached('color', list(color))
+            return color
         except WorkflowException as ex:
             logging.warning("In get_color(): {}".format(ex))
         return [-1] * 4
 
     def set_zone_color(self, first_zone, last_zone, color, duration):
+        color = rounded_color(color)
+        if ((self._history is not None and self._history.zones_reached(
+                first_zone, last_zone, color))
+                or self._zones_are_current(
+                    first_zone, [color] * (last_zone - first_zone))):
+            self._stats.count_suppressed()
+            return
+        self._cache.invalidate('color')
+        self._cache.invalidate_zones()
         try:
-            self._impl.set_zone_color(
-                first_zone, last_zone, rounded_color(color), duration)
+            self._impl.set_zone_color(first_zone, last_zone, color, duration)
         except WorkflowException as ex:
             logging.warning("In set_zone_color(): {}".format(ex))
+            self._forget_zones()
+            return
+        if self._history is not None:
+            self._history.record_zones(first_zone, last_zone, color, duration)
+
+    def set_zone_colors(self, first_zone, colors, duration):
+        """
+        Set consecutive zones, starting with first_zone, to the colors in the
+        list, one color per zone. The colors are sent together, in as few
+        messages as the protocol allows.
+        """
+        colors = [rounded_color(color) for color in colors]
+        if ((self._history is not None
+                and self._history.zone_colors_reached(first_zone, colors))
+                or self._zones_are_current(first_zone, colors)):
+            self._stats.count_suppressed()
+            return
+        self._cache.invalidate('color')
+        self._cache.invalidate_zones()
+        try:
+            self._impl.extended_set_zone_color(colors, first_zone, duration)
+        except WorkflowException as ex:
+            logging.warning("In set_zone_colors(): {}".format(ex))
+            self._forget_zones()
+            return
+        if self._history is not None:
+            self._history.record_zone_colors(first_zone, colors, duration)
 
     def get_color_zones(self, first_zone=None, last_zone=None):
+        key = ('zones', first_zone, last_zone)
+        colors = self._cache.get(key)
+        if colors is not None:
+            return colors
         try:
-            return self._impl.get_color_zones(first_zone, last_zone)
+            colors = self._impl.get_color_zones(first_zone, last_zone)
+            self._cache.put(key, colors, True)
+            self._check_zones_reached(first_zone or 0, colors)
+            return colors
         except WorkflowException as ex:
             logging.warning("In get_color_zones(): {}".format(ex))
 
-    def set_power(self, power, duration, rapid=True):
+    def set_power(self, power, duration, rapid=True) -> bool:
+        power = round(power)
+        if self.power_is_current(power):
+            self._stats.count_suppressed()
+            return True
         try:
-            return self._impl.set_power(round(power), duration, rapid)
+            self._impl.set_power(power, duration, rapid)
         except WorkflowException as ex:
             logging.warning("In set_power(): {}".format(ex))
+            self._cache.invalidate('power')
+            self._forget('power')
+            return False
+        self.power_was_set(power, duration)
+        return True
+
+    def power_is_current(self, power) -> bool:
+        """
+        True if the light has already been set to power, or a recent read
+        shows that it has power. Always False for turning the power off,
+        which is never skipped.
+        """
+        if self._history is None or power == 0:
+            return False
+        return (self._history.is_reached('power', power)
+                or self._cache.confirmed('power') == power)
+
+    def power_was_set(self, power, duration=0):
+        # Also called when the power was set by a command sent to all lights.
+        if duration > 0:
+            self._cache.invalidate('power')
+        else:
+            self._cache.put('power', power)
+        if self._history is not None:
+            self._history.record('power', power, duration)
 
     def get_power(self):
+        power = self._cache.get('power')
+        if power is not None:
+            return power
         try:
-            return self._impl.get_power()
+            power = self._impl.get_power()
+            self._cache.put('power', power, True)
+            self._check_reached('power', power)
+            return power
         except WorkflowException as ex:
             logging.warning("In get_power(): {}".format(ex))
         return -1
+
+    def invalidate_cache(self):
+        self._cache.invalidate()
+
+    def _forget(self, key):
+        if self._history is not None:
+            self._history.forget(key)
+
+    def _forget_zones(self):
+        if self._history is not None:
+            self._history.forget('color')
+            self._history.forget_zones()
+
+    def _check_reached(self, key, actual):
+        # If the light was changed by something else, such as a phone app,
+        # the next command has to be sent, even if it repeats the last one.
+        if (self._history is not None
+                and not self._history.is_reached(key, actual)):
+            self._history.forget(key)
+
+    def _check_zones_reached(self, first_zone, colors):
+        # Same as _check_reached(), for a read of consecutive zones.
+        if (self._history is not None
+                and not self._history.zone_colors_reached(
+                    first_zone, [list(color) for color in colors])):
+            self._forget_zones()
+
+    def _zones_are_current(self, first_zone, colors) -> bool:
+        # True if a recent read of the zones covers every one of them and
+        # shows that each already has its color.
+        if self._history is None:
+            return False
+        for start, actual in self._cache.confirmed_zones():
+            offset = first_zone - start
+            if offset >= 0 and offset + len(colors) <= len(actual):
+                if [list(color) for color in
+                        actual[offset:offset + len(colors)]] == colors:
+                    return True
+        return False
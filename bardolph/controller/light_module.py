@@ -4,6 +4,7 @@ from ..lib.i_lib import Settings
 from ..lib.injection import provide
 
 from . import light_set
+from . import program_cache
 
 def configure():
     """ Assumes injection and settings are already initialized. """
@@ -19,3 +20,4 @@ def configure():
         lifx.configure()
 
     light_set.configure()
+    program_cache.configure()
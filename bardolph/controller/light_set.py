@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 
+from concurrent.futures import ThreadPoolExecutor
 import logging
+from operator import methodcaller
 import threading
 import time
 
@@ -12,14 +14,27 @@ from bardolph.lib.i_lib import Settings
 
 from .i_controller import Lifx
 from . import i_controller
-from .light import Light
+from .light import CacheStats, Light
 
 
 class LightSet(i_controller.LightSet):
     """
-    Groups and locations are stored in dictionaries of set() objects. Each
-    dictionary is keyed on group or location name. The value
-    associated with a group or location name is a set of Light objects.
+    Groups and locations are stored in dictionaries keyed on group or location
+    name. The value associated with a group or location name is another
+    dictionary, which maps light name to Light object.
+
+    For each light, self._group_index and self._location_index hold the name
+    of the group and location it currently belongs to. With these reverse
+    indexes, moving or removing a light takes constant time, regardless of
+    how many groups, locations, and lights there are.
+
+    Each Light caches its color and power for state_cache_ttl seconds. Every
+    discovery creates new Light objects, which start with empty caches and
+    command histories.
+
+    During discovery, devices are probed in parallel, and each light is
+    merged into the dictionaries as soon as it responds. Modifications to
+    the dictionaries are made while holding self._cond.
     """
     the_instance = None
 
@@ -27,8 +42,15 @@ class LightSet(i_controller.LightSet):
         self._light_dict = {}
         self._group_dict = {}
         self._location_dict = {}
+        self._group_index = {}
+        self._location_index = {}
         self._num_successful_discovers = 0
         self._num_failed_discovers = 0
+        self._num_discovering = 0
+        self._cond = threading.Condition()
+        self._executors = {}
+        self._executor_lock = threading.Lock()
+        self._cache_stats = CacheStats()
 
     @classmethod
     def configure(cls):
@@ -38,58 +60,146 @@ class LightSet(i_controller.LightSet):
     def get_instance(cls):
         return LightSet.the_instance
 
+    def discover(self):
+        """
+        Returns after every device has been probed. Returns True if all of
+        them responded.
+        """
+        self._begin_discovery()
+        return self._discover()
+
+    def discover_async(self):
+        """
+        Start discovery in the background and return immediately. Use
+        wait_for_lights() to block until specific lights are available.
+        """
+        self._begin_discovery()
+        threading.Thread(
+            target=self._discover, name='discover', daemon=True).start()
+
+    def wait_for_lights(self, names, timeout, cancel_token=None) -> bool:
+        """
+        If discovery is in progress, block until every light in names has been
+        found, discovery finishes, or timeout seconds elapse. Returns True if
+        all of the lights are available.
+
+        If names is None, wait for discovery to finish, and return True
+        unless the timeout elapsed first.
+
+        If cancel_token is cancelled, stop waiting right away.
+        """
+        deadline = time.time() + timeout
+        if cancel_token is not None:
+            cancel_token.add_callback(self._wake_waiters)
+        try:
+            with self._cond:
+                while (not self._has_lights(names)
+                       and self._num_discovering > 0
+                       and not (cancel_token is not None
+                                and cancel_token.is_cancelled)):
+                    remaining = deadline - time.time()
+                    if remaining <= 0.0:
+                        break
+                    self._cond.wait(remaining)
+                return self._has_lights(names)
+        finally:
+            if cancel_token is not None:
+                cancel_token.remove_callback(self._wake_waiters)
+
+    def _wake_waiters(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    @property
+    def is_discovering(self) -> bool:
+        return self._num_discovering > 0
+
+    def refresh(self):
+        stats = self._cache_stats
+        logging.info(
+            'state cache: hits = {}, misses = {}, stale = {}, suppressed = {}'
+            .format(stats.hits, stats.misses, stats.stale, stats.suppressed))
+        success = self.discover()
+        self._garbage_collect()
+        return success
+
+    def _begin_discovery(self):
+        with self._cond:
+            self._num_discovering += 1
+
     @inject(Lifx)
-    def discover(self, lifx):
+    def _discover(self, lifx):
         logging.info('start discover. so far, successes = {}, fails = {}'
                      .format(self._num_successful_discovers,
                              self._num_failed_discovers))
+        success = False
         try:
-            for lifx_light in lifx.get_lights():
-                light = Light(lifx_light)
-                self._light_dict[light.name] = light
-                LightSet._update_memberships(
-                    light, light.group, self._group_dict)
-                LightSet._update_memberships(
-                    light, light.location, self._location_dict)
+            devices = lifx.get_lights()
+            executor = self._get_executor('discovery_threads', 16)
+            success = all(list(executor.map(self._probe, devices)))
         except lifxlan.errors.WorkflowException as ex:
-            self._num_failed_discovers += 1
             logging.warning("In discover():\n{}".format(ex))
-            return False
+        finally:
+            with self._cond:
+                self._num_discovering -= 1
+                if success:
+                    self._num_successful_discovers += 1
+                else:
+                    self._num_failed_discovers += 1
+                self._cond.notify_all()
+        return success
 
-        self._num_successful_discovers += 1
+    @inject(Settings)
+    def _probe(self, device, settings) -> bool:
+        # Runs on a worker thread. Constructing the Light queries the device.
+        ttl = float(settings.get_value('state_cache_ttl', 0))
+        elide = bool(settings.get_value('elide_redundant', False))
+        try:
+            light = Light(device, ttl, self._cache_stats, elide)
+        except lifxlan.errors.WorkflowException as ex:
+            logging.warning("Unable to probe device:\n{}".format(ex))
+            return False
+        with self._cond:
+            self._light_dict[light.name] = light
+            LightSet._update_membership(
+                light, light.group, self._group_dict, self._group_index)
+            LightSet._update_membership(
+                light, light.location, self._location_dict,
+                self._location_index)
+            self._cond.notify_all()
         return True
 
-    def refresh(self):
-        self.discover()
-        self._garbage_collect()
+    def _has_lights(self, names) -> bool:
+        if names is None:
+            return self._num_discovering == 0
+        return all(name in self._light_dict for name in names)
 
     @classmethod
-    def _update_memberships(cls, light, current_set_name, set_dict):
-        if current_set_name not in set_dict:
-            # New set
-            LightSet._remove_memberships(light, set_dict)
-            set_dict[current_set_name] = set([light])
-        elif light not in set_dict[current_set_name]:
-            # Changed set or newer light object has same name
-            LightSet._remove_memberships(light, set_dict)
-            set_dict[current_set_name].add(light)
+    def _update_membership(cls, light, set_name, set_dict, index):
+        """
+        Put the light into the named set, first taking it out of whatever set
+        it was in before. A newer Light object with the same name replaces
+        the old one.
+        """
+        old_set_name = index.get(light.name, None)
+        if old_set_name is not None and old_set_name != set_name:
+            LightSet._remove_membership(light.name, set_dict, index)
+        members = set_dict.get(set_name, None)
+        if members is None:
+            members = {}
+            set_dict[set_name] = members
+        members[light.name] = light
+        index[light.name] = set_name
 
     @classmethod
-    def _remove_memberships(cls, light, set_dict):
-        # Remove the light from every set in set_dict that it belongs to.
-        target_set_names = []
-        for set_name in set_dict.keys():
-            the_set = set_dict[set_name]
-            target_light = None
-            for member in the_set:
-                if member.name == light.name:
-                    target_light = member
-                    break
-            if target_light is not None:
-                the_set.discard(target_light)
-                if len(the_set) == 0:
-                    target_set_names.append(set_name)
-        for set_name in target_set_names:
+    def _remove_membership(cls, light_name, set_dict, index):
+        # Remove the light from its set, and the set itself if it's now empty.
+        set_name = index.pop(light_name, None)
+        if set_name is None:
+            return
+        members = set_dict[set_name]
+        members.pop(light_name, None)
+        if len(members) == 0:
             del set_dict[set_name]
 
     @inject(Settings)
@@ -98,17 +208,18 @@ class LightSet(i_controller.LightSet):
         logging.debug("garbage collect, currently have {} lights"
                       .format(len(self._light_dict)))
         max_age = int(settings.get_value('light_gc_time', 20 * 60))
-        target_lights = []
-        for item in self._light_dict.items():
-            # Maps light name to light
-            light = item[1]
-            if light.age > max_age:
-                LightSet._remove_memberships(light, self._group_dict)
-                LightSet._remove_memberships(light, self._location_dict)
-                target_lights.append(item[0])
-        for light_name in target_lights:
-            logging.debug("_garbage_collect() deleting {}".format(light_name))
-            del self._light_dict[light_name]
+        with self._cond:
+            target_lights = [
+                name for name, light in self._light_dict.items()
+                if light.age > max_age]
+            for light_name in target_lights:
+                logging.debug(
+                    "_garbage_collect() deleting {}".format(light_name))
+                LightSet._remove_membership(
+                    light_name, self._group_dict, self._group_index)
+                LightSet._remove_membership(
+                    light_name, self._location_dict, self._location_index)
+                del self._light_dict[light_name]
 
     @property
     def light_names(self):
@@ -142,28 +253,97 @@ class LightSet(i_controller.LightSet):
     def failed_discovers(self):
         return self._num_failed_discovers
 
+    @property
+    def cache_stats(self) -> CacheStats:
+        return self._cache_stats
+
     def get_light(self, name):
         """ returns an instance of i_lib.Light, or None if it's not there """
         return self._light_dict.get(name, None)
 
     def get_group(self, name):
         """ list of Lights """
-        return self._group_dict.get(name, None)
+        return self._get_members(self._group_dict, name)
 
     def get_location(self, name):
         """ list of Lights. """
-        return self._location_dict.get(name, None)
+        return self._get_members(self._location_dict, name)
+
+    def _get_members(self, set_dict, name):
+        # Return a copy, which discovery can't modify during iteration.
+        with self._cond:
+            members = set_dict.get(name, None)
+            return None if members is None else list(members.values())
 
     @inject(Lifx)
     def set_color(self, color, duration, lifx):
-        lifx.set_color_all_lights(rounded_color(color), duration)
+        color = rounded_color(color)
+        lights = self._all_lights()
+        if len(lights) > 0 and all(
+                light.color_is_current(color) for light in lights):
+            self._cache_stats.count_suppressed()
+            return True
+        lifx.set_color_all_lights(color, duration)
+        for light in lights:
+            light.color_was_set(color, duration)
         return True
 
+    def set_color_multiple(self, lights, color, duration):
+        """ Returns a list of (Light, bool) tuples, as with dispatch(). """
+        command = methodcaller('set_color', color, duration)
+        return self.dispatch([(light, command) for light in lights])
+
+    def set_power_multiple(self, lights, power_level, duration):
+        """ Returns a list of (Light, bool) tuples, as with dispatch(). """
+        command = methodcaller('set_power', power_level, duration)
+        return self.dispatch([(light, command) for light in lights])
+
+    def dispatch(self, commands):
+        """
+        Send commands to multiple lights concurrently, so that a group or
+        location changes all at once rather than one light after another.
+
+        commands: a list of (Light, command) tuples. The command is a callable
+            that takes the Light as its only parameter.
+
+        Returns a list of (Light, result) tuples, in the same order as the
+        incoming commands, after every command has completed.
+        """
+        if len(commands) < 2:
+            return [(light, command(light)) for light, command in commands]
+        executor = self._get_executor('max_dispatch_threads', 16)
+        futures = [(light, executor.submit(command, light))
+                   for light, command in commands]
+        return [(light, future.result()) for light, future in futures]
+
+    @inject(Settings)
+    def _get_executor(self, setting_name, default, settings):
+        # One thread pool for each purpose, sized by the given setting.
+        with self._executor_lock:
+            executor = self._executors.get(setting_name, None)
+            if executor is None:
+                max_threads = int(settings.get_value(setting_name, default))
+                executor = ThreadPoolExecutor(max_threads)
+                self._executors[setting_name] = executor
+        return executor
+
     @inject(Lifx)
     def set_power(self, power_level, duration, lifx):
-        lifx.set_power_all_lights(round(power_level), duration)
+        power_level = round(power_level)
+        lights = self._all_lights()
+        if len(lights) > 0 and all(
+                light.power_is_current(power_level) for light in lights):
+            self._cache_stats.count_suppressed()
+            return True
+        lifx.set_power_all_lights(power_level, duration)
+        for light in lights:
+            light.power_was_set(power_level, duration)
         return True
 
+    def _all_lights(self):
+        with self._cond:
+            return list(self._light_dict.values())
+
 
 def start_light_refresh():
     logging.debug("Starting refresh thread.")
@@ -196,7 +376,10 @@ def configure(settings):
     LightSet.configure()
     lights = LightSet.get_instance()
     bind_instance(lights).to(i_controller.LightSet)
-    lights.discover()
+    if bool(settings.get_value('async_discover', False)):
+        lights.discover_async()
+    else:
+        lights.discover()
 
     single = bool(settings.get_value('single_light_discover', False))
     if not single:
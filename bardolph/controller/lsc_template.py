@@ -9,6 +9,7 @@ from bardolph.controller import arg_helper
 from bardolph.controller import config_values
 from bardolph.controller import light_module
 from bardolph.controller.units import UnitMode
+from bardolph.lib.time_pattern import TimePattern
 from bardolph.vm import machine
 from bardolph.vm.instruction import Instruction, OpCode
 from bardolph.vm.vm_codes import JumpCondition, LoopVar, Operand, Operator
@@ -19,11 +20,14 @@ assembly = [
 
 ]
 
-params_0 = (OpCode.BREAKPOINT, OpCode.COLOR, OpCode.END_LOOP, OpCode.LOOP,
-            OpCode.NOP, OpCode.PAUSE, OpCode.POWER, OpCode.STOP, OpCode.WAIT)
+params_0 = (OpCode.BREAKPOINT, OpCode.COLOR, OpCode.END_LOOP, OpCode.GRADIENT,
+            OpCode.LOOP, OpCode.NOP, OpCode.PAUSE, OpCode.POWER, OpCode.STOP,
+            OpCode.WAIT)
 
-params_1 = (OpCode.END, OpCode.GET_COLOR, OpCode.JSR, OpCode.OP, OpCode.POP,
-            OpCode.PUSH, OpCode.PUSHQ, OpCode.ROUTINE)
+params_1 = (OpCode.ADD_INCR, OpCode.END, OpCode.GET_COLOR, OpCode.JSR,
+            OpCode.OP, OpCode.POP, OpCode.PUSH, OpCode.PUSHQ, OpCode.ROUTINE)
+
+params_3 = (OpCode.TEST,)
 
 def get_assembly():
     current_instruction = 0
@@ -41,11 +45,14 @@ def build_instructions():
             param_count = 0
         elif op_code in params_1:
             param_count = 1
+        elif op_code in params_3:
+            param_count = 3
         else:
             param_count = 2
         param0 = None if param_count < 1 else next(it)
         param1 = None if param_count < 2 else next(it)
-        program.append(Instruction(op_code, param0, param1))
+        param2 = None if param_count < 3 else next(it)
+        program.append(Instruction(op_code, param0, param1, param2))
         op_code = next(it, None)
     return program
 
@@ -0,0 +1,178 @@
+import hashlib
+import logging
+import os
+import pickle
+import threading
+
+from bardolph.lib.i_lib import Settings
+from bardolph.lib.injection import inject, injected
+from bardolph.parser.parse import Parser
+
+
+class ProgramCache:
+    """
+    Compiled programs, keyed on a hash of the script's content, the parser
+    version, and whether the code was optimized. Entries are kept in memory
+    and, if the program_cache_path setting is present, pickled to disk so
+    they survive a restart.
+
+    For each file, the modification time and size seen when it was last read
+    are remembered. If neither has changed, the file isn't read again. If
+    either has changed, the content is hashed again, which picks up any
+    edits.
+    """
+    the_instance = None
+
+    def __init__(self, cache_path=None):
+        self._cache_path = cache_path
+        self._programs = {}
+        self._files = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+
+    @classmethod
+    @inject(Settings)
+    def configure(cls, settings=injected):
+        ProgramCache.the_instance = ProgramCache(
+            settings.get_value('program_cache_path', None))
+
+    @classmethod
+    def get_instance(cls):
+        if ProgramCache.the_instance is None:
+            ProgramCache.configure()
+        return ProgramCache.the_instance
+
+    @property
+    def hits(self) -> int:
+        """ Includes programs read from disk. """
+        return self._hits
+
+    @property
+    def disk_hits(self) -> int:
+        return self._disk_hits
+
+    @property
+    def misses(self) -> int:
+        return self._misses
+
+    @classmethod
+    def make_key(cls, text, optimize) -> str:
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        return '{}-{}-{}'.format(digest, Parser.VERSION, int(bool(optimize)))
+
+    def clear(self) -> None:
+        """ Empty the in-memory cache. Files on disk are not affected. """
+        with self._lock:
+            self._programs.clear()
+            self._files.clear()
+
+    def contains(self, file_name, optimize=False) -> bool:
+        """
+        True if a compiled program for the file is in memory, and the file
+        doesn't appear to have changed since it was compiled.
+        """
+        try:
+            stat = os.stat(file_name)
+        except OSError:
+            return False
+        signature = (stat.st_mtime_ns, stat.st_size, bool(optimize))
+        with self._lock:
+            known = self._files.get(file_name, None)
+            return (known is not None and known[0] == signature
+                    and known[1] in self._programs)
+
+    def load(self, file_name, parser, optimize=False):
+        """
+        Return the compiled program for the file, using parser only if the
+        program isn't already in the cache. Returns None if the file can't be
+        read or doesn't parse; in the latter case, the errors are available
+        from parser.get_errors().
+        """
+        try:
+            stat = os.stat(file_name)
+        except OSError:
+            logging.error('Error accessing file {}'.format(file_name))
+            return None
+        signature = (stat.st_mtime_ns, stat.st_size, bool(optimize))
+
+        with self._lock:
+            known = self._files.get(file_name, None)
+            if known is not None and known[0] == signature:
+                program = self._programs.get(known[1], None)
+                if program is not None:
+                    self._hits += 1
+                    return list(program)
+
+        try:
+            with open(file_name, 'r') as srce:
+                text = srce.read()
+        except OSError:
+            logging.error('Error accessing file {}'.format(file_name))
+            return None
+
+        key = ProgramCache.make_key(text, optimize)
+        program = self._lookup(key)
+        if program is None:
+            program = parser.parse(text, optimize)
+            if program is None:
+                return None
+            with self._lock:
+                self._misses += 1
+                self._programs[key] = program
+            self._write(key, program)
+        with self._lock:
+            self._files[file_name] = (signature, key)
+        return list(program)
+
+    def _lookup(self, key):
+        with self._lock:
+            program = self._programs.get(key, None)
+            if program is not None:
+                self._hits += 1
+                return program
+        program = self._read(key)
+        if program is not None:
+            with self._lock:
+                self._hits += 1
+                self._disk_hits += 1
+                self._programs[key] = program
+        return program
+
+    def _file_for(self, key) -> str:
+        return os.path.join(self._cache_path, key + '.pickle')
+
+    def _read(self, key):
+        if self._cache_path is None:
+            return None
+        file_name = self._file_for(key)
+        if not os.path.exists(file_name):
+            return None
+        try:
+            with open(file_name, 'rb') as srce:
+                return pickle.load(srce)
+        except (OSError, pickle.PickleError, EOFError, AttributeError) as ex:
+            logging.warning(
+                'Unable to read cached program {}: {}'.format(file_name, ex))
+        return None
+
+    def _write(self, key, program) -> None:
+        if self._cache_path is None:
+            return
+        file_name = self._file_for(key)
+        try:
+            os.makedirs(self._cache_path, exist_ok=True)
+            # Write to a temporary name first so that a concurrent reader
+            # never sees a partial file.
+            temp_name = '{}.{}'.format(file_name, threading.get_ident())
+            with open(temp_name, 'wb') as dest:
+                pickle.dump(program, dest)
+            os.replace(temp_name, file_name)
+        except (OSError, pickle.PickleError) as ex:
+            logging.warning(
+                'Unable to write cached program {}: {}'.format(file_name, ex))
+
+
+def configure():
+    ProgramCache.configure()
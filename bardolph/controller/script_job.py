@@ -1,50 +1,279 @@
+import asyncio
 import logging
+import os
 
+from bardolph.controller import i_controller
+from bardolph.lib.cancel_token import CancelToken
+from bardolph.lib.i_lib import Settings
+from bardolph.lib.injection import inject, injected
 from bardolph.lib.job_control import Job
+from bardolph.vm.async_machine import AsyncMachine
 from bardolph.vm.machine import Machine
+from bardolph.vm.vm_codes import OpCode, Operand, Register
 from bardolph.parser.parse import Parser
 
+from .program_cache import ProgramCache
+
 
 class ScriptJob(Job):
-    def __init__(self):
+    """
+    A file at least as large as the stream_threshold setting, and not already
+    in the program cache, is parsed while it runs: each command is executed
+    as soon as it has been parsed, until the first one that needs the whole
+    program, such as a loop or routine definition.
+
+    If use_async is True, the script runs on an AsyncMachine, which is meant
+    to be driven by execute_async() on an event loop shared with other
+    scripts. In that case, execute() runs it on an event loop of its own.
+
+    request_stop() cancels the job's CancelToken. Whatever the job is blocked
+    on at that moment, whether a wait, a call to the lights, or discovery,
+    returns right away, and the script doesn't run any further. A call to the
+    lights that has already been sent by a Machine, rather than by an
+    AsyncMachine, still runs to completion.
+    """
+    def __init__(self, use_async=False):
         super().__init__()
         self._program = None
+        self._stream_file = None
         self._parser = Parser()
-        self._machine = Machine()
+        self._cancel_token = CancelToken()
+        machine_class = AsyncMachine if use_async else Machine
+        self._machine = machine_class(self._cancel_token)
 
     @classmethod
-    def from_file(cls, file_name):
-        new_instance = ScriptJob()
+    def from_file(cls, file_name, use_async=False):
+        new_instance = ScriptJob(use_async)
         new_instance.load_file(file_name)
         return new_instance
 
     @classmethod
-    def from_string(cls, script):
-        new_instance = ScriptJob()
+    def from_string(cls, script, use_async=False):
+        new_instance = ScriptJob(use_async)
         new_instance.load_string(script)
         return new_instance
 
+    @classmethod
+    def from_checkpoint(cls, checkpoint, use_async=False):
+        """
+        A job that is suspended at the checkpoint, which resume() continues.
+        """
+        new_instance = ScriptJob(use_async)
+        new_instance._program = checkpoint.program
+        new_instance._machine.restore(checkpoint)
+        return new_instance
+
     def load_file(self, file_name):
-        self._program = self._parser.load(file_name)
+        if self._should_stream(file_name):
+            self._stream_file = file_name
+            return None
+        self._program = ProgramCache.get_instance().load(
+            file_name, self._parser, ScriptJob._should_optimize())
         if self._program is None:
             logging.error(
                 "{}, {}".format(file_name, self._parser.get_errors()))
+        else:
+            self._log_optimizer_stats(file_name)
         return self._program
 
     def load_string(self, input_string):
-        self._program = self._parser.parse(input_string)
+        self._program = self._parser.parse(
+            input_string, ScriptJob._should_optimize())
         if self._program is None:
             logging.error(self._parser.get_errors())
+        else:
+            self._log_optimizer_stats('script')
         return self._program
 
     @property
     def program(self):
         return self._program
 
+    @property
+    def is_streaming(self) -> bool:
+        return self._stream_file is not None
+
+    @property
+    def optimizer_stats(self):
+        """
+        What the optimizer did to the program, or None if it wasn't
+        optimized when it was loaded, as when it came from the program cache.
+        """
+        return self._parser.optimizer_stats
+
+    @property
+    def is_async(self) -> bool:
+        return isinstance(self._machine, AsyncMachine)
+
     def execute(self):
-        if self._program is not None:
+        if self.is_async:
+            asyncio.run(self.execute_async())
+        elif self._stream_file is not None:
+            self._execute_stream()
+        elif self._program is not None:
+            # Reset before waiting, so that a suspend requested during the
+            # wait isn't forgotten.
             self._machine.reset()
+            self._wait_for_lights(ScriptJob.required_lights(self._program))
             self._machine.run(self._program)
 
+    async def execute_async(self):
+        if not self.is_async:
+            await super().execute_async()
+            return
+        # Waiting for discovery blocks, so it happens in the executor.
+        loop = asyncio.get_event_loop()
+        self._machine.reset()
+        if self._stream_file is not None:
+            await loop.run_in_executor(None, self._wait_for_lights, None)
+            try:
+                with open(self._stream_file, 'r') as srce:
+                    await self._machine.run_stream(self._checked_stream(srce))
+            except OSError:
+                logging.error(
+                    'Error accessing file {}'.format(self._stream_file))
+        elif self._program is not None:
+            await loop.run_in_executor(
+                None, self._wait_for_lights,
+                ScriptJob.required_lights(self._program))
+            await self._machine.run(self._program)
+
+    @classmethod
+    @inject(Settings)
+    def _should_optimize(cls, settings=injected) -> bool:
+        return bool(settings.get_value('optimize', True))
+
+    def _log_optimizer_stats(self, name):
+        stats = self._parser.optimizer_stats
+        if stats is not None:
+            logging.info('{}: optimizer {}'.format(name, stats))
+
+    @inject(Settings)
+    def _should_stream(self, file_name, settings=injected) -> bool:
+        threshold = settings.get_value('stream_threshold', None)
+        if threshold is None:
+            return False
+        try:
+            size = os.stat(file_name).st_size
+        except OSError:
+            return False
+        return (size >= int(threshold)
+                and not ProgramCache.get_instance().contains(
+                    file_name, ScriptJob._should_optimize()))
+
+    def _execute_stream(self):
+        # Lights can't be determined in advance, so wait for all of them.
+        self._machine.reset()
+        self._wait_for_lights(None)
+        try:
+            with open(self._stream_file, 'r') as srce:
+                self._machine.run_stream(self._checked_stream(srce))
+        except OSError:
+            logging.error('Error accessing file {}'.format(self._stream_file))
+
+    def _checked_stream(self, srce):
+        # After a syntax error, stop before any remaining code gets run.
+        yield from self._parser.parse_stream(srce)
+        errors = self._parser.get_errors()
+        if len(errors) > 0:
+            logging.error("{}, {}".format(self._stream_file, errors))
+            self._machine.stop()
+
+    @inject(i_controller.LightSet, Settings)
+    def _wait_for_lights(self, names, light_set=injected, settings=injected):
+        """
+        If discovery is still running in the background, wait until the
+        lights with the given names have been found. If names is None, wait
+        for discovery to finish.
+        """
+        if not getattr(light_set, 'is_discovering', False):
+            return
+        timeout = float(settings.get_value('discovery_wait_time', 10))
+        found = light_set.wait_for_lights(names, timeout, self._cancel_token)
+        if not found and not self._cancel_token.is_cancelled:
+            logging.warning('Lights not yet discovered: {}'.format(
+                'all' if names is None else ', '.join(sorted(names))))
+
+    @classmethod
+    def required_lights(cls, program):
+        """
+        Return a set containing the name of every light that program
+        operates on, or None if that can't be determined without knowing
+        every light.
+        """
+        names = set()
+        name = None
+        operand = None
+        for inst in program:
+            if inst.op_code == OpCode.MOVEQ:
+                if inst.param1 == Register.NAME:
+                    name = inst.param0
+                elif inst.param1 == Register.OPERAND:
+                    operand = inst.param0
+            elif inst.op_code in (OpCode.MOVE, OpCode.POP):
+                # The value isn't known until run time.
+                dest = inst.param1 if inst.op_code == OpCode.MOVE else (
+                    inst.param0)
+                if dest == Register.NAME:
+                    name = None
+                elif dest == Register.OPERAND:
+                    operand = None
+            elif inst.op_code in (
+                    OpCode.COLOR, OpCode.COLORQ, OpCode.GET_COLOR,
+                    OpCode.GRADIENT, OpCode.POWER):
+                # An optimized program doesn't repeat a MOVEQ to a register
+                # that already has that value, so the name and operand are
+                # checked where they're used.
+                if (operand not in (Operand.LIGHT, Operand.MZ_LIGHT)
+                        or not isinstance(name, str)):
+                    return None
+                names.add(name)
+        return names
+
+    @property
+    def cancel_token(self) -> CancelToken:
+        return self._cancel_token
+
     def request_stop(self):
-        self._machine.stop()
+        self._cancel_token.cancel()
+
+    def request_suspend(self) -> bool:
+        """
+        Suspend the script with its state intact. If the script is still
+        waiting for lights, or is running the beginning of a stream, it's
+        suspended once its program has been loaded. Returns False if the job
+        has been stopped.
+        """
+        return self._machine.suspend()
+
+    def is_suspended(self) -> bool:
+        return self._machine.is_suspended
+
+    def checkpoint(self):
+        """
+        The state of a suspended script, or None if it isn't suspended. After
+        being saved, the checkpoint can be given to from_checkpoint(),
+        possibly in another process.
+        """
+        return self._machine.checkpoint()
+
+    def resume(self):
+        if self.is_async:
+            asyncio.run(self.resume_async())
+        else:
+            self._wait_for_lights(self._resume_lights())
+            self._machine.resume()
+
+    async def resume_async(self):
+        if not self.is_async:
+            await super().resume_async()
+            return
+        await asyncio.get_event_loop().run_in_executor(
+            None, self._wait_for_lights, self._resume_lights())
+        await self._machine.resume()
+
+    def _resume_lights(self):
+        # A suspended stream has no program here, so wait for every light.
+        if self._program is None:
+            return None
+        return ScriptJob.required_lights(self._program)
@@ -25,7 +25,7 @@ class Snapshot:
     def end_light(self): pass
     def end_snapshot(self): pass
     def start_multizone(self, light): pass
-    def handle_zone(self, light, number, color): pass
+    def handle_zones(self, light): pass
     def end_multizone(self, light): pass
 
     def handle_color(self, color):
@@ -34,10 +34,6 @@ class Snapshot:
         self.record_setting(Register.BRIGHTNESS, color[2])
         self.record_setting(Register.KELVIN, color[3])
 
-    def handle_zones(self, light):
-        for number, color in enumerate(light.get_color_zones()):
-            self.handle_zone(light, number, color)
-
     @injection.inject(LightSet)
     def generate(self, light_set):
         self.start_snapshot()
@@ -73,15 +69,19 @@ class ScriptSnapshot(Snapshot):
         self._script += '{} {} '.format(reg, value)
 
     def handle_color(self, color):
-        params = zip([
-            Register.HUE, Register.SATURATION, Register.BRIGHTNESS,
-            Register.KELVIN
-            ], color)
-        for param in params:
-            reg, value = param
-            fmt = '{} {:.0f} ' if units.requires_conversion(reg) else '{} {} '
-            self._script += fmt.format(
-                reg.name.lower(), units.as_logical(reg, value))
+        self._add_logical_color(units.colors_as_logical([color])[0])
+
+    def handle_zones(self, light):
+        # All of the zones are converted at once.
+        zones = units.colors_as_logical(light.get_color_zones())
+        for number, color in enumerate(zones):
+            self._add_logical_color(color)
+            self._script += 'set "{}" zone {}\n'.format(light.name, number)
+
+    def _add_logical_color(self, color):
+        self._script += (
+            'hue {:.0f} saturation {:.0f} brightness {:.0f} kelvin {} '.format(
+                *color))
 
     def handle_power(self, power):
         self._power = power
@@ -95,10 +95,6 @@ class ScriptSnapshot(Snapshot):
         self._light_name = light.name
         self._power = light.get_power()
 
-    def handle_zone(self, light, number, color):
-        self.handle_color(color)
-        self._script += 'set "{}" zone {}\n'.format(light.name, number)
-
     @property
     def text(self):
         return '{}\n'.format(self._script)
@@ -182,22 +178,23 @@ class TextSnapshot(Snapshot):
         self._text += '{:>45}'.format(light.get_power())
         self._text += '\nZone #\n'
 
-    def handle_zone(self, _, number, color):
-        self._add_field('{:>5d}'.format(number))
-        self.handle_color(color)
-        self._text += '\n'
+    def handle_zones(self, light):
+        # All of the zones are converted at once.
+        zones = units.colors_as_logical(light.get_color_zones())
+        for number, color in enumerate(zones):
+            self._add_field('{:>5d}'.format(number))
+            self._add_logical_color(color)
+            self._text += '\n'
 
     def end_zones(self, _):
         self._text += '\n'
 
     def handle_color(self, color):
-        params = zip([
-            Register.HUE, Register.SATURATION, Register.BRIGHTNESS,
-            Register.KELVIN
-            ], color)
-        for param in params:
-            self._add_field(
-                '{:>4.0f}'.format(units.as_logical(param[0], param[1])))
+        self._add_logical_color(units.colors_as_logical([color])[0])
+
+    def _add_logical_color(self, color):
+        for value in color:
+            self._add_field('{:>4.0f}'.format(value))
 
     def handle_power(self, power):
         self._add_field('{:d}'.format(power))
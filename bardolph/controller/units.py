@@ -1,11 +1,20 @@
 from enum import Enum
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from bardolph.lib.auto_repl import auto
 from bardolph.vm.vm_codes import Register
 
 
 _RAW_RANGE = (0, 65535)
 
+# With fewer colors than this, an array conversion is done in Python even if
+# NumPy is available, because setting up the arrays would take longer.
+_NUMPY_THRESHOLD = 64
+
 
 class UnitMode(Enum):
     LOGICAL = auto()
@@ -72,6 +81,45 @@ def as_raw(reg, logical_value, use_float=False):
         value %= 65536.0
     return value if use_float else round(value)
 
+def raw_color(color, unit_mode) -> [int]:
+    """
+    Convert a color, as the VM keeps it in its registers while in unit_mode,
+    to the raw values that are sent to a light.
+    """
+    if unit_mode == UnitMode.RAW:
+        return color
+    return _color_as_raw(color)
+
+def logical_color(color, unit_mode) -> list:
+    """
+    Convert a raw color from a light to the values that the VM keeps in its
+    registers while in unit_mode.
+    """
+    if unit_mode == UnitMode.RAW:
+        return color
+    return _color_as_logical(color)
+
+def colors_as_raw(colors) -> list:
+    """
+    Convert logical colors to raw units, with the same results as as_raw()
+    applied to each component.
+
+    colors is a sequence of colors, each of which is a sequence containing
+    hue, saturation, brightness, and kelvin. It can also be a sequence of
+    those sequences, such as the zones of several lights, in which case they
+    are all converted at once. The result has the same shape, made of lists.
+    """
+    return _convert(colors, _colors_as_raw_python, _colors_as_raw_numpy)
+
+def colors_as_logical(colors) -> list:
+    """
+    Convert raw colors to logical units, with the same results as
+    as_logical() applied to each component. Works on the same kinds of
+    sequences as colors_as_raw().
+    """
+    return _convert(
+        colors, _colors_as_logical_python, _colors_as_logical_numpy)
+
 def as_logical(reg, raw_value):
     """If necessary, converts to floating-point logical value that
     typically apears in a script.
@@ -101,5 +149,76 @@ def as_logical(reg, raw_value):
         value = raw_value / 1000.0
     return value
 
+def _convert(colors, python_fn, numpy_fn) -> list:
+    if len(colors) > 0 and isinstance(colors[0][0], (list, tuple)):
+        # Convert the whole batch at once and then split it up again.
+        converted = _convert(
+            [color for inner in colors for color in inner],
+            python_fn, numpy_fn)
+        result = []
+        start = 0
+        for inner in colors:
+            result.append(converted[start:start + len(inner)])
+            start += len(inner)
+        return result
+    if (numpy is not None and len(colors) > 0
+            and len(colors) >= _NUMPY_THRESHOLD):
+        return numpy_fn(colors)
+    return python_fn(colors)
+
+# The arithmetic below is done in the same order as in as_raw() and
+# as_logical(), so that the results are identical.
+
+def _color_as_raw(color) -> [int]:
+    hue, saturation, brightness, kelvin = color
+    if hue in (0.0, 360.0):
+        hue = 0.0
+    else:
+        hue = (hue % 360.0) / 360.0 * 65535.0
+    saturation = (
+        65535.0 if saturation >= 100.0 else saturation / 100.0 * 65535.0)
+    brightness = (
+        65535.0 if brightness >= 100.0 else brightness / 100.0 * 65535.0)
+    return [round(hue), round(saturation), round(brightness), round(kelvin)]
+
+def _color_as_logical(color) -> list:
+    hue, saturation, brightness, kelvin = color
+    return [
+        float(hue) / 65535.0 * 360.0,
+        100.0 if saturation == 65535 else float(saturation) / 65535.0 * 100.0,
+        100.0 if brightness == 65535 else float(brightness) / 65535.0 * 100.0,
+        kelvin
+    ]
+
+def _colors_as_raw_python(colors) -> list:
+    return [_color_as_raw(color) for color in colors]
+
+def _colors_as_logical_python(colors) -> list:
+    return [_color_as_logical(color) for color in colors]
+
+def _colors_as_raw_numpy(colors) -> list:
+    array = numpy.array(colors, dtype=float)
+    hue = array[:, 0]
+    array[:, 0] = numpy.where(
+        (hue == 0.0) | (hue == 360.0), 0.0,
+        numpy.remainder(hue, 360.0) / 360.0 * 65535.0)
+    percent = array[:, 1:3]
+    array[:, 1:3] = numpy.where(
+        percent >= 100.0, 65535.0, percent / 100.0 * 65535.0)
+    # Like round(), rint() rounds halfway cases to even.
+    return numpy.rint(array).astype(int).tolist()
+
+def _colors_as_logical_numpy(colors) -> list:
+    array = numpy.asarray(colors, dtype=float)
+    result = array[:, 0:3] / 65535.0
+    result[:, 0] *= 360.0
+    result[:, 1:3] *= 100.0
+    result[:, 1:3][array[:, 1:3] == 65535.0] = 100.0
+    # Kelvin is passed through untouched, with its original type.
+    result = result.tolist()
+    for converted, color in zip(result, colors):
+        converted.append(color[3])
+    return result
+
 def _string_check(reg):
     return Register[reg.upper()] if isinstance(reg, str) else reg
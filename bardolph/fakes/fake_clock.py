@@ -1,6 +1,7 @@
-from bardolph.lib.i_lib import Clock
+from bardolph.lib.i_lib import AsyncClock, Clock
 from bardolph.lib import injection
 
 def configure():
-    """ Bind empty instance to itself; complete no-op. """
+    """ Bind empty instances to themselves; complete no-op. """
     injection.bind(Clock).to(Clock)
+    injection.bind(AsyncClock).to(AsyncClock)
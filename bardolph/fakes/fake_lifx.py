@@ -1,6 +1,7 @@
 from enum import Enum
 
 import logging
+import time
 
 from bardolph.lib.auto_repl import auto
 from bardolph.lib.injection import bind_instance
@@ -13,6 +14,7 @@ class Action(Enum):
     SET_COLOR = auto()
     SET_POWER = auto()
     SET_ZONE_COLOR = auto()
+    SET_ZONE_COLORS = auto()
 
 
 class ActivityMonitor:
@@ -49,9 +51,14 @@ class Light(ActivityMonitor):
     """
     Fake lifxlan.light.Light which implements the methods that are actually
     called by the tests.
+
+    If latency is non-zero, each query made while probing the light sleeps
+    for that many seconds, to simulate a slow network.
     """
-    def __init__(self, name, group, location, color=None, multizone=False):
+    def __init__(self, name, group, location, color=None, multizone=False,
+                 latency=0.0):
         super().__init__()
+        self._latency = latency
         self._name = name
         self._group = group
         self._location = location
@@ -90,7 +97,16 @@ class Light(ActivityMonitor):
         logging.info('Set color for "{}" zones {} - {}: {}, {}'.format(
             self._name, start_index, end_index, color, duration))
 
+    def extended_set_zone_color(
+            self, colors, index=0, duration=0, _=False, apply=1):
+        for zone, color in enumerate(colors, index):
+            self._color_zones[zone] = list(color)
+        self.log_call(Action.SET_ZONE_COLORS, (index, colors, duration))
+        logging.info('Set colors for "{}" zones {} - {}: {}, {}'.format(
+            self._name, index, index + len(colors), colors, duration))
+
     def supports_multizone(self):
+        self._delay()
         return self._multizone
 
     def set_power(self, power, duration, _=False):
@@ -110,14 +126,21 @@ class Light(ActivityMonitor):
         return self._color_zones[start_index : end_index]
 
     def get_label(self):
+        self._delay()
         return self._name
 
     def get_location(self):
+        self._delay()
         return self._location
 
     def get_group(self):
+        self._delay()
         return self._group
 
+    def _delay(self):
+        if self._latency > 0.0:
+            time.sleep(self._latency)
+
     def was_set(self, color):
         return self._set_color == color
 
@@ -132,7 +155,8 @@ class Lifx(i_controller.Lifx, ActivityMonitor):
     def init_from(self, inits):
         self._lights = [
             Light(init[0], init[1], init[2], init[3],
-                  None if len(init) < 5 else init[4])
+                  None if len(init) < 5 else init[4],
+                  0.0 if len(init) < 6 else init[5])
             for init in inits
         ]
 
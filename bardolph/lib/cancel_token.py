@@ -0,0 +1,48 @@
+import threading
+import time
+
+
+class CancelToken:
+    """
+    Tells everything that blocks on behalf of a job that the job has been
+    stopped. A token is cancelled once, from any thread, and stays cancelled.
+
+    A blocking operation either checks is_cancelled before it blocks, or
+    registers a callback that wakes it up. A callback added after the
+    token has been cancelled runs right away, so a cancellation that arrives
+    before the operation starts isn't missed.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._cancelled_at = None
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self._cancelled_at is not None
+
+    @property
+    def cancelled_at(self) -> float:
+        """ When cancel() was first called, from time.monotonic(), or None. """
+        return self._cancelled_at
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._cancelled_at is not None:
+                return
+            self._cancelled_at = time.monotonic()
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback) -> None:
+        with self._lock:
+            if self._cancelled_at is None:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
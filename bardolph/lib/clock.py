@@ -1,4 +1,7 @@
+import asyncio
 from datetime import datetime
+import heapq
+import itertools
 import threading
 import time
 
@@ -12,63 +15,305 @@ def now():
 
 def configure():
     injection.bind(Clock).to(i_lib.Clock)
+    injection.bind(AsyncClock).to(i_lib.AsyncClock)
+
+
+class TimerHeap:
+    """
+    Wakes up waiting threads at their deadlines. One instance, with a single
+    thread, is shared by every Clock, so the number of threads and wakeups
+    doesn't depend on how many scripts are running.
+
+    Deadlines come from time.monotonic(). The thread sleeps until the
+    earliest deadline in the heap, or until a new, earlier deadline gets
+    scheduled.
+
+    A wait that ends early, because its clock was stopped, cancels its
+    entry. A cancelled entry at the top of the heap is discarded without
+    waiting for its deadline, and once cancelled entries make up most of
+    the heap, they're all removed.
+    """
+    the_instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._heap = []
+        self._cond = threading.Condition()
+        self._sequence = itertools.count()
+        self._thread = None
+        self._wakeups = 0
+        self._cancelled = 0
+
+    @classmethod
+    def get_instance(cls):
+        with TimerHeap._instance_lock:
+            if TimerHeap.the_instance is None:
+                TimerHeap.the_instance = TimerHeap()
+            return TimerHeap.the_instance
+
+    @property
+    def wakeups(self) -> int:
+        """ Number of times the timer thread has woken up. """
+        return self._wakeups
+
+    @property
+    def size(self) -> int:
+        """ Number of entries in the heap, including cancelled ones. """
+        return len(self._heap)
+
+    def schedule(self, deadline, event):
+        """
+        Set event at the deadline, expressed as time.monotonic(). Returns the
+        entry, to be passed to cancel() if the event is no longer needed.
+        """
+        entry = [deadline, next(self._sequence), event]
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='timer_heap', daemon=True)
+                self._thread.start()
+            heapq.heappush(self._heap, entry)
+            if self._heap[0] is entry:
+                self._cond.notify()
+        return entry
+
+    def cancel(self, entry) -> None:
+        with self._cond:
+            if entry[2] is None:
+                return
+            entry[2] = None
+            self._cancelled += 1
+            if self._heap[0] is entry:
+                # The thread is waiting for this deadline.
+                self._cond.notify()
+            if self._cancelled > len(self._heap) // 2:
+                self._heap = [item for item in self._heap
+                              if item[2] is not None]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+
+    def _run(self):
+        with self._cond:
+            while True:
+                self._wakeups += 1
+                self._discard_cancelled()
+                if len(self._heap) == 0:
+                    self._cond.wait()
+                    continue
+                delay = self._heap[0][0] - time.monotonic()
+                if delay > 0.0:
+                    self._cond.wait(delay)
+                    continue
+                while len(self._heap) > 0 and (
+                        self._heap[0][0] <= time.monotonic()):
+                    event = heapq.heappop(self._heap)[2]
+                    if event is None:
+                        self._cancelled -= 1
+                    else:
+                        event.set()
+
+    def _discard_cancelled(self):
+        while len(self._heap) > 0 and self._heap[0][2] is None:
+            heapq.heappop(self._heap)
+            self._cancelled -= 1
 
 
 # All time quantities are in seconds.
 class Clock(i_lib.Clock):
+    """
+    Instead of polling, each wait computes its deadline and blocks until
+    the shared TimerHeap wakes it up, or until stop() is called.
+
+    Cue times accumulate relative to the most recent reset(), so small
+    delays in waking up don't add up over the course of a script.
+
+    suspend() stops the clock, as does stop(), but remembers the elapsed
+    time. After resume(), the clock continues from that time, so that the
+    time spent suspended doesn't count. A pause_for(0) then sleeps through
+    whatever remained of a wait that was cut short by the suspension.
+    """
     def __init__(self):
-        self._keep_going = False
-        self._event = threading.Event()
+        self._keep_going = True
         self._start_time = 0.0
         self._cue_time = 0.0
-        self._keep_going = True
+        self._suspended_at = 0.0
+        self._lock = threading.Lock()
+        self._event = None
 
     def start(self):
-        self.reset()
-        threading.Thread(target=self.run, args=(), daemon=True).start()
-
-    @injection.inject(i_lib.Settings)
-    def run(self, settings):
         self._keep_going = True
-        sleep_time = float(settings.get_value('sleep_time'))
-        while self._keep_going:
-            if sleep_time > 0.0:
-                time.sleep(sleep_time)
-            self.fire()
+        self.reset()
 
     def stop(self):
         self._keep_going = False
+        self.fire()
+
+    def suspend(self):
+        self._suspended_at = self.et()
+        self.stop()
+
+    def resume(self):
+        self._start_time = time.monotonic() - self._suspended_at
+        self._keep_going = True
+
+    def checkpoint(self):
+        """ Elapsed and cue times of a suspended clock. """
+        return (self._suspended_at, self._cue_time)
+
+    def restore(self, state):
+        """ Become suspended at the times given by checkpoint(). """
+        self._suspended_at, self._cue_time = state
 
     def reset(self):
         self._cue_time = 0.0
-        self._start_time = now()
+        self._start_time = time.monotonic()
 
     def et(self):
-        return time.time() - self._start_time
+        return time.monotonic() - self._start_time
 
     def fire(self):
-        self._event.set()
-        self._event.clear()
+        # Wake up the current wait, if any.
+        with self._lock:
+            if self._event is not None:
+                self._event.set()
 
-    def wait(self):
-        if self._keep_going:
-            self._event.wait()
+    @injection.inject(i_lib.Settings)
+    def wait(self, settings):
+        """
+        Wait for one tick, whose length is given by the sleep_time setting.
+        Returns False if the clock has been stopped.
+        """
+        sleep_time = float(settings.get_value('sleep_time', 0.01))
+        self._sleep_until(time.monotonic() + sleep_time)
         return self._keep_going
 
     def pause_for(self, delay):
         self._cue_time += delay
-        while self.et() < self._cue_time:
-            if not self.wait():
-                break
+        self._sleep_until(self._start_time + self._cue_time)
 
     def wait_until(self, time_pattern):
-        hour, minute = Clock._hour_minute()
-        while not time_pattern.match(hour, minute):
-            self.wait()
-            hour, minute = Clock._hour_minute()
+        """
+        Sleep until the start of the next minute that matches time_pattern,
+        or return immediately if the current minute matches. The time of day
+        is checked again on waking up, in case the system clock was changed.
+        """
+        while self._keep_going:
+            current = datetime.now()
+            target = time_pattern.next_match(current)
+            if target is None:
+                # Never matches; wait until stopped.
+                self._sleep_until(None)
+            elif target <= current:
+                break
+            else:
+                delay = (target - current).total_seconds()
+                self._sleep_until(time.monotonic() + delay)
         self.reset()
 
-    @classmethod
-    def _hour_minute(cls):
-        now = datetime.now()
-        return (now.hour, now.minute)
+    def _sleep_until(self, deadline):
+        # If deadline is None, sleep until stop() is called.
+        if not self._keep_going or (
+                deadline is not None and deadline <= time.monotonic()):
+            return
+        event = threading.Event()
+        with self._lock:
+            self._event = event
+        if self._keep_going:
+            if deadline is None:
+                event.wait()
+            else:
+                timer_heap = TimerHeap.get_instance()
+                entry = timer_heap.schedule(deadline, event)
+                event.wait()
+                if time.monotonic() < deadline:
+                    # Woken up early, by stop().
+                    timer_heap.cancel(entry)
+        with self._lock:
+            self._event = None
+
+
+class AsyncClock(i_lib.AsyncClock):
+    """
+    Counterpart of Clock for scripts that run as coroutines. A wait sleeps on
+    the event loop rather than blocking a thread, so any number of scripts can
+    wait at once on the loop's thread.
+
+    start() must be called from the event loop. stop() can be called from any
+    thread.
+    """
+    def __init__(self):
+        self._keep_going = True
+        self._start_time = 0.0
+        self._cue_time = 0.0
+        self._suspended_at = 0.0
+        self._loop = None
+        self._stopped = None
+
+    def start(self):
+        self._loop = asyncio.get_event_loop()
+        self._stopped = asyncio.Event()
+        self._keep_going = True
+        self.reset()
+
+    def stop(self):
+        self._keep_going = False
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+    def suspend(self):
+        # Same as Clock.suspend().
+        self._suspended_at = self.et()
+        self.stop()
+
+    def resume(self):
+        # Must be called from the event loop, which can differ from the one
+        # that was running before.
+        self._loop = asyncio.get_event_loop()
+        self._stopped = asyncio.Event()
+        self._start_time = time.monotonic() - self._suspended_at
+        self._keep_going = True
+
+    def checkpoint(self):
+        return (self._suspended_at, self._cue_time)
+
+    def restore(self, state):
+        self._suspended_at, self._cue_time = state
+
+    def reset(self):
+        self._cue_time = 0.0
+        self._start_time = time.monotonic()
+
+    def et(self):
+        return time.monotonic() - self._start_time
+
+    async def pause_for(self, delay):
+        self._cue_time += delay
+        await self._sleep_until(self._start_time + self._cue_time)
+
+    async def wait_until(self, time_pattern):
+        # Same as Clock.wait_until().
+        while self._keep_going:
+            current = datetime.now()
+            target = time_pattern.next_match(current)
+            if target is None:
+                await self._sleep_until(None)
+            elif target <= current:
+                break
+            else:
+                delay = (target - current).total_seconds()
+                await self._sleep_until(time.monotonic() + delay)
+        self.reset()
+
+    async def _sleep_until(self, deadline):
+        # If deadline is None, sleep until stop() is called.
+        if not self._keep_going:
+            return
+        timeout = None
+        if deadline is not None:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0.0:
+                return
+        try:
+            await asyncio.wait_for(self._stopped.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
@@ -16,4 +16,18 @@ def average_color(colors):
     return avg
 
 def rounded_color(color):
-    return [round(c) for c in color]
\ No newline at end of file
+    return [round(c) for c in color]
+
+def gradient(start, end, count):
+    """
+    Returns a list of count colors that change evenly from start to end, each
+    of which is a list of 4 numbers. The first color is start and, if count is
+    greater than 1, the last is end.
+    """
+    if count == 1:
+        return [list(start)]
+    steps = count - 1
+    return [
+        [first + (last - first) * i / steps for first, last in zip(start, end)]
+        for i in range(count)
+    ]
@@ -1,13 +1,31 @@
 class Clock:
     def start(self): pass
     def stop(self): pass
+    def suspend(self): pass
+    def resume(self): pass
+    def checkpoint(self): pass
+    def restore(self, _): pass
     def reset(self): pass
     def pause_for(self, _): pass
+    def wait_until(self, _): pass
     
+class AsyncClock:
+    def start(self): pass
+    def stop(self): pass
+    def suspend(self): pass
+    def resume(self): pass
+    def checkpoint(self): pass
+    def restore(self, _): pass
+    def reset(self): pass
+    async def pause_for(self, _): pass
+    async def wait_until(self, _): pass
+
 class Settings: pass
 
 class TimePattern:
+    __slots__ = ()
     def match(self, hour, minute): pass
+    def next_match(self, after): pass
     
 class LogConfig: pass
 
@@ -1,23 +1,186 @@
+import asyncio
 import collections
+from concurrent.futures import ThreadPoolExecutor
+from enum import IntEnum
 import logging
 import threading
+import time
+
+# Size of the worker pool if none is specified.
+_DEFAULT_WORKERS = 4
+
+
+class Priority(IntEnum):
+    """
+    Classes of jobs in the queue, from lowest to highest priority. A job
+    that someone is waiting on, such as one started from the web UI, is
+    INTERACTIVE. A job that runs on its own, such as a script given on the
+    command line, is SCHEDULED. A long-running effect is BACKGROUND.
+    """
+    BACKGROUND = 0
+    SCHEDULED = 1
+    INTERACTIVE = 2
 
 
 class Job:
     def execute(self): pass
+
+    async def execute_async(self):
+        """
+        Run the job as a coroutine. Unless overridden, execute() runs in the
+        event loop's executor, so that it doesn't block the loop.
+        """
+        await asyncio.get_event_loop().run_in_executor(None, self.execute)
+
     def request_stop(self): pass
 
+    def request_suspend(self) -> bool:
+        """
+        Ask the job to stop running in such a way that resume() can continue
+        it later. Returns False if the job can't be suspended.
+        """
+        return False
+
+    def is_suspended(self) -> bool:
+        return False
+
+    def resume(self): pass
+
+    async def resume_async(self):
+        await asyncio.get_event_loop().run_in_executor(None, self.resume)
+
+
+class EventLoopThread:
+    """ An asyncio event loop that runs forever on its own thread. """
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._run, name='job_loop', daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args):
+        """
+        Schedule the coroutine returned by fn(*args) on the loop. Returns a
+        concurrent.futures.Future, as does ThreadPoolExecutor.submit().
+        """
+        return asyncio.run_coroutine_threadsafe(fn(*args), self._loop)
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+
+class JobStats:
+    """
+    Counts of jobs handed to the worker pool and of jobs that have started
+    running on one of its threads. The difference is the number of jobs
+    waiting for a free thread. The wait time of a job runs from when it was
+    added to the JobControl, or re-queued after being suspended, until it
+    starts.
+
+    For a job that was asked to stop while it was running, the stop latency
+    runs from the request until the job has finished.
+
+    If there's a parent, everything counted here is also counted there.
+    """
+    def __init__(self, parent=None):
+        self._parent = parent
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._started = 0
+        self._preempted = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._stopped = 0
+        self._total_stop = 0.0
+        self._max_stop = 0.0
+
+    @property
+    def submitted(self) -> int:
+        return self._submitted
+
+    @property
+    def started(self) -> int:
+        return self._started
+
+    @property
+    def waiting(self) -> int:
+        return self._submitted - self._started
+
+    @property
+    def mean_wait(self) -> float:
+        with self._lock:
+            if self._started == 0:
+                return 0.0
+            return self._total_wait / self._started
+
+    @property
+    def max_wait(self) -> float:
+        return self._max_wait
+
+    @property
+    def preempted(self) -> int:
+        return self._preempted
+
+    @property
+    def stopped(self) -> int:
+        return self._stopped
+
+    @property
+    def mean_stop(self) -> float:
+        with self._lock:
+            if self._stopped == 0:
+                return 0.0
+            return self._total_stop / self._stopped
+
+    @property
+    def max_stop(self) -> float:
+        return self._max_stop
+
+    def count_submitted(self):
+        with self._lock:
+            self._submitted += 1
+        if self._parent is not None:
+            self._parent.count_submitted()
+
+    def count_started(self, wait):
+        with self._lock:
+            self._started += 1
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+        if self._parent is not None:
+            self._parent.count_started(wait)
+
+    def count_preempted(self):
+        with self._lock:
+            self._preempted += 1
+        if self._parent is not None:
+            self._parent.count_preempted()
+
+    def count_stopped(self, latency):
+        with self._lock:
+            self._stopped += 1
+            self._total_stop += latency
+            self._max_stop = max(self._max_stop, latency)
+        if self._parent is not None:
+            self._parent.count_stopped(latency)
+
 
 class Agent:
     """
-    The name serves as the unique identifier. When the job finishes, the
-    callback is invoked with self (this Agent) as the only parameter.
+    The name serves as the unique identifier. When the job finishes, or is
+    suspended, the callback is invoked with self (this Agent) as the only
+    parameter. If the job was suspended, executing the Agent again resumes
+    it.
     """
-    def __init__(self, job, callback, name=None):
+    def __init__(self, job, callback, name=None, priority=Priority.SCHEDULED):
         self._job = job
         self._callback = callback
-        self._thread = None
+        self._future = None
         self._name = name or 'job {}'.format(id(self))
+        self._priority = priority
+        self._created = time.monotonic()
+        self._stop_requested = None
 
     @property
     def name(self):
@@ -27,58 +190,169 @@ class Agent:
     def job(self):
         return self._job
 
+    @property
+    def priority(self) -> Priority:
+        return self._priority
+
+    def is_suspended(self):
+        # A job that was asked to stop isn't resumed, even if it was
+        # suspended first.
+        return self._stop_requested is None and self._job.is_suspended()
+
     def is_running(self):
-        return self._thread is not None and self._thread.is_alive()
+        return self._future is not None and not self._future.done()
 
-    def execute(self):
-        self._thread = threading.Thread(target=self._execute_and_call)
-        self._thread.start()
+    def execute(self, executor, stats):
+        """ Run the job on a thread from the executor. """
+        stats.count_submitted()
+        self._future = executor.submit(self._execute_and_call, stats)
+        return self
+
+    def execute_async(self, loop_thread, stats):
+        """ Run the job as a coroutine on the EventLoopThread. """
+        stats.count_submitted()
+        self._future = loop_thread.submit(
+            self._execute_and_call_async, stats)
         return self
 
     def request_stop(self):
+        if self._stop_requested is None:
+            self._stop_requested = time.monotonic()
         self._job.request_stop()
 
-    def _execute_and_call(self):
+    def request_suspend(self) -> bool:
+        if self._stop_requested is not None:
+            return False
+        return self._job.request_suspend()
+
+    def requeue(self):
+        """ Start the wait time over, for a job going back into the queue. """
+        self._created = time.monotonic()
+
+    def _execute_and_call(self, stats):
+        stats.count_started(time.monotonic() - self._created)
         try:
-            self._job.execute()
+            if self._job.is_suspended():
+                self._job.resume()
+            else:
+                self._job.execute()
         finally:
+            self._count_stopped(stats)
             self._callback(self)
 
+    async def _execute_and_call_async(self, stats):
+        stats.count_started(time.monotonic() - self._created)
+        try:
+            if self._job.is_suspended():
+                await self._job.resume_async()
+            else:
+                await self._job.execute_async()
+        finally:
+            self._count_stopped(stats)
+            self._callback(self)
+
+    def _count_stopped(self, stats):
+        if self._stop_requested is not None:
+            stats.count_stopped(time.monotonic() - self._stop_requested)
+
 
 class JobControl:
     """
-    Jobs are pulled out from the left (front of the queue). add_job() appends
-    one to the end (right side), while insert_job() inserts it in front (left
-    side).
+    The queue has a section for each Priority. The next job to run comes
+    from the front of the highest-priority section that isn't empty.
+    add_job() appends a job to the end of its section, while insert_job()
+    inserts it in front.
+
+    When a job is queued with a higher priority than the one that's running,
+    the running job is suspended, if it can be, and goes back to the front
+    of its own section. It resumes where it left off once no job of higher
+    priority is waiting. A job that has been asked to stop isn't suspended.
+    Stats are kept for each Priority as well as overall; a job started by
+    spawn_job() counts as BACKGROUND.
+
+    Every job runs on a thread from a pool of at most max_workers threads,
+    which are reused from one job to the next. At most max_background jobs
+    started by spawn_job() can run at once. When that many are already
+    running, spawn_job() waits up to spawn_timeout seconds for one of them to
+    finish and, failing that, doesn't start the job and returns None.
+
+    If use_async is True, jobs instead run as coroutines, by way of their
+    execute_async() methods, on a single event loop with its own thread. A
+    job then doesn't occupy a thread while it waits, so max_background can
+    be much larger. max_workers doesn't apply.
     """
-    def __init__(self):
+    def __init__(self, max_workers=None, max_background=None,
+                 spawn_timeout=0.0, use_async=False):
+        self._max_workers = max_workers or _DEFAULT_WORKERS
+        if max_background is None:
+            max_background = max(1, self._max_workers - 1)
+        self._max_background = max_background
+        self._spawn_timeout = spawn_timeout
+        self._executor = None
+        self._loop_thread = None
+        if use_async:
+            self._loop_thread = EventLoopThread()
+        else:
+            self._executor = ThreadPoolExecutor(
+                self._max_workers, thread_name_prefix='job')
+        self._stats = JobStats()
+        self._class_stats = {
+            priority: JobStats(self._stats) for priority in Priority}
         self._background = {}
         self._active_agent = None
-        self._queue = collections.deque()
+        self._queues = {priority: collections.deque() for priority in Priority}
         self._lock = threading.RLock()
+        self._background_done = threading.Condition(self._lock)
+
+    @property
+    def stats(self) -> JobStats:
+        return self._stats
+
+    def stats_for(self, priority) -> JobStats:
+        return self._class_stats[priority]
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Jobs that haven't started: those in the queue plus those waiting for
+        a thread from the pool.
+        """
+        return self._queued_count() + self._stats.waiting
 
     def clear_queue(self) -> None:
-        self._queue.clear()
+        for queue in self._queues.values():
+            queue.clear()
 
-    def add_job(self, job, name=None) -> Agent:
-        return self._enqueue_job(job, self._queue.append, name)
+    def add_job(self, job, name=None, priority=Priority.SCHEDULED) -> Agent:
+        return self._enqueue_job(job, name, priority, False)
 
-    def insert_job(self, job, name=None) -> Agent:
-        return self._enqueue_job(job, self._queue.appendleft, name)
+    def insert_job(self, job, name=None, priority=Priority.SCHEDULED) -> Agent:
+        return self._enqueue_job(job, name, priority, True)
 
     def spawn_job(self, job, name=None) -> Agent:
         agent = None
         if self._acquire_lock():
             try:
-                agent = Agent(job, self._on_background_done, name)
+                if not self._background_done.wait_for(
+                        self._has_background_slot, self._spawn_timeout):
+                    logging.warning(
+                        'Too many background jobs; not starting {}'.format(
+                            name or 'job'))
+                    return None
+                agent = Agent(
+                    job, self._on_background_done, name, Priority.BACKGROUND)
                 self._background[agent.name] = agent
-                agent.execute()
+                self._start(agent)
             finally:
                 self._release_lock()
         return agent
 
     def get_queued(self) -> [Agent]:
-        return list(self._queue) if self._queue is not None else None
+        """ Queued jobs in the order that they will run. """
+        result = []
+        for priority in sorted(Priority, reverse=True):
+            result.extend(self._queues[priority])
+        return result
 
     def get_background(self) -> [Agent]:
         if self._background is None:
@@ -109,6 +383,10 @@ class JobControl:
         return result
 
     def stop_job(self, name) -> bool:
+        """
+        Stop the job with the given name if it's running. A suspended job is
+        taken out of the queue, so that it doesn't resume.
+        """
         result = False
         if self._acquire_lock():
             try:
@@ -119,6 +397,8 @@ class JobControl:
                 elif name in self._background:
                     self._background[name].request_stop()
                     result = True
+                else:
+                    result = self._remove_suspended(name)
             finally:
                 self._release_lock()
         return result
@@ -134,33 +414,68 @@ class JobControl:
         return False
 
     def has_jobs(self) -> bool:
-        return (len(self._queue) > 0 or len(self._background) > 0 or
+        return (self._queued_count() > 0 or len(self._background) > 0 or
                 self._active_agent is not None)
 
+    def _queued_count(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _next_agent(self) -> Agent:
+        for priority in sorted(Priority, reverse=True):
+            if len(self._queues[priority]) > 0:
+                return self._queues[priority].popleft()
+        return None
+
     def _run_next_job(self) -> None:
         if self._acquire_lock():
             try:
-                if self._active_agent is None and len(self._queue) > 0:
-                    self._active_agent = self._queue.popleft()
-                    self._active_agent.execute()
+                if self._active_agent is None:
+                    self._active_agent = self._next_agent()
+                    if self._active_agent is not None:
+                        self._start(self._active_agent)
             finally:
                 self._release_lock()
 
-    def _enqueue_job(self, job, append_fn, name) -> Agent:
+    def _start(self, agent) -> None:
+        stats = self._class_stats[agent.priority]
+        if self._loop_thread is not None:
+            agent.execute_async(self._loop_thread, stats)
+        else:
+            agent.execute(self._executor, stats)
+
+    def _enqueue_job(self, job, name, priority, in_front) -> Agent:
         agent = None
         if self._acquire_lock():
             try:
-                agent = Agent(job, self._on_execution_done, name)
-                append_fn(agent)
+                agent = Agent(job, self._on_execution_done, name, priority)
+                if in_front:
+                    self._queues[priority].appendleft(agent)
+                else:
+                    self._queues[priority].append(agent)
                 if self._active_agent is None:
                     self._run_next_job()
+                elif self._active_agent.priority < priority:
+                    # The job comes back to the queue when it has stopped.
+                    self._active_agent.request_suspend()
             finally:
                 self._lock.release()
         return agent
 
-    def _on_execution_done(self, _):
+    def _remove_suspended(self, name) -> bool:
+        for queue in self._queues.values():
+            for agent in queue:
+                if agent.name == name and agent.is_suspended():
+                    queue.remove(agent)
+                    return True
+        return False
+
+    def _on_execution_done(self, agent):
         if self._acquire_lock():
             try:
+                if agent.is_suspended():
+                    agent.requeue()
+                    self._queues[agent.priority].appendleft(agent)
+                    self._class_stats[agent.priority].count_preempted()
                 self._active_agent = None
             finally:
                 self._release_lock()
@@ -170,9 +485,13 @@ class JobControl:
         if self._acquire_lock():
             try:
                 del self._background[agent.name]
+                self._background_done.notify()
             finally:
                 self._release_lock()
 
+    def _has_background_slot(self) -> bool:
+        return len(self._background) < self._max_background
+
     def _acquire_lock(self):
         if not self._lock.acquire(True, 1.0):
             logging.error("Unable to acquire lock.")
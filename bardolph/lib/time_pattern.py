@@ -1,23 +1,47 @@
+from datetime import timedelta
 import re
 
 from . import i_lib
 
 
 class TimePattern(i_lib.TimePattern):
-    HOURS_24 = set(range(0, 24))
-    MINUTES_60 = set(range(0, 60))
+    """
+    The set of matching times is kept as a bitmap of the 1440 minutes in a
+    day, stored in an int. Bit number (hour * 60 + minute) is set if that
+    minute matches. A union is the bitwise "or" of two bitmaps, so it
+    matches exactly the minutes that either of the patterns matches.
+    """
     REGEX = re.compile(r'^(\*|\*\d|\d\*|\d\d?):(\d\d|\d\*|\*\d|\*)$')
-    
+    __slots__ = ('_bits', '_text')
+
     def __init__(self, hours, minutes):
-        self._repr = 'TimePattern("{}", "{}")'.format(hours, minutes)
-        self._hour_set = set()
-        self._minute_set = set()
-        self._init_hour_set(hours) 
-        self._init_minute_set(minutes)
-    
+        self._text = (hours, minutes)
+        minute_mask = 0
+        for minute in TimePattern._minutes_for(minutes):
+            minute_mask |= 1 << minute
+        self._bits = 0
+        for hour in TimePattern._hours_for(hours):
+            self._bits |= minute_mask << (hour * 60)
+
     def __repr__(self):
-        return self._repr
-    
+        if self._text is not None:
+            return 'TimePattern("{}", "{}")'.format(*self._text)
+        return 'TimePattern.from_bits({:#x})'.format(self._bits)
+
+    def __eq__(self, other):
+        return isinstance(other, TimePattern) and self._bits == other._bits
+
+    @classmethod
+    def from_bits(cls, bits):
+        pattern = TimePattern.__new__(TimePattern)
+        pattern._text = None
+        pattern._bits = bits
+        return pattern
+
+    @property
+    def bits(self) -> int:
+        return self._bits
+
     @classmethod
     def from_string(cls, pattern):
         the_match = TimePattern.REGEX.match(pattern)
@@ -63,31 +87,53 @@ class TimePattern(i_lib.TimePattern):
         return int_minutes >= 0 and int_minutes < 60
     
     def union(self, other):
-        self._hour_set.update(other._hour_set)
-        self._minute_set.update(other._minute_set)
+        self._bits |= other._bits
+        self._text = None
+        return self
 
     def match(self, hours, minutes):
-        return hours in self._hour_set and minutes in self._minute_set    
+        return (0 <= hours < 24 and 0 <= minutes < 60
+                and (self._bits >> (hours * 60 + minutes)) & 1 == 1)
 
-    def _init_hour_set(self, pattern):
-        if pattern == '*':
-            self._hour_set=TimePattern.HOURS_24.copy()
-        elif len(pattern) == 1:
-            self._hour_set = set([int(pattern)])
+    def next_match(self, after):
+        """
+        Return the datetime of the first matching minute at or after the
+        datetime given by after, with seconds and microseconds set to zero.
+        If the minute containing after matches, the start of that minute is
+        returned. Returns None if the pattern never matches.
+        """
+        if self._bits == 0:
+            return None
+        start = after.replace(second=0, microsecond=0)
+        index = start.hour * 60 + start.minute
+        remaining = self._bits >> index
+        if remaining != 0:
+            index += TimePattern._lowest_bit(remaining)
+            start = start.replace(hour=0, minute=0)
         else:
-            self._hour_set = set()
-            for hour in range(0, 24):
-                if TimePattern._number_match(hour, pattern):
-                    self._hour_set.add(hour)
+            index = TimePattern._lowest_bit(self._bits)
+            start = start.replace(hour=0, minute=0) + timedelta(days=1)
+        return start.replace(hour=index // 60, minute=index % 60)
 
-    def _init_minute_set(self, pattern):
+    @classmethod
+    def _lowest_bit(cls, bits) -> int:
+        return (bits & -bits).bit_length() - 1
+
+    @classmethod
+    def _hours_for(cls, pattern):
         if pattern == '*':
-            self._minute_set = TimePattern.MINUTES_60.copy()
-        else:
-            self._minute_set = set()
-            for minute in range(0, 59):
-                if TimePattern._number_match(minute, pattern):
-                    self._minute_set.add(minute)
+            return range(0, 24)
+        if len(pattern) == 1:
+            return [int(pattern)]
+        return [hour for hour in range(0, 24)
+                if TimePattern._number_match(hour, pattern)]
+
+    @classmethod
+    def _minutes_for(cls, pattern):
+        if pattern == '*':
+            return range(0, 60)
+        return [minute for minute in range(0, 60)
+                if TimePattern._number_match(minute, pattern)]
 
     @classmethod
     def _number_match(cls, number, pattern):
@@ -95,4 +141,3 @@ class TimePattern(i_lib.TimePattern):
         return (formatted == pattern
             or (pattern[0] in ('*', formatted[0]) 
               and pattern[1] in ('*', formatted[1])))
-                    
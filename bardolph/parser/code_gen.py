@@ -2,6 +2,8 @@ from bardolph.controller.units import UnitMode
 from bardolph.vm.instruction import Instruction
 from bardolph.vm.vm_codes import JumpCondition, OpCode, Operator, Register
 
+from .optimizer import Optimizer
+
 class _JumpMarker:
     def __init__(self, inst, offset):
         self.jump = inst
@@ -11,6 +13,7 @@ class _JumpMarker:
 class CodeGen:
     def __init__(self):
         self._code = []
+        self._optimizer_stats = None
 
     @property
     def program(self):
@@ -22,6 +25,7 @@ class CodeGen:
 
     def clear(self):
         self._code.clear()
+        self._optimizer_stats = None
 
     def push(self, operand):
         self.add_instruction(CodeGen._push_op(operand), operand)
@@ -69,6 +73,14 @@ class CodeGen:
             (OpCode.POP, dest)
         ])
 
+    def dec_branch(self, counter, marker) -> None:
+        """
+        Decrement counter, and if the result is greater than zero, jump back
+        to the marker.
+        """
+        offset = marker.offset - self.current_offset
+        self.add_instruction(OpCode.DEC_BRANCH, counter, offset)
+
     def push_context(self, params):
         self.add_instruction(OpCode.JSR, params)
 
@@ -111,23 +123,14 @@ class CodeGen:
         marker.jump.param1 = self.current_offset - marker.offset + 1
 
     def optimize(self):
-        idem = (Register.NAME, Register.OPERAND, Register.TIME,
-                Register.DURATION, Register.FIRST_ZONE, Register.LAST_ZONE)
-        last_value = {}
-        for inst in self._code:
-            reg = inst.param1
-            if inst.op_code == OpCode.MOVE:
-                if reg in idem and reg in last_value:
-                    del last_value[reg]
-            elif inst.op_code == OpCode.MOVEQ and reg in idem:
-                value = inst.param0
-                if reg in last_value and value == last_value[reg]:
-                    inst.nop()
-                else:
-                    last_value[reg] = value
-            elif inst.op_code == OpCode.ROUTINE:
-                last_value.clear()
-        self._code = [inst for inst in self._code if inst.op_code != OpCode.NOP]
+        optimizer = Optimizer()
+        self._code = optimizer.optimize(self._code, True)
+        self._optimizer_stats = optimizer.stats
+
+    @property
+    def optimizer_stats(self):
+        """ What the most recent call to optimize() did, or None. """
+        return self._optimizer_stats
 
     @classmethod
     def _push_op(cls, oper):
@@ -21,8 +21,9 @@ class Visitor:
         ast.GtE: Operator.GTE
     }
 
-    def __init__(self, code_gen):
+    def __init__(self, code_gen, call_context=None):
         self._code_gen = code_gen
+        self._call_context = call_context
 
     def expression(self, node):
         """ BinOp, UnaryOp, Num, Constant, or Name """
@@ -55,12 +56,22 @@ class Visitor:
         self._code_gen.add_instruction(OpCode.PUSH, node.n)
 
     def _name(self, node):
+        """
+        A macro's value is known at compile time, so it becomes a literal in
+        the code. Macros take precedence over variables of the same name,
+        as they do in the VM.
+        """
         name = node.id
         reg = Register.from_string(name)
         if reg is not None:
             self._code_gen.add_instruction(OpCode.PUSH, reg)
-        else:
-            self._code_gen.add_instruction(OpCode.PUSH, node.id)
+            return
+        if self._call_context is not None:
+            value = self._call_context.get_macro(name)
+            if value is not None:
+                self._code_gen.add_instruction(OpCode.PUSHQ, value)
+                return
+        self._code_gen.add_instruction(OpCode.PUSH, node.id)
 
     def _num(self, node):
         self._code_gen.add_instruction(OpCode.PUSHQ, node.n)
@@ -84,14 +95,15 @@ class ExprParser:
         except SyntaxError:
             self._tree = None
 
-    def generate_code(self, code_gen) -> bool:
+    def generate_code(self, code_gen, call_context=None) -> bool:
         """
         Generate the VM code to evaluate the expression. When that code is
-        done, the result will be at the top of the stack.
+        done, the result will be at the top of the stack. If there's a
+        call_context, references to macros are replaced by their values.
         """
         if self._tree is None:
             return False
 
-        visitor = Visitor(code_gen)
+        visitor = Visitor(code_gen, call_context)
         visitor.expression(self._tree)
         return True
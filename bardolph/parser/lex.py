@@ -1,3 +1,4 @@
+import io
 import re
 
 from bardolph.lib.time_pattern import TimePattern
@@ -5,73 +6,103 @@ from .token_types import TokenTypes
 
 
 class Lex:
-    EXPR_REGEX = re.compile(r'^\{.*?\}$')
-    TOKEN_REGEX = re.compile(r'#.*$|".*?"|\{.*?\}|\S+')
-    NAME_REGEX = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*$')
-    NUMBER_REGEX = re.compile(r'^\-?[0-9]*\.?[0-9]+$')
+    """
+    Each token is found and classified with a single match of MASTER_REGEX,
+    whose named groups correspond to the kinds of token. A NAME is then
+    looked up in a dictionary to see whether it's really a keyword or a
+    register.
+
+    The input can be a string or a file object. Lines are read one at a
+    time, so a file doesn't have to be loaded into memory first.
+    """
     INT_REGEX = re.compile(r'^\-?[0-9]*$')
-    REG_REGEX = re.compile(
-        '^hue$|^saturation$|^brightness$|^duration$|^time$|^kelvin$')
 
-    def __init__(self, input_string):
-        self._lines = iter(input_string.split('\n'))
-        self._line_num = 0
-        self._tokens = None
-        self._next_line()
+    # A word-based token has to be followed by white space or the end of the
+    # line. Otherwise, it's UNKNOWN, extending to the next white space. So is
+    # a quote with no closing quote on the same line.
+    # Leading white space is skipped as part of the same match. If only white
+    # space remains, the match is empty, and the line is finished.
+    _END = r'(?=\s|$)'
+    MASTER_REGEX = re.compile(r'\s*(?:' + '|'.join((
+        r'(?P<comment>#.*$)',
+        r'"(?P<string>.*?)"',
+        r'\{(?P<expression>.*?)\}',
+        r'(?P<time>' + TimePattern.REGEX.pattern[1:-1] + ')' + _END,
+        r'(?P<number>\-?[0-9]*\.?[0-9]+)' + _END,
+        r'(?P<name>[a-zA-Z_][a-zA-Z0-9_]*)' + _END,
+        r'(?P<unknown>\S+)')) + ')?')
 
-    def _next_line(self):
-        current_line = next(self._lines, None)
-        if current_line is None:
-            self._tokens = None
-        else:
-            self._line_num += 1
-            self._tokens = self.TOKEN_REGEX.finditer(current_line)
+    _GROUP_TYPES = {
+        'string': TokenTypes.LITERAL_STRING,
+        'expression': TokenTypes.EXPRESSION,
+        'time': TokenTypes.TIME_PATTERN,
+        'number': TokenTypes.NUMBER,
+        'unknown': TokenTypes.UNKNOWN
+    }
 
-    @classmethod
-    def _unabbreviate(cls, token):
-        return {
-            'h': 'hue', 's': 'saturation', 'b': 'brightness', 'k': 'kelvin'
-        }.get(token, token)
+    # Keywords are case-insensitive and are looked up in lower case.
+    # Registers and their abbreviations are case-sensitive.
+    _KEYWORDS = {
+        name.lower(): token_type
+        for name, token_type in TokenTypes.__members__.items()
+    }
+    _REGISTERS = {
+        'hue': 'hue', 'saturation': 'saturation', 'brightness': 'brightness',
+        'duration': 'duration', 'time': 'time', 'kelvin': 'kelvin',
+        'h': 'hue', 's': 'saturation', 'b': 'brightness', 'k': 'kelvin'
+    }
+
+    def __init__(self, input_source):
+        if isinstance(input_source, str):
+            input_source = io.StringIO(input_source)
+        self._lines = iter(input_source)
+        self._line = ''
+        self._line_num = 0
+        self._pos = 0
+        self._column = 0
+        self._at_eof = False
 
     def get_line_number(self):
         return self._line_num
 
-    def _token_type(self, token):
-        token_type = TokenTypes.__members__.get(token.upper(), None)
-        if token_type is not None:
-            return token_type
+    def get_column(self):
+        """ Column of the start of the most recent token, starting at 1. """
+        return self._column + 1
 
-        pairs = (
-            (self.EXPR_REGEX, TokenTypes.EXPRESSION),
-            (self.REG_REGEX, TokenTypes.REGISTER),
-            (TimePattern.REGEX, TokenTypes.TIME_PATTERN),
-            (self.NUMBER_REGEX, TokenTypes.NUMBER),
-            (self.NAME_REGEX, TokenTypes.NAME)
-        )
-        for reg_expr, token_type in pairs:
-            if reg_expr.match(token):
-                return token_type
-
-        return TokenTypes.UNKNOWN
+    def _next_line(self) -> bool:
+        line = next(self._lines, None)
+        if line is None:
+            self._at_eof = True
+            return False
+        self._line = line.rstrip('\r\n')
+        self._line_num += 1
+        self._pos = 0
+        return True
 
     def next_token(self):
-        token_type = None
-        while token_type is None:
-            match = None if self._tokens is None else next(self._tokens, None)
-            while match is None:
-                self._next_line()
-                if self._tokens is None:
+        if self._at_eof:
+            return (TokenTypes.EOF, '')
+        master_match = Lex.MASTER_REGEX.match
+        while True:
+            match = master_match(self._line, self._pos)
+            group = match.lastgroup
+            if group is None:
+                if not self._next_line():
+                    self._column = 0
                     return (TokenTypes.EOF, '')
-                match = next(self._tokens, None)
-
-            token = Lex._unabbreviate(match.string[match.start():match.end()])
-            if token[0] != '#':
-                if token[0] == '"':
-                    token = token[1:-1]
-                    token_type = TokenTypes.LITERAL_STRING
-                else:
-                    token_type = self._token_type(token)
-                    if token_type == TokenTypes.EXPRESSION:
-                        token = token[1:-1]
-
-        return (token_type, token)
+                continue
+            self._pos = match.end()
+            if group == 'comment':
+                continue
+            self._column = match.start(group)
+            if group in ('string', 'expression'):
+                # Include the opening quote or brace.
+                self._column -= 1
+            token = match.group(group)
+            if group == 'name':
+                register = Lex._REGISTERS.get(token, None)
+                if register is not None:
+                    return (TokenTypes.REGISTER, register)
+                return (Lex._KEYWORDS.get(token.lower(), TokenTypes.NAME),
+                        token)
+            return (Lex._GROUP_TYPES[group], token)
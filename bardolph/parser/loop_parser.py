@@ -31,18 +31,23 @@ class LoopParser:
         if not self._pre_loop(code_gen, call_context):
             return False
         loop_top = code_gen.mark()
-        if not self._loop_test(code_gen):
+        if not self._loop_test(code_gen, call_context):
             return False
         if self._loop_type != LoopType.INFINITE:
             exit_loop_marker = code_gen.if_start()
-        if not (self._loop_body() and self._loop_post(code_gen)):
+        body_top = code_gen.mark()
+        if not (self._loop_body() and self._loop_post(code_gen, body_top)):
             return False
-        code_gen.jump_back(loop_top)
+        if not self._is_counted():
+            code_gen.jump_back(loop_top)
         if self._loop_type != LoopType.INFINITE:
             code_gen.if_end(exit_loop_marker)
         code_gen.add_instruction(OpCode.END_LOOP)
         return True
 
+    def _is_counted(self) -> bool:
+        return self._loop_type in (LoopType.COUNTED, LoopType.CYCLE)
+
     def _detect_loop_type(self, code_gen) -> bool:
         code_gen.add_instruction(OpCode.LOOP)
         self._loop_type = LoopType.INFINITE
@@ -96,6 +101,7 @@ class LoopParser:
         # increment = (last - first) / (count - 1)
         # If count == 1, skip to avoid division by 0.
         code_gen.add_instruction(OpCode.MOVE, LoopVar.FIRST, self._index_var)
+        code_gen.add_instruction(OpCode.MOVEQ, 0, LoopVar.INCR)
         code_gen.test_op(Operator.NOTEQ, LoopVar.COUNTER, 1)
         marker = code_gen.if_start()
         code_gen.subtraction(LoopVar.LAST, LoopVar.FIRST)
@@ -127,12 +133,12 @@ class LoopParser:
         code_gen.add_instruction(OpCode.POP, LoopVar.INCR)
         return True
 
-    def _loop_test(self, code_gen) -> bool:
+    def _loop_test(self, code_gen, call_context=None) -> bool:
         if self._loop_type == LoopType.INFINITE:
             return True
         if self._loop_type == LoopType.WHILE:
             exp = ExprParser(self._current_token)
-            if not exp.generate_code(code_gen):
+            if not exp.generate_code(code_gen, call_context):
                 return False
             self._next_token()
         else:
@@ -147,13 +153,17 @@ class LoopParser:
     def _loop_body(self) -> bool:
         return self._parser.command_seq()
 
-    def _loop_post(self, code_gen) -> bool:
-        if self._loop_type not in (LoopType.COUNTED, LoopType.CYCLE):
+    def _loop_post(self, code_gen, body_top) -> bool:
+        """
+        At the bottom of a counted loop, the counter is decremented and
+        tested by a single instruction, which goes back to the top of the
+        body, bypassing the test at the top of the loop.
+        """
+        if not self._is_counted():
             return True
-        code_gen.decrement(LoopVar.COUNTER)
         if self._index_var is not None:
-            code_gen.addition(self._index_var, LoopVar.INCR)
-            code_gen.add_instruction(OpCode.POP, self._index_var)
+            code_gen.add_instruction(OpCode.ADD_INCR, self._index_var)
+        code_gen.dec_branch(LoopVar.COUNTER, body_top)
         return True
 
     @property
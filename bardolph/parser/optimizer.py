@@ -0,0 +1,515 @@
+from bardolph.controller import units
+from bardolph.controller.units import UnitMode
+from bardolph.vm.instruction import Instruction
+from bardolph.vm.resolver import Resolver
+from bardolph.vm.vm_codes import JumpCondition, LoopVar, OpCode, Operator
+from bardolph.vm.vm_codes import Register
+from bardolph.vm.vm_math import VmMath
+
+
+class OptimizerStats:
+    """ What the optimizer did to one program. """
+    def __init__(self):
+        self.original = 0
+        self.optimized = 0
+        self.folded = 0
+        self.fused = 0
+        self.moves = 0
+        self.jumps = 0
+        self.dead = 0
+        self.elided = 0
+        self.constants = 0
+        self.colors = 0
+
+    @property
+    def removed(self) -> int:
+        return self.original - self.optimized
+
+    def __repr__(self):
+        return ('removed {} of {} instructions: folded {}, fused {}, '
+                'moves {}, jumps {}, dead {}, elided {}, constants {}; '
+                'colors converted {}').format(
+                    self.removed, self.original, self.folded, self.fused,
+                    self.moves, self.jumps, self.dead, self.elided,
+                    self.constants, self.colors)
+
+
+class Optimizer:
+    """
+    Rewrites the output of CodeGen with a series of passes that are repeated
+    until none of them finds anything to change:
+
+    * Constant folding: an operation on values that are all literals is done
+      at compile time.
+    * Fusion: PUSH, PUSH, OP, POP RESULT becomes a single TEST.
+    * PUSH followed by POP becomes MOVE or MOVEQ.
+    * A jump to an unconditional jump goes straight to the final target, and
+      a jump to the next instruction is removed.
+    * Code following an unconditional jump that isn't the target of any jump
+      can never be reached, and is removed.
+    * A MOVEQ to a register that already contains the same value from an
+      earlier MOVEQ is removed.
+    * A CONSTANT instruction is removed if no instruction refers to its name
+      at run time. The parser replaces references to macros with their
+      values, so that's normally all of them.
+    * A COLOR instruction becomes a COLORQ, which contains the color and
+      duration already converted to raw units, if the unit mode and the
+      values in the registers are known at that point.
+
+    A sequence of instructions is combined only if none of them except the
+    first is the target of a jump. While the optimizer runs, JUMP and
+    DEC_BRANCH instructions hold absolute addresses in param1. They are
+    converted back to relative offsets at the end.
+
+    Routine definitions are left where they are. None of the passes moves
+    code across a routine or end instruction.
+    """
+
+    # Registers for which a MOVEQ of the same value has no effect.
+    _IDEMPOTENT = frozenset((
+        Register.NAME, Register.OPERAND, Register.TIME, Register.DURATION,
+        Register.FIRST_ZONE, Register.LAST_ZONE))
+
+    # Instructions with an address in param1.
+    _BRANCHES = frozenset((OpCode.DEC_BRANCH, OpCode.JUMP))
+
+    _UNARY = frozenset((Operator.UADD, Operator.USUB, Operator.NOT))
+
+    _COLOR_REGS = (
+        Register.HUE, Register.SATURATION, Register.BRIGHTNESS,
+        Register.KELVIN)
+
+    # Registers whose contents are tracked by _fold_units(), with the values
+    # they have after a Machine has been reset.
+    _RESET_STATE = {
+        Register.HUE: 0,
+        Register.SATURATION: 0,
+        Register.BRIGHTNESS: 0,
+        Register.KELVIN: 0,
+        Register.DURATION: 0,
+        Register.UNIT_MODE: UnitMode.LOGICAL
+    }
+
+    _unary_table = {
+        Operator.UADD: lambda a: a,
+        Operator.USUB: lambda a: -a,
+        Operator.NOT: lambda a: not a
+    }
+
+    def __init__(self):
+        self._code = []
+        self._targets = set()
+        self._stats = OptimizerStats()
+        self._entry_state = {}
+
+    @property
+    def stats(self) -> OptimizerStats:
+        return self._stats
+
+    def optimize(self, program, from_reset=False) -> list:
+        """
+        If from_reset is True, the program is assumed to start on a Machine
+        that has just been reset, which is the case for a complete script.
+        Otherwise, nothing is assumed about the registers at the start.
+        """
+        self._entry_state = Optimizer._RESET_STATE if from_reset else {}
+        self._stats = OptimizerStats()
+        self._stats.original = len(program)
+        self._code = list(program)
+        self._to_absolute()
+        passes = (
+            self._fold_constants,
+            self._fuse_tests,
+            self._collapse_moves,
+            self._thread_jumps,
+            self._remove_dead_code,
+            self._elide_moveq,
+            self._drop_constants,
+            self._fold_units)
+        changed = True
+        while changed:
+            changed = False
+            for opt_pass in passes:
+                self._find_targets()
+                if opt_pass():
+                    self._compact()
+                    changed = True
+        self._to_relative()
+        self._stats.optimized = len(self._code)
+        return self._code
+
+    def _to_absolute(self):
+        for pc, inst in enumerate(self._code):
+            if inst.op_code in Optimizer._BRANCHES:
+                inst.param1 += pc
+
+    def _to_relative(self):
+        for pc, inst in enumerate(self._code):
+            if inst.op_code in Optimizer._BRANCHES:
+                inst.param1 -= pc
+
+    def _find_targets(self):
+        # Addresses where execution can arrive from somewhere other than the
+        # preceding instruction.
+        self._targets.clear()
+        for pc, inst in enumerate(self._code):
+            if inst.op_code in Optimizer._BRANCHES:
+                self._targets.add(inst.param1)
+            elif inst.op_code in (OpCode.JSR, OpCode.ROUTINE):
+                self._targets.add(pc + 1)
+
+    def _compact(self):
+        """
+        Remove the NOPs and adjust the jumps. A jump to a removed instruction
+        goes to the next one that remains.
+        """
+        new_address = []
+        code = []
+        for inst in self._code:
+            new_address.append(len(code))
+            if inst.op_code != OpCode.NOP:
+                code.append(inst)
+        new_address.append(len(code))
+        for inst in code:
+            if inst.op_code in Optimizer._BRANCHES:
+                inst.param1 = new_address[inst.param1]
+        self._code = code
+
+    def _is_straight(self, start, length) -> bool:
+        # True if the instructions starting at start + 1 can be reached only
+        # by way of the one before them.
+        if start + length > len(self._code):
+            return False
+        return all(pc not in self._targets
+                   for pc in range(start + 1, start + length))
+
+    @classmethod
+    def _is_literal(cls, inst) -> bool:
+        if inst.op_code == OpCode.PUSHQ:
+            return True
+        return (inst.op_code == OpCode.PUSH
+                and isinstance(inst.param0, (int, float)))
+
+    @classmethod
+    def _is_reference(cls, operand) -> bool:
+        return isinstance(operand, (Register, str, LoopVar))
+
+    @classmethod
+    def _is_op(cls, inst, unary) -> bool:
+        return (inst.op_code == OpCode.OP
+                and (inst.param0 in Optimizer._UNARY) == unary)
+
+    def _fold_constants(self) -> bool:
+        code = self._code
+        changed = False
+        for pc in range(len(code) - 1):
+            if not Optimizer._is_literal(code[pc]):
+                continue
+            if (self._is_straight(pc, 3)
+                    and Optimizer._is_literal(code[pc + 1])
+                    and Optimizer._is_op(code[pc + 2], False)):
+                fn = VmMath.fn_for(code[pc + 2].param0)
+                operands = (code[pc].param0, code[pc + 1].param0)
+                length = 3
+            elif (self._is_straight(pc, 2)
+                  and Optimizer._is_op(code[pc + 1], True)):
+                fn = Optimizer._unary_table[code[pc + 1].param0]
+                operands = (code[pc].param0,)
+                length = 2
+            else:
+                continue
+            if fn is not None and self._fold(pc, length, fn, operands):
+                changed = True
+        return changed
+
+    def _fold(self, pc, length, fn, operands) -> bool:
+        """
+        Replace the instructions starting at pc with a PUSHQ of the result.
+        If the operation can't be done, for example because of division by
+        zero, it's left for the VM to report at run time.
+        """
+        try:
+            value = fn(*operands)
+        except (ArithmeticError, TypeError):
+            return False
+        self._code[pc] = Instruction(OpCode.PUSHQ, value)
+        for offset in range(1, length):
+            self._code[pc + offset].nop()
+        self._stats.folded += length - 1
+        return True
+
+    def _fuse_tests(self) -> bool:
+        code = self._code
+        changed = False
+        for pc in range(len(code) - 3):
+            if not (self._is_straight(pc, 4)
+                    and code[pc + 3].op_code == OpCode.POP
+                    and code[pc + 3].param0 == Register.RESULT
+                    and Optimizer._is_op(code[pc + 2], False)):
+                continue
+            op0 = self._test_operand(code[pc])
+            op1 = self._test_operand(code[pc + 1])
+            if op0 is None or op1 is None:
+                continue
+            code[pc] = Instruction(OpCode.TEST, code[pc + 2].param0, op0, op1)
+            for offset in range(1, 4):
+                code[pc + offset].nop()
+            self._stats.fused += 3
+            changed = True
+        return changed
+
+    @classmethod
+    def _test_operand(cls, inst):
+        """
+        For an operand of the TEST instruction, a Register, string, or LoopVar
+        is a reference, and anything else is a literal. Returns None if the
+        instruction can't be expressed that way.
+        """
+        if inst.op_code == OpCode.PUSH:
+            if Optimizer._is_reference(inst.param0) or Optimizer._is_literal(
+                    inst):
+                return inst.param0
+        elif inst.op_code == OpCode.PUSHQ:
+            if not Optimizer._is_reference(inst.param0):
+                return inst.param0
+        return None
+
+    def _collapse_moves(self) -> bool:
+        code = self._code
+        changed = False
+        for pc in range(len(code) - 1):
+            push, pop = code[pc], code[pc + 1]
+            # A MOVEQ to UNIT_MODE would convert the color registers.
+            if (pop.op_code != OpCode.POP or not self._is_straight(pc, 2)
+                    or not Optimizer._is_reference(pop.param0)
+                    or pop.param0 == Register.UNIT_MODE):
+                continue
+            if Optimizer._is_literal(push):
+                code[pc] = Instruction(OpCode.MOVEQ, push.param0, pop.param0)
+            elif (push.op_code == OpCode.PUSH
+                  and Optimizer._is_reference(push.param0)):
+                code[pc] = Instruction(OpCode.MOVE, push.param0, pop.param0)
+            else:
+                continue
+            pop.nop()
+            self._stats.moves += 1
+            changed = True
+        return changed
+
+    def _thread_jumps(self) -> bool:
+        code = self._code
+        changed = False
+        for pc, inst in enumerate(code):
+            if inst.op_code != OpCode.JUMP:
+                continue
+            target = inst.param1
+            visited = {pc}
+            while (target < len(code) and target not in visited
+                   and code[target].op_code == OpCode.JUMP
+                   and code[target].param0 == JumpCondition.ALWAYS):
+                visited.add(target)
+                target = code[target].param1
+            if target != inst.param1:
+                inst.param1 = target
+                changed = True
+            if target == pc + 1:
+                inst.nop()
+                self._stats.jumps += 1
+                changed = True
+        return changed
+
+    def _remove_dead_code(self) -> bool:
+        code = self._code
+        changed = False
+        reachable = True
+        for pc, inst in enumerate(code):
+            if pc in self._targets or inst.op_code in (
+                    OpCode.ROUTINE, OpCode.END):
+                reachable = True
+            if not reachable:
+                inst.nop()
+                self._stats.dead += 1
+                changed = True
+            elif (inst.op_code == OpCode.JUMP
+                  and inst.param0 == JumpCondition.ALWAYS):
+                reachable = False
+        return changed
+
+    def _elide_moveq(self) -> bool:
+        """
+        Track the value of each idempotent register that was set by a MOVEQ.
+        Anything arriving from elsewhere, such as a jump or a return from a
+        routine, could have changed the registers, so the tracking starts
+        over at each target.
+        """
+        changed = False
+        last_value = {}
+        for pc, inst in enumerate(self._code):
+            if pc in self._targets:
+                last_value.clear()
+            op_code = inst.op_code
+            if (op_code == OpCode.MOVEQ
+                    and inst.param1 in Optimizer._IDEMPOTENT):
+                reg, value = inst.param1, inst.param0
+                if (reg in last_value
+                        and Optimizer._same(last_value[reg], value)):
+                    inst.nop()
+                    self._stats.elided += 1
+                    changed = True
+                else:
+                    last_value[reg] = value
+            elif op_code in (OpCode.MOVE, OpCode.POP):
+                dest = inst.param1 if op_code == OpCode.MOVE else inst.param0
+                last_value.pop(dest, None)
+            elif op_code == OpCode.TIME_PATTERN:
+                last_value.pop(Register.TIME, None)
+            elif op_code in (OpCode.END, OpCode.JSR, OpCode.ROUTINE):
+                last_value.clear()
+        return changed
+
+    @classmethod
+    def _same(cls, value0, value1) -> bool:
+        return type(value0) is type(value1) and value0 == value1
+
+    def _drop_constants(self) -> bool:
+        names = set()
+        for inst in self._code:
+            names.update(Resolver.variables_in(inst))
+            if inst.op_code == OpCode.PARAM:
+                names.add(inst.param0)
+        changed = False
+        for inst in self._code:
+            if inst.op_code == OpCode.CONSTANT and inst.param0 not in names:
+                inst.nop()
+                self._stats.constants += 1
+                changed = True
+        return changed
+
+    def _fold_units(self) -> bool:
+        """
+        Find the COLOR instructions where every color register, the duration,
+        and the unit mode have values known at compile time, and do the
+        conversion to raw units here instead of every time the instruction
+        is executed. The registers are still set as before, because
+        something else may read them.
+        """
+        changed = False
+        states = self._register_states()
+        for pc, inst in enumerate(self._code):
+            state = states[pc]
+            if inst.op_code != OpCode.COLOR or state is None:
+                continue
+            if not all(
+                    isinstance(state.get(reg, None), (int, float))
+                    and not isinstance(state[reg], bool)
+                    for reg in Optimizer._COLOR_REGS + (Register.DURATION,)):
+                continue
+            unit_mode = state.get(Register.UNIT_MODE, None)
+            if unit_mode is None:
+                continue
+            color = units.raw_color(
+                [state[reg] for reg in Optimizer._COLOR_REGS], unit_mode)
+            duration = state[Register.DURATION]
+            if unit_mode == UnitMode.LOGICAL:
+                duration = units.as_raw(Register.DURATION, duration)
+            self._code[pc] = Instruction(OpCode.COLORQ, list(color), duration)
+            self._stats.colors += 1
+            changed = True
+        return changed
+
+    def _register_states(self) -> list:
+        """
+        For each instruction, what is known about the registers in
+        _RESET_STATE just before it executes, as a dict containing the
+        registers with known values. None means the instruction can't be
+        reached.
+
+        The state at the start of the program is self._entry_state. This is a
+        forward data-flow analysis. Where paths join, only the values that are
+        the same on every path are kept. Nothing is known at the start of a
+        routine or after a call to one.
+        """
+        code = self._code
+        states = [None] * (len(code) + 1)
+        pending = []
+
+        def merge(pc, state):
+            old = states[pc]
+            if old is None:
+                states[pc] = dict(state)
+            else:
+                new = {reg: value for reg, value in old.items()
+                       if reg in state and Optimizer._same(state[reg], value)}
+                if len(new) == len(old):
+                    return
+                states[pc] = new
+            pending.append(pc)
+
+        merge(0, self._entry_state)
+        while pending:
+            pc = pending.pop()
+            if pc >= len(code):
+                continue
+            inst = code[pc]
+            state = Optimizer._transfer(inst, dict(states[pc]))
+            for successor, known in self._successors(pc, inst):
+                merge(successor, state if known else {})
+        return states
+
+    def _successors(self, pc, inst):
+        """
+        Addresses that can be executed after inst, each with a flag that is
+        False if nothing is known about the registers on arrival there.
+        """
+        op_code = inst.op_code
+        if op_code == OpCode.JUMP:
+            if inst.param0 == JumpCondition.ALWAYS:
+                return ((inst.param1, True),)
+            return ((inst.param1, True), (pc + 1, True))
+        if op_code == OpCode.DEC_BRANCH:
+            return ((inst.param1, True), (pc + 1, True))
+        if op_code in (OpCode.END, OpCode.STOP):
+            return ()
+        if op_code == OpCode.JSR:
+            return ((pc + 1, False),)
+        if op_code == OpCode.ROUTINE:
+            # The definition is skipped where it appears, and its body is
+            # reached only by a call.
+            end = pc + 1
+            while end < len(self._code) and self._code[end].op_code != (
+                    OpCode.END):
+                end += 1
+            return ((end + 1, True), (pc + 1, False))
+        return ((pc + 1, True),)
+
+    @classmethod
+    def _transfer(cls, inst, state) -> dict:
+        # Update state with the effect of inst on the registers.
+        op_code = inst.op_code
+        if op_code == OpCode.MOVEQ and inst.param1 in Optimizer._RESET_STATE:
+            reg, value = inst.param1, inst.param0
+            if reg == Register.UNIT_MODE:
+                Optimizer._change_mode(state, value)
+            state[reg] = value
+        elif op_code in (OpCode.MOVE, OpCode.POP):
+            state.pop(inst.param1 if op_code == OpCode.MOVE else inst.param0,
+                      None)
+        elif op_code == OpCode.GET_COLOR:
+            for reg in Optimizer._COLOR_REGS:
+                state.pop(reg, None)
+        return state
+
+    @classmethod
+    def _change_mode(cls, state, mode) -> None:
+        # Changing the unit mode converts the values in some of the color
+        # registers, as in Machine._moveq().
+        old_mode = state.get(Register.UNIT_MODE, None)
+        if old_mode == mode:
+            return
+        fn = units.as_logical if mode == UnitMode.LOGICAL else units.as_raw
+        for reg in (Register.HUE, Register.SATURATION, Register.BRIGHTNESS):
+            value = state.get(reg, None)
+            if old_mode is None or not isinstance(value, (int, float)):
+                state.pop(reg, None)
+            else:
+                state[reg] = fn(reg, value)
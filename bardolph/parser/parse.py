@@ -18,8 +18,15 @@ from .loop_parser import LoopParser
 from .expr_parser import ExprParser
 from .token_types import TokenTypes
 
+_COLOR_REGS = (
+    Register.HUE, Register.SATURATION, Register.BRIGHTNESS, Register.KELVIN)
+
 
 class Parser:
+    # Increment whenever the generated code changes, so that compiled programs
+    # saved by an earlier version are not reused.
+    VERSION = 7
+
     def __init__(self):
         self._lexer = None
         self._error_output = ''
@@ -27,6 +34,7 @@ class Parser:
         self._current_token_type = None
         self._current_token = None
         self._op_code = OpCode.NOP
+        self._operand_type = None
         self._code_gen = CodeGen()
         self._command_map = {
             TokenTypes.ASSIGN: self._assignment,
@@ -47,6 +55,7 @@ class Parser:
         self._token_trace = False
 
     def parse(self, input_string, optimize=False):
+        """ input_string can also be a file object. """
         self._call_context.clear()
         self._code_gen.clear()
         self._error_output = ''
@@ -60,13 +69,35 @@ class Parser:
             return self._code_gen.program
         return None
 
+    def parse_stream(self, input_source):
+        """
+        Generator that yields a list of instructions for each top-level
+        command as soon as it has been parsed, so that execution can begin
+        before the rest of the script has been read. input_source can be a
+        string or a file object.
+
+        If there's an error, nothing more is yielded, and the errors are
+        available from get_errors(). Code is not optimized.
+        """
+        self._call_context.clear()
+        self._code_gen.clear()
+        self._error_output = ''
+        self._lexer = lex.Lex(input_source)
+        self._next_token()
+        while self._current_token_type != TokenTypes.EOF:
+            if not self._command():
+                break
+            chunk = list(self._code_gen.program)
+            self._code_gen.clear()
+            if len(chunk) > 0:
+                yield chunk
+        self._lexer = None
+
     def load(self, file_name, optimize=False):
         logging.debug('File name: {}'.format(file_name))
         try:
-            srce = open(file_name, 'r')
-            input_string = srce.read()
-            srce.close()
-            return self.parse(input_string, optimize)
+            with open(file_name, 'r') as srce:
+                return self.parse(srce, optimize)
         except FileNotFoundError:
             logging.error('Error: file {} not found.'.format(file_name))
         except OSError:
@@ -75,6 +106,11 @@ class Parser:
     def get_errors(self) -> str:
         return self._error_output
 
+    @property
+    def optimizer_stats(self):
+        """ What the optimizer did in the most recent parse, or None. """
+        return self._code_gen.optimizer_stats
+
     @property
     def current_token(self) -> str:
         return self._current_token
@@ -151,15 +187,21 @@ class Parser:
     def _operand_list(self) -> bool:
         """ For every operand in the list, issue the instruction in
         self._op_code. """
-        if not self._operand():
+        if not self._operand_action():
             return False
-        self._add_instruction(self._op_code)
 
         while self._current_token_type == TokenTypes.AND:
             self._next_token()
-            if not self._operand():
+            if not self._operand_action():
                 return False
-            self._add_instruction(self._op_code)
+        return True
+
+    def _operand_action(self) -> bool:
+        if not self._operand():
+            return False
+        if self._current_token_type == TokenTypes.TO:
+            return self._gradient()
+        self._add_instruction(self._op_code)
         return True
 
     def _operand(self) -> bool:
@@ -191,9 +233,36 @@ class Parser:
                 return False
             operand = Operand.MZ_LIGHT
 
+        self._operand_type = operand
         self._add_instruction(OpCode.MOVEQ, operand, Register.OPERAND)
         return True
 
+    def _gradient(self) -> bool:
+        """
+        After a range of zones, "to" followed by settings for the color
+        registers blends the zones from the current color to the color that
+        results from those settings. The current color is saved on the stack
+        while the registers are set.
+        """
+        if self._operand_type != Operand.MZ_LIGHT:
+            return self._trigger_error('Gradient requires zones.')
+        self._next_token()
+        for reg in _COLOR_REGS:
+            self._add_instruction(OpCode.PUSH, reg)
+        if self._current_color_reg() is None:
+            return self.token_error('Expected color for gradient, got "{}"')
+        while self._current_color_reg() is not None:
+            reg = self._current_color_reg()
+            self._next_token()
+            if not self.rvalue(reg):
+                return False
+        self._add_instruction(OpCode.GRADIENT)
+        return True
+
+    def _current_color_reg(self):
+        reg = self._current_reg()
+        return reg if reg in _COLOR_REGS else None
+
     def _var_operand(self) -> bool:
         if not self._call_context.has_symbol_typed(
                 self._current_token, SymbolType.VAR):
@@ -274,22 +343,22 @@ class Parser:
         return self.rvalue(Register.TIME)
 
     def _process_time_patterns(self):
+        # Alternatives are combined here, into a single instruction.
         time_pattern = self._current_time_pattern()
         if time_pattern is None:
             return self._time_spec_error()
-        self._add_instruction(
-            OpCode.TIME_PATTERN, SetOp.INIT, time_pattern)
         self._next_token()
 
         while self._current_token_type == TokenTypes.OR:
             self._next_token()
-            time_pattern = self._current_time_pattern()
-            if time_pattern is None:
+            alternative = self._current_time_pattern()
+            if alternative is None:
                 return self._time_spec_error()
-            self._add_instruction(
-                OpCode.TIME_PATTERN, SetOp.UNION, time_pattern)
+            time_pattern.union(alternative)
             self._next_token()
 
+        self._add_instruction(
+            OpCode.TIME_PATTERN, SetOp.INIT, time_pattern)
         return True
 
     def _assignment(self) -> bool:
@@ -320,7 +389,7 @@ class Parser:
                 return self.token_error('Unknown: "{}"')
         elif self._current_token_type == TokenTypes.EXPRESSION:
             parser = ExprParser(self._current_token)
-            if not parser.generate_code(self._code_gen):
+            if not parser.generate_code(self._code_gen, self._call_context):
                 return self.token_error('Error parsing expression "{}"')
             self._add_instruction(OpCode.POP, Register.RESULT)
             value = Register.RESULT
@@ -469,7 +538,7 @@ class Parser:
         if self._current_token_type != TokenTypes.EXPRESSION:
             return self.token_error('Unable to use as condition: "{}"')
         parser = ExprParser(self._current_token)
-        if not parser.generate_code(self._code_gen):
+        if not parser.generate_code(self._code_gen, self._call_context):
             return self.token_error('Error parsing expression "{}"')
         self._add_instruction(OpCode.POP, Register.RESULT)
         marker = self._code_gen.if_start()
@@ -494,8 +563,8 @@ class Parser:
         self._error_output += '{}\n'.format(message)
 
     def _trigger_error(self, message):
-        full_message = 'Line {}: {}'.format(
-            self._lexer.get_line_number(), message)
+        full_message = 'Line {}, column {}: {}'.format(
+            self._lexer.get_line_number(), self._lexer.get_column(), message)
         self._add_message(full_message)
         return False
 
@@ -0,0 +1,161 @@
+import asyncio
+from functools import partial
+
+from bardolph.controller.units import UnitMode
+from bardolph.lib.i_lib import AsyncClock, TimePattern
+from bardolph.lib.injection import provide
+
+from .machine import Machine
+from .vm_codes import OpCode
+
+# Number of instructions executed before giving other coroutines a turn, so
+# that a script that loops without waiting doesn't hold up the others.
+_SLICE = 1000
+
+
+class AsyncMachine(Machine):
+    """
+    Executes a program as a coroutine, so that many scripts can run on one
+    asyncio event loop. Waits sleep on the loop by way of an AsyncClock. The
+    instructions that communicate with lights run in the loop's executor,
+    because the calls into lifxlan block; that executor serves as the
+    transport for all of the scripts on the loop.
+
+    run(), run_stream(), interpret(), and resume() are coroutines, and
+    otherwise behave the same as in Machine. stop() and suspend() can be
+    called from any thread. If the machine is stopped while a call to the
+    lights is in progress, it doesn't wait for that call to finish.
+    """
+
+    # Instructions whose handlers send commands to, or query, the lights.
+    _LIGHT_IO = (
+        OpCode.COLOR, OpCode.COLORQ, OpCode.GET_COLOR, OpCode.GRADIENT,
+        OpCode.POWER)
+
+    def __init__(self, cancel_token=None):
+        self._event_loop = None
+        self._stopped = None
+        super().__init__(cancel_token)
+        self._clock = provide(AsyncClock)
+        for op_code in AsyncMachine._LIGHT_IO:
+            fn, num_params = self._fn_table[op_code]
+            self._fn_table[op_code] = (
+                partial(self._transport, fn), num_params)
+        self._fn_table[OpCode.PAUSE] = (
+            partial(self._transport, self._pause), 0)
+        self._fn_table[OpCode.WAIT] = (self._wait_async, 0)
+
+    def stop(self) -> None:
+        super().stop()
+        loop = self._event_loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._set_stopped, self._stopped)
+
+    async def run(self, program) -> None:
+        self._load(program)
+        self._start()
+        await self._execute_program()
+        self._clock.stop()
+
+    async def resume(self) -> None:
+        if not self._suspended:
+            return
+        self._suspended = False
+        self._clock.resume()
+        self._start_loop()
+        self._in_program = True
+        await self._clock.pause_for(0)
+        await self._execute_program()
+        self._clock.stop()
+
+    async def interpret(self, input_stream) -> None:
+        self._start()
+        await self._interpret(input_stream)
+        self._clock.stop()
+
+    async def run_stream(self, chunks) -> None:
+        self._start()
+        chunks = iter(chunks)
+        for chunk in chunks:
+            if not self._keep_running:
+                break
+            if not Machine.is_straight_line(chunk):
+                program = list(chunk)
+                for remainder in chunks:
+                    program.extend(remainder)
+                if self._keep_running:
+                    self._load(program)
+                    await self._execute_program()
+                break
+            if not await self._interpret(chunk):
+                break
+        self._clock.stop()
+
+    def _start(self) -> None:
+        self._clock.start()
+        self._start_loop()
+
+    def _start_loop(self) -> None:
+        # Must be called from the event loop, which can differ from one run
+        # to the next.
+        self._event_loop = asyncio.get_event_loop()
+        self._stopped = self._event_loop.create_future()
+        self._keep_running = not self._cancel_token.is_cancelled
+
+    @classmethod
+    def _set_stopped(cls, stopped) -> None:
+        if stopped is not None and not stopped.done():
+            stopped.set_result(None)
+
+    async def _execute_program(self) -> None:
+        self._enter_program()
+        await self._execute()
+        self._leave_program()
+
+    async def _execute(self) -> None:
+        # A decoded instruction returns a coroutine if it needs to be awaited
+        # before execution continues.
+        code = self._code
+        pc = self._pc
+        budget = _SLICE
+        while self._keep_running:
+            next_pc = code[pc]()
+            if next_pc is not None and not isinstance(next_pc, int):
+                next_pc = await next_pc
+            pc = pc + 1 if next_pc is None else next_pc
+            budget -= 1
+            if budget == 0:
+                budget = _SLICE
+                await asyncio.sleep(0)
+        self._pc = pc
+
+    async def _interpret(self, instructions) -> bool:
+        for inst in instructions:
+            if not self._keep_running or inst.op_code == OpCode.STOP:
+                return False
+            if inst.op_code not in Machine._CONTROL_FLOW:
+                result = self._decode_inst(inst, 0)()
+                if result is not None:
+                    await result
+        return self._keep_running
+
+    async def _wait_async(self, pc) -> int:
+        time = self._reg.time
+        if isinstance(time, TimePattern):
+            await self._clock.wait_until(time)
+            if self._suspended:
+                return pc
+        elif time > 0:
+            if self._reg.unit_mode == UnitMode.RAW:
+                time /= 1000.0
+            await self._clock.pause_for(time)
+        return None
+
+    async def _transport(self, fn, *args) -> None:
+        # If the machine stops first, the call finishes on its own in the
+        # executor.
+        call = self._event_loop.run_in_executor(None, partial(fn, *args))
+        await asyncio.wait(
+            (call, self._stopped), return_when=asyncio.FIRST_COMPLETED)
+        if call.done():
+            call.result()
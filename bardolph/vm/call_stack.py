@@ -1,26 +1,73 @@
 from collections import deque
+import copy
 
 from .vm_codes import LoopVar
 
+
+class _Unset:
+    """ Copies and pickles as the one instance, _UNSET. """
+    def __reduce__(self):
+        return '_UNSET'
+
+
+# Content of a slot that has never been assigned. Distinct from None, which a
+# variable can contain.
+_UNSET = _Unset()
+
+# Index of each LoopVar within a LoopFrame.
+_LOOP_INDEX = {loop_var: index for index, loop_var in enumerate(LoopVar)}
+
+
 class StackFrame:
-    def __init__(self, variables=None, return_addr=None):
-        self.vars = variables if variables is not None else {}
+    """
+    The values of the variables are kept in a list. The layout maps the name
+    of each variable to its index in that list. Frames for the same routine
+    share one layout, which is built when the program is loaded. A frame
+    created without a layout gets its own, which grows as variables are added
+    to it by name.
+    """
+    def __init__(self, layout=None, return_addr=None):
+        self.layout = layout if layout is not None else {}
+        self.values = [_UNSET] * len(self.layout)
         self.return_addr = return_addr if return_addr is not None else 0
-
-    def clear(self):
-        self.vars.clear()
+        self.loop_vars = None
+
+    def get(self, name):
+        index = self.layout.get(name, None)
+        if index is None or index >= len(self.values):
+            return _UNSET
+        return self.values[index]
+
+    def put(self, name, value) -> None:
+        self.values[self.index_of(name)] = value
+
+    def index_of(self, name) -> int:
+        """ Return the index of the slot for name, adding it if necessary. """
+        index = self.layout.get(name, None)
+        if index is None:
+            index = len(self.layout)
+            self.layout[name] = index
+        if index >= len(self.values):
+            self.values.extend([_UNSET] * (index + 1 - len(self.values)))
+        return index
+
+    def clear(self) -> None:
+        self.values[:] = [_UNSET] * len(self.layout)
         self.return_addr = 0
 
 class LoopFrame(StackFrame):
-    def __init__(self, variables):
-        super().__init__(variables, None)
-        self._loop_var = {}
+    """ Shares the variables of the enclosing frame. """
+    def __init__(self, frame):
+        super().__init__()
+        self.layout = frame.layout
+        self.values = frame.values
+        self.loop_vars = [None] * len(_LOOP_INDEX)
 
-    def get_loop_var(self, index):
-        return self._loop_var.get(index, None)
+    def get_loop_var(self, loop_var):
+        return self.loop_vars[_LOOP_INDEX[loop_var]]
 
-    def set_loop_var(self, index, value):
-        self._loop_var[index] = value
+    def set_loop_var(self, loop_var, value):
+        self.loop_vars[_LOOP_INDEX[loop_var]] = value
 
 class CallStack:
     """
@@ -32,25 +79,29 @@ class CallStack:
     If the stack has only one StackFrame, then declared variables become
     globals. Otherwise, they are local variables that go out of scope when the
     routine returns.
+
+    Variables can be accessed either by name or by slot. The methods that
+    take a slot are used by code that was resolved by a Resolver when it was
+    loaded, and give the same results as their counterparts that take a name.
     """
 
     def __init__(self):
         """
-        Put an empty StackFrame into the stack as the root context. Create
-        a new StackFrame to accumulate parameters during set-up for a routine
-        invocation.
+        Put an empty StackFrame into the stack as the root context. A new
+        StackFrame to accumulate parameters for a routine invocation is
+        created when the first one arrives.
         """
         self._stack = deque()
         self._root_frame = StackFrame()
         self._stack.append(self._root_frame)
-        self._current = StackFrame()
+        self._current = None
         self._constants = {}
 
     def reset(self) -> None:
         self._stack.clear()
         self._root_frame.clear()
         self._stack.append(self._root_frame)
-        self._current.clear()
+        self._current = None
         self._constants.clear()
 
     @property
@@ -58,24 +109,29 @@ class CallStack:
         return self._stack[-1]
 
     def put_param(self, name, value) -> None:
-        self._current.vars[name] = value
+        self._incoming().put(name, value)
 
     def put_constant(self, name, value) -> None:
         if name not in self._constants:
             self._constants[name] = value
 
+    def is_constant(self, name) -> bool:
+        return name in self._constants
+
     def put_variable(self, index, value) -> None:
         if isinstance(index, LoopVar):
             assert isinstance(self.top, LoopFrame)
             return self.top.set_loop_var(index, value)
-        dest = self._root_frame if index in self._root_frame.vars else self.top
-        dest.vars[index] = value
+        if self._root_frame.get(index) is not _UNSET:
+            self._root_frame.put(index, value)
+        else:
+            self.top.put(index, value)
 
     def is_param(self, name) -> bool:
-        return name in self.top.vars
+        return self.top.get(name) is not _UNSET
 
     def set_return(self, address) -> None:
-        self._current.return_addr = address
+        self._incoming().return_addr = address
 
     def get_return(self) -> int:
         return self.top.return_addr
@@ -85,17 +141,20 @@ class CallStack:
             if isinstance(self.top, LoopFrame):
                 return self.top.get_loop_var(index)
             return None
-        for place in (self._constants, self.top.vars, self._root_frame.vars):
-            if index in place:
-                return place[index]
+        if index in self._constants:
+            return self._constants[index]
+        for frame in (self.top, self._root_frame):
+            value = frame.get(index)
+            if value is not _UNSET:
+                return value
         return None
 
     def push_current(self) -> None:
-        self._stack.append(self._current)
-        self._current = StackFrame()
+        self._stack.append(self._incoming())
+        self._current = None
 
     def enter_loop(self) -> None:
-        self._stack.append(LoopFrame(self.top.vars))
+        self._stack.append(LoopFrame(self.top))
 
     def exit_loop(self) -> None:
         assert len(self._stack) > 1
@@ -103,5 +162,75 @@ class CallStack:
 
     def pop_current(self) -> None:
         assert len(self._stack) > 1
-        self._current = self._stack.pop()
-        self._current.clear()
+        self._stack.pop()
+        self._current = None
+
+    def checkpoint(self):
+        """
+        Copy of the frames, including the one for an incoming call, and of
+        the constants. A LoopFrame in the copy shares its variables with the
+        copy of its enclosing frame.
+        """
+        return copy.deepcopy(
+            (list(self._stack), self._current, self._constants))
+
+    def restore(self, state) -> None:
+        """ Replace the content of the stack with a copy of a checkpoint. """
+        frames, current, constants = copy.deepcopy(state)
+        self._stack = deque(frames)
+        self._root_frame = frames[0]
+        self._current = current
+        self._constants = constants
+
+    def _incoming(self, layout=None) -> StackFrame:
+        if self._current is None:
+            self._current = StackFrame(layout)
+        return self._current
+
+    # Access by slot. A global is a slot in the root frame, and a local is a
+    # slot in the frame of the routine that is running. As with access by
+    # name, reading a local falls back to the global of the same name, and
+    # writing a local writes the global instead if the global has been
+    # assigned.
+
+    def global_index(self, name) -> int:
+        return self._root_frame.index_of(name)
+
+    @classmethod
+    def loop_index(cls, loop_var) -> int:
+        return _LOOP_INDEX[loop_var]
+
+    def get_global(self, index):
+        value = self._root_frame.values[index]
+        return None if value is _UNSET else value
+
+    def put_global(self, index, value) -> None:
+        self._root_frame.values[index] = value
+
+    def get_local(self, index, global_index):
+        value = self._stack[-1].values[index]
+        if value is _UNSET:
+            value = self._root_frame.values[global_index]
+        return None if value is _UNSET else value
+
+    def put_local(self, index, global_index, value) -> None:
+        root_values = self._root_frame.values
+        if root_values[global_index] is not _UNSET:
+            root_values[global_index] = value
+        else:
+            self._stack[-1].values[index] = value
+
+    def get_loop_var(self, index):
+        return self._stack[-1].loop_vars[index]
+
+    def put_loop_var(self, index, value) -> None:
+        self._stack[-1].loop_vars[index] = value
+
+    def put_param_slot(self, layout, index, value) -> None:
+        self._incoming(layout).values[index] = value
+
+    def push_frame(self, layout, return_addr) -> None:
+        frame = self._incoming(layout)
+        frame.return_addr = return_addr
+        self._stack.append(frame)
+        self._current = None
@@ -0,0 +1,41 @@
+import pickle
+
+
+class Checkpoint:
+    """
+    The state of a suspended Machine, with the program it was running. A
+    Machine that restores the checkpoint continues the program from where it
+    left off, with the same registers, variables, call stack, and pending
+    expression values, and with its clock at the same elapsed and cue times.
+
+    Everything in a checkpoint can be pickled, so that it can be saved to a
+    file and restored in another process. A checkpoint saved by a different
+    VERSION of the class is rejected when it's loaded.
+    """
+    VERSION = 1
+
+    def __init__(self, program, pc, registers, call_stack, eval_stack, clock):
+        self.version = Checkpoint.VERSION
+        self.program = program
+        self.pc = pc
+        self.registers = registers
+        self.call_stack = call_stack
+        self.eval_stack = eval_stack
+        self.clock = clock
+
+    def save(self, file_name) -> None:
+        with open(file_name, 'wb') as dest:
+            pickle.dump(self, dest)
+
+    @classmethod
+    def load(cls, file_name):
+        """
+        Return the checkpoint saved in the file, or None if the file doesn't
+        contain a checkpoint of the current version.
+        """
+        with open(file_name, 'rb') as srce:
+            checkpoint = pickle.load(srce)
+        if (not isinstance(checkpoint, Checkpoint)
+                or checkpoint.version != Checkpoint.VERSION):
+            return None
+        return checkpoint
@@ -7,6 +7,14 @@ class EvalStack:
     def clear(self):
         self._stack.clear()
 
+    def values(self) -> list:
+        """ Contents of the stack, from the bottom up. """
+        return list(self._stack)
+
+    def restore(self, values):
+        self._stack.clear()
+        self._stack.extend(values)
+
     @property
     def top(self):
         return self.below(0)
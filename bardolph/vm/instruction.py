@@ -2,15 +2,22 @@
 from .vm_codes import OpCode
 
 class Instruction:
-    def __init__(self, op_code, param0=None, param1=None):
+    def __init__(self, op_code, param0=None, param1=None, param2=None):
         self.op_code = op_code
         self.param0 = param0
         self.param1 = param1
+        self.param2 = param2
 
     def __repr__(self):
         if self.op_code == OpCode.TIME_PATTERN:
             return 'Instruction({}, {}, {})'.format(
                 OpCode.TIME_PATTERN, self.param0, repr(self.param1))
+        if self.param2 is not None:
+            return 'Instruction({}, {}, {}, {})'.format(
+                self.op_code,
+                Instruction.quote_if_string(self.param0),
+                Instruction.quote_if_string(self.param1),
+                Instruction.quote_if_string(self.param2))
         if self.param1 is None:
             if self.param0 is None:
                 return 'Instruction({})'.format(self.op_code)
@@ -27,7 +34,8 @@ class Instruction:
             raise TypeError
         return (self.op_code == other.op_code
                 and self.param0 == other.param0
-                and self.param1 == other.param1)
+                and self.param1 == other.param1
+                and self.param2 == other.param2)
 
     def nop(self):
         self.op_code = OpCode.NOP
@@ -35,6 +43,12 @@ class Instruction:
     def as_list_text(self) -> str:
         if self.param0 is None and self.param1 is None:
             return str(self.op_code)
+        if self.param2 is not None:
+            return '{}, {}, {}, {}'.format(
+                self.op_code,
+                Instruction.quote_if_string(self.param0),
+                Instruction.quote_if_string(self.param1),
+                Instruction.quote_if_string(self.param2))
         if self.param1 is None:
             return '{}, {}'.format(
                 self.op_code,
@@ -1,5 +1,10 @@
+import copy
+from functools import partial
 import logging
+import threading
 
+from bardolph.lib.cancel_token import CancelToken
+from bardolph.lib.color import gradient
 from bardolph.lib.i_lib import Clock, TimePattern
 from bardolph.lib.injection import inject, injected, provide
 from bardolph.lib.symbol import Symbol
@@ -10,11 +15,29 @@ from bardolph.controller.i_controller import LightSet
 from bardolph.controller.units import UnitMode
 
 from .call_stack import CallStack
+from .checkpoint import Checkpoint
 from .loader import Loader
-from .vm_codes import JumpCondition, OpCode, Operand, Register, SetOp
+from .resolver import Resolver
+from .vm_codes import JumpCondition, LoopVar, OpCode, Operand, Register
+from .vm_codes import SetOp
 from .vm_math import VmMath
 
 class Registers:
+    """
+    Each register is a slot. Access by Register goes through tables that map
+    each Register directly to the getter and setter of its slot, which avoids
+    building the attribute name on every access. The Machine looks up the
+    accessors once, when it decodes an instruction that operates on a
+    register.
+    """
+    __slots__ = (
+        'hue', 'saturation', 'brightness', 'kelvin', 'duration',
+        'first_zone', 'last_zone', 'power', 'result', 'name', 'operand',
+        'time', 'unit_mode')
+
+    _getters = {}
+    _setters = {}
+
     def __init__(self):
         self.hue = 0
         self.saturation = 0
@@ -33,55 +56,107 @@ class Registers:
     def get_color(self) -> [int]:
         return [self.hue, self.saturation, self.brightness, self.kelvin]
 
+    # The tables are keyed on the value of the Register rather than the enum
+    # itself, because hashing an enum member calls back into Python.
+
     def get_by_enum(self, reg):
-        return getattr(self, reg.name.lower())
+        return Registers._getters[reg._value_](self)
 
     def set_by_enum(self, reg, value):
-        setattr(self, reg.name.lower(), value)
+        Registers._setters[reg._value_](self, value)
 
     def reset(self):
         self.__init__()
 
+    def copy_from(self, other) -> None:
+        for slot in Registers.__slots__:
+            setattr(self, slot, getattr(other, slot))
+
     def get_power(self):
         return 65535 if self.power else 0
 
+    @classmethod
+    def getter(cls, reg):
+        """ Function that takes a Registers and returns the value of reg. """
+        return Registers._getters[reg._value_]
+
+    @classmethod
+    def setter(cls, reg):
+        """ Function that takes a Registers and a value to put into reg. """
+        return Registers._setters[reg._value_]
+
+    @classmethod
+    def _build_tables(cls):
+        for reg in Register:
+            slot = getattr(cls, reg.name.lower())
+            cls._getters[reg._value_] = slot.__get__
+            cls._setters[reg._value_] = slot.__set__
+
+
+Registers._build_tables()
+
 
 class Machine:
-    def __init__(self):
+    """
+    If a CancelToken is given, cancelling it stops the machine, as does
+    stop(). Once the token has been cancelled, the machine doesn't run
+    anything else, even if the cancellation arrives before it has started.
+    """
+    def __init__(self, cancel_token=None):
         self._pc = 0
         self._cue_time = 0
         self._clock = provide(Clock)
         self._variables = {}
+        self._source = []
         self._program = []
+        self._code = []
         self._reg = Registers()
         self._call_stack = CallStack()
         self._vm_math = VmMath(self._call_stack, self._reg)
         self._enable_pause = True
         self._keep_running = True
-        self._fn_table = {}
-        for opcode in (OpCode.COLOR,
-                       OpCode.CONSTANT,
-                       OpCode.END,
-                       OpCode.END_LOOP,
-                       OpCode.GET_COLOR,
-                       OpCode.JSR,
-                       OpCode.JUMP,
-                       OpCode.LOOP,
-                       OpCode.MOVE,
-                       OpCode.MOVEQ,
-                       OpCode.NOP,
-                       OpCode.OP,
-                       OpCode.PARAM,
-                       OpCode.PAUSE,
-                       OpCode.PUSH,
-                       OpCode.PUSHQ,
-                       OpCode.POP,
-                       OpCode.POWER,
-                       OpCode.TIME_PATTERN,
-                       OpCode.WAIT):
-            name = '_' + opcode.name.lower()
-            self._fn_table[opcode] = getattr(self, name)
-        self._fn_table[OpCode.STOP] = self.stop
+        self._in_program = False
+        self._suspended = False
+        self._suspend_pending = False
+        self._suspend_lock = threading.Lock()
+        self._cancel_token = cancel_token or CancelToken()
+        self._cancel_token.add_callback(self.stop)
+
+        # Maps an opcode to its handler and the number of operands it takes
+        # from the instruction. Control-flow opcodes are decoded separately.
+        vm_math = self._vm_math
+        self._fn_table = {
+            OpCode.ADD_INCR: (self._add_incr, 1),
+            OpCode.BREAKPOINT: (self._breakpoint, 0),
+            OpCode.COLOR: (self._color, 0),
+            OpCode.COLORQ: (self._colorq, 2),
+            OpCode.CONSTANT: (self._constant, 2),
+            OpCode.END: (self._end, 0),
+            OpCode.END_LOOP: (self._end_loop, 0),
+            OpCode.GET_COLOR: (self._get_color, 0),
+            OpCode.GRADIENT: (self._gradient, 0),
+            OpCode.LOOP: (self._loop, 0),
+            OpCode.MOVE: (self._move, 2),
+            OpCode.MOVEQ: (self._moveq, 2),
+            OpCode.NOP: (self._nop, 0),
+            OpCode.OP: (vm_math.op, 1),
+            OpCode.PARAM: (self._param, 2),
+            OpCode.PAUSE: (self._pause, 0),
+            OpCode.POP: (vm_math.pop, 1),
+            OpCode.POWER: (self._power, 0),
+            OpCode.PUSH: (vm_math.push, 1),
+            OpCode.PUSHQ: (vm_math.pushq, 1),
+            OpCode.ROUTINE: (self._nop, 0),
+            OpCode.STOP: (self._halt, 0),
+            OpCode.TEST: (vm_math.test, 3),
+            OpCode.TIME_PATTERN: (self._time_pattern, 2),
+            OpCode.WAIT: (self._wait, 0)
+        }
+        self._jump_table = {
+            JumpCondition.ALWAYS: self._jump_always,
+            JumpCondition.IF_FALSE: self._jump_if_false,
+            JumpCondition.IF_TRUE: self._jump_if_true
+        }
 
     def reset(self) -> None:
         self._reg.reset()
@@ -92,39 +167,328 @@ class Machine:
         self._vm_math.reset()
         self._keep_running = True
         self._enable_pause = True
+        self._in_program = False
+        self._suspended = False
+        self._suspend_pending = False
+
+    # Instructions that need the whole program to be loaded first.
+    _CONTROL_FLOW = frozenset((
+        OpCode.DEC_BRANCH, OpCode.END, OpCode.END_LOOP, OpCode.JSR,
+        OpCode.JUMP, OpCode.LOOP, OpCode.PARAM, OpCode.ROUTINE))
 
     def run(self, program) -> None:
-        loader = Loader()
-        loader.load(program, self._variables)
-        self._program = loader.code
-        self._keep_running = True
+        self._load(program)
+        self._start()
+        self._execute_program()
+        self._clock.stop()
 
-        self._clock.start()
-        while self._keep_running and self._pc < len(self._program):
-            inst = self._program[self._pc]
-            if inst.op_code == OpCode.STOP:
-                break
-            self._fn_table[inst.op_code]()
-            if inst.op_code not in (OpCode.END, OpCode.JSR, OpCode.JUMP):
-                self._pc += 1
+    def suspend(self) -> bool:
+        """
+        Stop the program that is running so that resume() can continue it
+        later, with its registers, variables, and stack intact.
+
+        If the machine isn't running a loaded program yet, as when it's
+        executing the beginning of a stream, the program is suspended as soon
+        as it starts, unless the machine is reset first. A stream that never
+        needs to be loaded as a program runs to the end. Returns False if the
+        machine has been cancelled.
+        """
+        with self._suspend_lock:
+            if self._cancel_token.is_cancelled:
+                return False
+            if self._in_program:
+                self._suspend_now()
+            else:
+                self._suspend_pending = True
+        return True
+
+    def resume(self) -> None:
+        """
+        Continue a suspended program, starting with the rest of any wait that
+        was interrupted. Returns when the program ends or is suspended again.
+        """
+        if not self._suspended:
+            return
+        self._suspended = False
+        self._clock.resume()
+        self._keep_running = not self._cancel_token.is_cancelled
+        self._in_program = True
+        self._clock.pause_for(0)
+        self._execute_program()
         self._clock.stop()
 
+    @property
+    def is_suspended(self) -> bool:
+        return self._suspended
+
+    def checkpoint(self) -> Checkpoint:
+        """
+        Capture the state of a suspended machine. Returns None if the machine
+        isn't suspended.
+        """
+        if not self._suspended:
+            return None
+        return Checkpoint(
+            self._source, self._pc, copy.copy(self._reg),
+            self._call_stack.checkpoint(), self._vm_math.checkpoint(),
+            self._clock.checkpoint())
+
+    def restore(self, checkpoint) -> None:
+        """
+        Load the program from the checkpoint and put the machine into the
+        state that it captured. The machine is then suspended, and resume()
+        continues the program.
+        """
+        self.reset()
+        # The frames go in first, so that the variables of the program are
+        # resolved to their slots in those frames.
+        self._call_stack.restore(checkpoint.call_stack)
+        self._load(checkpoint.program)
+        self._pc = checkpoint.pc
+        self._reg.copy_from(checkpoint.registers)
+        self._vm_math.restore(checkpoint.eval_stack)
+        self._clock.restore(checkpoint.clock)
+        self._suspended = True
+
     def interpret(self, input_stream) -> None:
-        fn_table = self._fn_table.copy()
-        for op_code in (OpCode.END,
-                        OpCode.END_LOOP,
-                        OpCode.JSR,
-                        OpCode.JUMP,
-                        OpCode.LOOP,
-                        OpCode.PARAM):
-            fn_table[op_code] = self._nop
-        self._clock.start()
-        for inst in input_stream:
-            if inst.op_code == OpCode.STOP:
+        """
+        Execute instructions as they arrive, without loading them first.
+        Control-flow instructions are ignored.
+        """
+        self._start()
+        self._interpret(input_stream)
+        self._clock.stop()
+
+    def run_stream(self, chunks) -> None:
+        """
+        Execute a program that arrives as a series of lists of instructions,
+        such as those generated by Parser.parse_stream(). Each list is
+        executed as soon as it arrives, as long as it contains no control
+        flow. When a list does contain control flow, the rest of the stream
+        is collected and run as a single program.
+        """
+        self._start()
+        chunks = iter(chunks)
+        for chunk in chunks:
+            if not self._keep_running:
+                break
+            if not Machine.is_straight_line(chunk):
+                program = list(chunk)
+                for remainder in chunks:
+                    program.extend(remainder)
+                if self._keep_running:
+                    self._load(program)
+                    self._execute_program()
+                break
+            if not self._interpret(chunk):
                 break
-            self._fn_table[inst.op_code]()
         self._clock.stop()
 
+    @classmethod
+    def is_straight_line(cls, instructions) -> bool:
+        return all(inst.op_code not in Machine._CONTROL_FLOW
+                   for inst in instructions)
+
+    @property
+    def cancel_token(self) -> CancelToken:
+        return self._cancel_token
+
+    def _start(self) -> None:
+        self._clock.start()
+        # If the token is cancelled before this point, the machine doesn't
+        # run at all, and after it, the cancellation calls stop().
+        self._keep_running = not self._cancel_token.is_cancelled
+
+    def _load(self, program) -> None:
+        self._source = program
+        loader = Loader()
+        loader.load(program, self._variables)
+        self._program = loader.code
+        self._code = self._decode(self._program, self._resolve(self._program))
+        self._pc = 0
+
+    def _resolve(self, program) -> Resolver:
+        resolver = Resolver(self._call_stack)
+        resolver.resolve(program)
+        return resolver
+
+    def _execute_program(self) -> None:
+        self._enter_program()
+        self._execute()
+        self._leave_program()
+
+    def _enter_program(self) -> None:
+        with self._suspend_lock:
+            self._in_program = True
+            if self._suspend_pending:
+                self._suspend_pending = False
+                self._suspend_now()
+
+    def _leave_program(self) -> None:
+        with self._suspend_lock:
+            self._in_program = False
+
+    def _suspend_now(self) -> None:
+        self._suspended = True
+        self._keep_running = False
+        self._clock.suspend()
+
+    def _execute(self) -> None:
+        code = self._code
+        pc = self._pc
+        while self._keep_running:
+            next_pc = code[pc]()
+            pc = pc + 1 if next_pc is None else next_pc
+        self._pc = pc
+
+    def _interpret(self, instructions) -> bool:
+        # Returns False if execution should stop.
+        for inst in instructions:
+            if not self._keep_running or inst.op_code == OpCode.STOP:
+                return False
+            if inst.op_code not in Machine._CONTROL_FLOW:
+                self._decode_inst(inst, 0)()
+        return self._keep_running
+
+    def _decode(self, program, resolver=None) -> list:
+        """
+        Convert the loaded program into a list of callables, one for each
+        instruction, with the operands already bound. A callable returns None
+        to continue with the next instruction, or the index of the instruction
+        to be executed next. A halt is appended so that running off the end of
+        the program stops the machine.
+
+        If there's a resolver, the slots of the variables are bound as well.
+        """
+        code = [self._decode_inst(inst, pc, resolver)
+                for pc, inst in enumerate(program)]
+        code.append(self._halt)
+        return code
+
+    def _decode_inst(self, inst, pc, resolver=None):
+        op_code = inst.op_code
+        if op_code == OpCode.JUMP:
+            # Relative offset becomes an absolute address.
+            return partial(self._jump_table[inst.param0], pc + inst.param1)
+        if op_code == OpCode.WAIT:
+            # The handler gets the address of the instruction, which it
+            # returns to wait again if it was suspended while waiting.
+            return partial(self._fn_table[op_code][0], pc)
+        if op_code == OpCode.DEC_BRANCH:
+            address = pc + inst.param1
+            if resolver is None:
+                return partial(self._dec_branch, inst.param0, address)
+            return partial(
+                self._dec_branch_var, resolver.reader(pc, inst.param0),
+                resolver.writer(pc, inst.param0), address)
+        if op_code == OpCode.JSR:
+            rtn = self._variables.get(inst.param0, None)
+            if rtn is None:
+                # Reported only if the call is actually made.
+                return partial(self._undefined_routine, inst.param0)
+            if resolver is None:
+                return partial(self._jsr, pc + 1, rtn.get_address())
+            return partial(
+                self._jsr_frame, pc + 1, rtn.get_address(),
+                resolver.layout(inst.param0))
+        fn = self._decode_register_op(inst)
+        if fn is None and resolver is not None:
+            fn = self._decode_variable_op(inst, pc, resolver)
+        if fn is not None:
+            return fn
+        fn, num_params = self._fn_table[op_code]
+        if num_params == 0:
+            return fn
+        if num_params == 1:
+            return partial(fn, inst.param0)
+        if num_params == 2:
+            return partial(fn, inst.param0, inst.param1)
+        return partial(fn, inst.param0, inst.param1, inst.param2)
+
+    def _decode_register_op(self, inst):
+        """
+        For an instruction that only moves data to or from registers, return
+        a callable that has the registers' accessors bound to it, or None if
+        the instruction needs the general-purpose handler.
+        """
+        op_code = inst.op_code
+        param0, param1 = inst.param0, inst.param1
+        if op_code == OpCode.PUSH and isinstance(param0, Register):
+            return partial(self._vm_math.push_reg, Registers.getter(param0))
+        if op_code == OpCode.POP and isinstance(param0, Register):
+            return partial(self._vm_math.pop_reg, Registers.setter(param0))
+        if not isinstance(param1, Register) or param1 == Register.UNIT_MODE:
+            return None
+        if op_code == OpCode.MOVEQ:
+            return partial(Registers.setter(param1), self._reg, param0)
+        if op_code == OpCode.MOVE and isinstance(param0, Register):
+            return partial(
+                self._move_reg,
+                Registers.getter(param0), Registers.setter(param1))
+        return None
+
+    def _decode_variable_op(self, inst, pc, resolver):
+        """
+        For an instruction that refers to variables, return a callable that
+        has the variables' slots bound to it, or None if the instruction needs
+        the general-purpose handler.
+        """
+        op_code = inst.op_code
+        param0, param1 = inst.param0, inst.param1
+        is_variable = resolver.is_variable
+        if op_code == OpCode.PUSH and is_variable(param0):
+            return partial(self._vm_math.push_var, resolver.reader(pc, param0))
+        if op_code == OpCode.POP and is_variable(param0):
+            return partial(self._vm_math.pop_var, resolver.writer(pc, param0))
+        if op_code == OpCode.MOVEQ and is_variable(param1):
+            return partial(resolver.writer(pc, param1), param0)
+        if op_code == OpCode.MOVE and param1 != Register.UNIT_MODE:
+            if is_variable(param0):
+                return partial(
+                    self._move_var, resolver.reader(pc, param0),
+                    self._writer(pc, param1, resolver), param0)
+            if is_variable(param1):
+                return partial(
+                    self._move_value, self._reader(pc, param0, resolver),
+                    resolver.writer(pc, param1))
+        if op_code == OpCode.TEST:
+            return partial(
+                self._vm_math.test_values, VmMath.fn_for(param0),
+                self._reader(pc, param1, resolver),
+                self._reader(pc, inst.param2, resolver))
+        if op_code == OpCode.ADD_INCR:
+            return partial(
+                self._add_incr_var, resolver.reader(pc, param0),
+                resolver.writer(pc, param0),
+                resolver.reader(pc, LoopVar.INCR))
+        if op_code == OpCode.PARAM:
+            slot = resolver.param_slot(pc, param0)
+            if slot is not None:
+                layout, index = slot
+                value = param1.name if isinstance(param1, Symbol) else param1
+                return partial(
+                    self._param_var, layout, index,
+                    self._reader(pc, value, resolver))
+        return None
+
+    def _reader(self, pc, operand, resolver):
+        # A function with no parameters that returns the value of an operand.
+        if isinstance(operand, Register):
+            return partial(Registers.getter(operand), self._reg)
+        if resolver.is_variable(operand):
+            return resolver.reader(pc, operand)
+        return partial(Machine._literal, operand)
+
+    def _writer(self, pc, operand, resolver):
+        # A function that takes a value and puts it into an operand.
+        if isinstance(operand, Register):
+            return partial(Registers.setter(operand), self._reg)
+        return resolver.writer(pc, operand)
+
+    @classmethod
+    def _literal(cls, value):
+        return value
+
     def stop(self) -> None:
         self._keep_running = False
         self._clock.stop()
@@ -143,32 +507,38 @@ class Machine:
     def current_inst(self):
         return self._program[self._pc]
 
-    def _color(self) -> None: {
-        Operand.ALL: self._color_all,
-        Operand.LIGHT: self._color_light,
-        Operand.GROUP: self._color_group,
-        Operand.LOCATION: self._color_location,
-        Operand.MZ_LIGHT: self._color_mz_light
-    }[self._reg.operand]()
+    def _color(self) -> None:
+        self._colorq(
+            self._assure_raw_color(self._reg.get_color()),
+            self._assure_raw(Register.DURATION, self._reg.duration))
+
+    def _colorq(self, color, duration) -> None:
+        """
+        Send a color that has already been converted to raw units, along with
+        the duration, to whatever the operand register designates.
+        """
+        {
+            Operand.ALL: self._color_all,
+            Operand.LIGHT: self._color_light,
+            Operand.GROUP: self._color_group,
+            Operand.LOCATION: self._color_location,
+            Operand.MZ_LIGHT: self._color_mz_light
+        }[self._reg.operand](color, duration)
 
     @inject(LightSet)
-    def _color_all(self, light_set=injected) -> None:
-        color = self._assure_raw_color(self._reg.get_color())
-        duration = self._assure_raw(Register.DURATION, self._reg.duration)
+    def _color_all(self, color, duration, light_set=injected) -> None:
         light_set.set_color(color, duration)
 
     @inject(LightSet)
-    def _color_light(self, light_set=injected) -> None:
+    def _color_light(self, color, duration, light_set=injected) -> None:
         light = light_set.get_light(self._reg.name)
         if light is None:
             Machine._report_missing(self._reg.name)
         else:
-            light.set_color(
-                self._assure_raw_color(self._reg.get_color()),
-                self._assure_raw(Register.DURATION, self._reg.duration))
+            light.set_color(color, duration)
 
     @inject(LightSet)
-    def _color_mz_light(self, light_set=injected) -> None:
+    def _color_mz_light(self, color, duration, light_set=injected) -> None:
         light = light_set.get_light(self._reg.name)
         if light is None:
             Machine._report_missing(self._reg.name)
@@ -177,32 +547,47 @@ class Machine:
             end_index = self._reg.last_zone
             if end_index is None:
                 end_index = start_index
-            light.set_zone_color(
-                start_index, end_index + 1,
-                self._assure_raw_color(self._reg.get_color()),
-                self._assure_raw(Register.DURATION, self._reg.duration))
+            light.set_zone_color(start_index, end_index + 1, color, duration)
 
     @inject(LightSet)
-    def _color_group(self, light_set=injected) -> None:
+    def _color_group(self, color, duration, light_set=injected) -> None:
         lights = light_set.get_group(self._reg.name)
         if lights is None:
             logging.warning("Unknown group: {}".format(self._reg.name))
         else:
-            self._color_multiple(lights)
+            light_set.set_color_multiple(lights, color, duration)
 
     @inject(LightSet)
-    def _color_location(self, light_set=injected) -> None:
+    def _color_location(self, color, duration, light_set=injected) -> None:
         lights = light_set.get_location(self._reg.name)
         if lights is None:
             logging.warning("Unknown location: {}".format(self._reg.name))
         else:
-            self._color_multiple(lights)
+            light_set.set_color_multiple(lights, color, duration)
 
-    def _color_multiple(self, lights) -> None:
-        color = self._assure_raw_color(self._reg.get_color())
-        duration = self._assure_raw(Register.DURATION, self._reg.duration)
-        for light in lights:
-            light.set_color(color, duration)
+    @inject(LightSet)
+    def _gradient(self, light_set=injected) -> None:
+        """
+        Set the zones of a multi-zone light to colors that change evenly from
+        the color on the stack to the color in the registers. All of the zones
+        are sent to the light at once.
+        """
+        start = self._vm_math.pop_values(4)
+        light = light_set.get_light(self._reg.name)
+        if light is None:
+            Machine._report_missing(self._reg.name)
+        elif self._zone_check(light):
+            first_zone = self._reg.first_zone
+            last_zone = self._reg.last_zone
+            if last_zone is None:
+                last_zone = first_zone
+            colors = gradient(
+                start, self._reg.get_color(), last_zone - first_zone + 1)
+            if self._reg.unit_mode == UnitMode.LOGICAL:
+                colors = units.colors_as_raw(colors)
+            light.set_zone_colors(
+                first_zone, colors,
+                self._assure_raw(Register.DURATION, self._reg.duration))
 
     def _power(self) -> None: {
         Operand.ALL: self._power_all,
@@ -232,7 +617,7 @@ class Machine:
             logging.warning(
                 'Power invoked for unknown group "{}"'.format(self._reg.name))
         else:
-            self._power_multiple(light_set.get_group(self._reg.name))
+            self._power_multiple(lights)
 
     @inject(LightSet)
     def _power_location(self, light_set=injected) -> None:
@@ -243,10 +628,10 @@ class Machine:
         else:
             self._power_multiple(lights)
 
-    def _power_multiple(self, lights) -> None:
-        power = self._reg.get_power()
-        for light in lights:
-            light.set_power(power, self._reg.duration)
+    @inject(LightSet)
+    def _power_multiple(self, lights, light_set=injected) -> None:
+        light_set.set_power_multiple(
+            lights, self._reg.get_power(), self._reg.duration)
 
     @inject(LightSet)
     def _get_color(self, light_set=injected) -> None:
@@ -262,41 +647,63 @@ class Machine:
             else:
                 self.color_to_reg(self._maybe_logical_color(light.get_color()))
 
-    def _param(self) -> None:
+    def _param(self, name, value) -> None:
         """
         param instruction: the name of the routine's parameter is in param0.
         If the parameter is itself an incoming parameter, it needs to be
         resolved to a real value before being put on the stack.
         """
-        inst = self.current_inst
-        value = inst.param1
         if isinstance(value, Symbol):
             value = self._call_stack.get_variable(value.name)
         elif isinstance(value, Register):
             value = self._reg.get_by_enum(value)
-        self._call_stack.put_param(inst.param0, value)
+        self._call_stack.put_param(name, value)
 
-    def _jsr(self) -> None:
-        inst = self.current_inst
-        self._call_stack.set_return(self._pc + 1)
+    def _jsr(self, return_addr, address) -> int:
+        self._call_stack.set_return(return_addr)
         self._call_stack.push_current()
-        routine_name = inst.param0
-        rtn = self._variables.get(routine_name, None)
-        self._pc = rtn.get_address()
-
-    def _jump(self) -> None:
-        # In the current instruction, param0 contains the condition, and
-        # param1 contains the offset.
-        inst = self.current_inst
-        jump_if = {
-            JumpCondition.ALWAYS: {True: True, False: True},
-            JumpCondition.IF_FALSE: {True: False, False: True},
-            JumpCondition.IF_TRUE: {True: True, False: False}
-        }
-        if jump_if[inst.param0][bool(self._reg.result)]:
-            self._pc += inst.param1
-        else:
-            self._pc += 1
+        return address
+
+    def _param_var(self, layout, index, reader) -> None:
+        self._call_stack.put_param_slot(layout, index, reader())
+
+    def _jsr_frame(self, return_addr, address, layout) -> int:
+        self._call_stack.push_frame(layout, return_addr)
+        return address
+
+    def _undefined_routine(self, name) -> None:
+        self._trigger_error('Unknown routine: "{}"'.format(name))
+        self._halt()
+
+    def _jump_always(self, address) -> int:
+        return address
+
+    def _jump_if_false(self, address) -> int:
+        return None if self._reg.result else address
+
+    def _jump_if_true(self, address) -> int:
+        return address if self._reg.result else None
+
+    def _dec_branch(self, counter, address) -> int:
+        value = self._call_stack.get_variable(counter) - 1
+        self._call_stack.put_variable(counter, value)
+        return address if value > 0 else None
+
+    def _dec_branch_var(self, reader, writer, address) -> int:
+        value = reader() - 1
+        writer(value)
+        return address if value > 0 else None
+
+    def _add_incr(self, index_var) -> None:
+        call_stack = self._call_stack
+        call_stack.put_variable(
+            index_var,
+            call_stack.get_variable(index_var)
+            + call_stack.get_variable(LoopVar.INCR))
+
+    @classmethod
+    def _add_incr_var(cls, reader, writer, incr_reader) -> None:
+        writer(reader() + incr_reader())
 
     def _loop(self) -> None:
         self._call_stack.enter_loop()
@@ -304,30 +711,15 @@ class Machine:
     def _end_loop(self) -> None:
         self._call_stack.exit_loop()
 
-    def _end(self) -> None:
+    def _end(self) -> int:
         ret_addr = self._call_stack.get_return()
         self._call_stack.pop_current()
-        self._pc = ret_addr
-
-    def _nop(self) -> None: pass
-
-    def _push(self):
-        return self._vm_math.push(self.current_inst.param0)
-
-    def _pushq(self):
-        return self._vm_math.pushq(self.current_inst.param0)
-
-    def _pop(self):
-        return self._vm_math.pop(self.current_inst.param0)
+        return ret_addr
 
-    def _op(self):
-        return self._vm_math.op(self.current_inst.param0)
-
-    def _bin_op(self, operator):
-        return self._vm_math.bin_op(operator)
+    def _halt(self) -> None:
+        self._keep_running = False
 
-    def _unary_op(self, operator):
-        return self._vm_math.unary_op(operator)
+    def _nop(self) -> None: pass
 
     def _pause(self) -> None:
         if self._enable_pause:
@@ -340,19 +732,20 @@ class Machine:
                 if char == '!':
                     self._enable_pause = False
 
-    def _constant(self):
-        name = self.current_inst.param0
-        value = self.current_inst.param1
+    def _constant(self, name, value) -> None:
         self._call_stack.put_constant(name, value)
 
-    def _wait(self) -> None:
+    def _wait(self, pc) -> int:
         time = self._reg.time
         if isinstance(time, TimePattern):
             self._clock.wait_until(time)
+            if self._suspended:
+                return pc
         elif time > 0:
             if self._reg.unit_mode == UnitMode.RAW:
                 time /= 1000.0
             self._clock.pause_for(time)
+        return None
 
     def _assure_raw(self, reg, value) -> int:
         """
@@ -368,14 +761,7 @@ class Machine:
         return value
 
     def _assure_raw_color(self, color) -> [int]:
-        if self._reg.unit_mode == UnitMode.RAW:
-            return color
-        result = 4 * [0]
-        result[0] = units.as_raw(Register.HUE, color[0])
-        result[1] = units.as_raw(Register.SATURATION, color[1])
-        result[2] = units.as_raw(Register.BRIGHTNESS, color[2])
-        result[3] = round(color[3])
-        return result
+        return units.raw_color(color, self._reg.unit_mode)
 
     def _maybe_logical(self, reg, value) -> int:
         """
@@ -393,36 +779,39 @@ class Machine:
         return value
 
     def _maybe_logical_color(self, color) -> [int]:
-        if self._reg.unit_mode == UnitMode.RAW:
-            return color
-        result = 4 * [0]
-        result[0] = units.as_logical(Register.HUE, color[0])
-        result[1] = units.as_logical(Register.SATURATION, color[1])
-        result[2] = units.as_logical(Register.BRIGHTNESS, color[2])
-        result[3] = color[3]
-        return result
+        return units.logical_color(color, self._reg.unit_mode)
 
-    def _move(self) -> bool:
+    def _move(self, srce, dest) -> None:
         """
         Move from variable/register to variable/register.
         """
-        inst = self.current_inst
-        srce = inst.param0
-        dest = inst.param1
         if isinstance(srce, Register):
             value = self._reg.get_by_enum(srce)
         else:
             value = self._call_stack.get_variable(srce)
             if value is None:
-                return self._trigger_error('Unknown: "{}"'.format(srce))
-        return self._do_put_value(dest, value)
+                self._trigger_error('Unknown: "{}"'.format(srce))
+                return
+        self._do_put_value(dest, value)
+
+    def _move_var(self, reader, writer, name) -> None:
+        value = reader()
+        if value is None:
+            self._trigger_error('Unknown: "{}"'.format(name))
+        else:
+            writer(value)
+
+    @classmethod
+    def _move_value(cls, reader, writer) -> None:
+        writer(reader())
+
+    def _move_reg(self, getter, setter) -> None:
+        setter(self._reg, getter(self._reg))
 
-    def _moveq(self) -> bool:
+    def _moveq(self, value, dest) -> None:
         """
         Move a value from the instruction itself into a register or variable.
         """
-        value = self.current_inst.param0
-        dest = self.current_inst.param1
         if dest == Register.UNIT_MODE:
             if self._reg.unit_mode != value:
                 fn = (units.as_logical if value == UnitMode.LOGICAL
@@ -432,7 +821,7 @@ class Machine:
                     Register.SATURATION, self._reg.saturation)
                 self._reg.brightness = fn(
                     Register.BRIGHTNESS, self._reg.brightness)
-        return self._do_put_value(dest, value)
+        self._do_put_value(dest, value)
 
     def _do_put_value(self, dest, value) -> bool:
         if isinstance(dest, Register):
@@ -441,12 +830,13 @@ class Machine:
             self._call_stack.put_variable(dest, value)
         return True
 
-    def _time_pattern(self) -> None:
-        inst = self.current_inst
-        if inst.param0 == SetOp.INIT:
-            self._reg.time = inst.param1
+    def _time_pattern(self, set_op, time_pattern) -> None:
+        if set_op == SetOp.INIT:
+            # Copy, because a subsequent union would otherwise modify the
+            # pattern inside the program.
+            self._reg.time = copy.deepcopy(time_pattern)
         else:
-            self._reg.time.union(inst.param1)
+            self._reg.time.union(time_pattern)
 
     def _zone_check(self, light) -> bool:
         if not light.multizone:
@@ -0,0 +1,140 @@
+from functools import partial
+
+from bardolph.lib.symbol import Symbol
+
+from .vm_codes import LoopVar, OpCode
+
+class Resolver:
+    """
+    Assigns a fixed slot to each variable in a loaded program, so that the
+    Machine can bind the slots into the decoded instructions instead of
+    looking the variables up by name as they run.
+
+    Every variable gets a slot among the globals in the root frame of the
+    CallStack. A variable that appears inside a routine, including each of
+    the routine's parameters, also gets a slot in the layout for that
+    routine's frames. The scope of each instruction comes from the ROUTINE
+    and END instructions around it, and the routine that receives a PARAM is
+    the one called by the next JSR.
+
+    A name that is also a constant is still accessed by name, because
+    constants take precedence over variables.
+    """
+    def __init__(self, call_stack):
+        self._call_stack = call_stack
+        self._scopes = []
+        self._callees = {}
+        self._layouts = {}
+        self._constants = set()
+
+    def resolve(self, program) -> None:
+        self._scopes.clear()
+        self._callees.clear()
+        self._layouts.clear()
+        self._constants.clear()
+        scope = None
+        for inst in program:
+            if inst.op_code == OpCode.ROUTINE:
+                scope = inst.param0
+                self._layouts.setdefault(scope, {})
+            self._scopes.append(scope)
+            for name in Resolver.variables_in(inst):
+                self._add(scope, name)
+            if inst.op_code == OpCode.CONSTANT:
+                self._constants.add(inst.param0)
+            elif inst.op_code == OpCode.END:
+                scope = None
+
+        callee = None
+        for pc in range(len(program) - 1, -1, -1):
+            inst = program[pc]
+            if inst.op_code == OpCode.JSR:
+                callee = inst.param0
+            elif inst.op_code == OpCode.PARAM and callee is not None:
+                self._callees[pc] = callee
+                self._add(callee, inst.param0)
+
+    @classmethod
+    def is_variable(cls, operand) -> bool:
+        return isinstance(operand, (str, LoopVar))
+
+    def layout(self, routine_name) -> dict:
+        return self._layouts.setdefault(routine_name, {})
+
+    def param_slot(self, pc, name):
+        """
+        For the PARAM instruction at pc, return the layout of the frame for
+        the routine that receives the parameter and the index of its slot, or
+        None if there's no such routine.
+        """
+        callee = self._callees.get(pc, None)
+        if callee is None:
+            return None
+        return self._layouts[callee], self._layouts[callee][name]
+
+    def reader(self, pc, operand):
+        """
+        Return a function with no parameters that returns the value of the
+        variable as seen by the instruction at pc.
+        """
+        call_stack = self._call_stack
+        if isinstance(operand, LoopVar):
+            return partial(
+                call_stack.get_loop_var, call_stack.loop_index(operand))
+        if self._is_constant(operand):
+            return partial(call_stack.get_variable, operand)
+        global_index = call_stack.global_index(operand)
+        scope = self._scopes[pc]
+        if scope is None:
+            return partial(call_stack.get_global, global_index)
+        return partial(
+            call_stack.get_local, self._layouts[scope][operand], global_index)
+
+    def writer(self, pc, operand):
+        """
+        Return a function that takes a value and puts it into the variable as
+        seen by the instruction at pc.
+        """
+        call_stack = self._call_stack
+        if isinstance(operand, LoopVar):
+            return partial(
+                call_stack.put_loop_var, call_stack.loop_index(operand))
+        if self._is_constant(operand):
+            return partial(call_stack.put_variable, operand)
+        global_index = call_stack.global_index(operand)
+        scope = self._scopes[pc]
+        if scope is None:
+            return partial(call_stack.put_global, global_index)
+        return partial(
+            call_stack.put_local, self._layouts[scope][operand], global_index)
+
+    def _is_constant(self, name) -> bool:
+        return name in self._constants or self._call_stack.is_constant(name)
+
+    def _add(self, scope, name) -> None:
+        self._call_stack.global_index(name)
+        if scope is not None:
+            layout = self.layout(scope)
+            if name not in layout:
+                layout[name] = len(layout)
+
+    @classmethod
+    def variables_in(cls, inst) -> list:
+        """
+        Names of the variables that the instruction refers to in its own
+        scope. The name in a PARAM belongs to the routine being called.
+        """
+        op_code = inst.op_code
+        if op_code == OpCode.MOVE:
+            operands = (inst.param0, inst.param1)
+        elif op_code == OpCode.MOVEQ:
+            operands = (inst.param1,)
+        elif op_code in (OpCode.ADD_INCR, OpCode.POP, OpCode.PUSH):
+            operands = (inst.param0,)
+        elif op_code == OpCode.TEST:
+            operands = (inst.param1, inst.param2)
+        elif op_code == OpCode.PARAM and isinstance(inst.param1, Symbol):
+            operands = (inst.param1.name,)
+        else:
+            return []
+        return [operand for operand in operands if isinstance(operand, str)]
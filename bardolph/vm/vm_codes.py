@@ -23,12 +23,16 @@ class Register(Enum):
         return getattr(Register, upper) if hasattr(Register, upper) else None
 
 class OpCode(Enum):
+    ADD_INCR = auto()
     BREAKPOINT = auto()
     COLOR = auto()
+    COLORQ = auto()
     CONSTANT = auto()
+    DEC_BRANCH = auto()
     END = auto()
     END_LOOP = auto()
     GET_COLOR = auto()
+    GRADIENT = auto()
     JSR = auto()
     JUMP = auto()
     LOOP = auto()
@@ -44,6 +48,7 @@ class OpCode(Enum):
     PUSHQ = auto()
     ROUTINE = auto()
     STOP = auto()
+    TEST = auto()
     TIME_PATTERN = auto()
     WAIT = auto()
 
@@ -26,6 +26,17 @@ class VmMath:
     def reset(self) -> None:
         self._eval_stack.clear()
 
+    def checkpoint(self) -> list:
+        return self._eval_stack.values()
+
+    def restore(self, values) -> None:
+        self._eval_stack.restore(values)
+
+    @classmethod
+    def fn_for(cls, operator):
+        """ The function for a binary operator, or None. """
+        return VmMath._fn_table.get(operator, None)
+
     def push(self, srce) -> None:
         value = None
         if isinstance(srce, Register):
@@ -37,6 +48,16 @@ class VmMath:
         assert value is not None
         self._eval_stack.push(value)
 
+    def push_reg(self, getter) -> None:
+        """ Push a register's value, given its accessor from Registers. """
+        self._eval_stack.push(getter(self._reg))
+
+    def push_var(self, reader) -> None:
+        """ Push a variable's value, given a function that returns it. """
+        value = reader()
+        assert value is not None
+        self._eval_stack.push(value)
+
     def pushq(self, srce) -> None:
         self._eval_stack.push(srce)
 
@@ -47,6 +68,20 @@ class VmMath:
         elif isinstance(dest, (str, LoopVar)):
             self._call_stack.put_variable(dest, value)
 
+    def pop_values(self, count) -> list:
+        """ Pop count values, returned in the order they were pushed. """
+        values = [self._eval_stack.pop() for _ in range(count)]
+        values.reverse()
+        return values
+
+    def pop_reg(self, setter) -> None:
+        """ Pop into a register, given its accessor from Registers. """
+        setter(self._reg, self._eval_stack.pop())
+
+    def pop_var(self, writer) -> None:
+        """ Pop into a variable, given a function that takes the value. """
+        writer(self._eval_stack.pop())
+
     def op(self, operator) -> None:
         if operator in (Operator.UADD, Operator.USUB, Operator.NOT):
             self.unary_op(operator)
@@ -63,3 +98,27 @@ class VmMath:
         op2 = self._eval_stack.pop()
         op1 = self._eval_stack.pop()
         self._eval_stack.push(VmMath._fn_table[operator](op1, op2))
+
+    def test(self, operator, op0, op1) -> None:
+        """
+        Apply a binary operator to two operands and put the outcome into the
+        RESULT register, without using the stack. An operand that is a
+        Register, string, or LoopVar is dereferenced; anything else is a
+        literal value.
+        """
+        self._reg.result = VmMath._fn_table[operator](
+            self._operand_value(op0), self._operand_value(op1))
+
+    def test_values(self, fn, reader0, reader1) -> None:
+        """
+        Like test(), but with the function for the operator and a function
+        for each operand that returns its value.
+        """
+        self._reg.result = fn(reader0(), reader1())
+
+    def _operand_value(self, operand):
+        if isinstance(operand, Register):
+            return self._reg.get_by_enum(operand)
+        if isinstance(operand, (str, LoopVar)):
+            return self._call_stack.get_variable(operand)
+        return operand
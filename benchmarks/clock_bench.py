@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+"""
+Compare the polling Clock with the event-driven Clock that replaced it.
+
+Each job runs a one-hour cycle of pauses, such as a script that changes
+colors once a minute. The cycle is compressed in time by the given scale
+factor, so that with the defaults, an hour takes 3.6 seconds. Several jobs
+run at the same time.
+
+For each clock, the benchmark reports how many times per second a thread
+woke up, and the drift: how late each job finished its cycle compared to
+the sum of its pauses, in real milliseconds.
+
+Run from the root of the project:
+    python -m benchmarks.clock_bench [-j JOBS] [-s SCALE] [-p PERIOD]
+"""
+
+import argparse
+import statistics
+import threading
+import time
+
+from bardolph.lib import clock, injection, settings
+
+
+class PollingClock:
+    """
+    The previous implementation: each clock has a thread that wakes up
+    every sleep_time seconds, and each waiter checks the elapsed time
+    whenever that thread fires. Counts every wakeup of either thread.
+    """
+    def __init__(self, sleep_time):
+        self._sleep_time = sleep_time
+        self._event = threading.Event()
+        self._keep_going = True
+        self._start_time = 0.0
+        self._cue_time = 0.0
+        self.wakeups = 0
+
+    def start(self):
+        self._cue_time = 0.0
+        self._start_time = time.time()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while self._keep_going:
+            time.sleep(self._sleep_time)
+            self.wakeups += 1
+            self._event.set()
+            self._event.clear()
+
+    def stop(self):
+        self._keep_going = False
+
+    def et(self):
+        return time.time() - self._start_time
+
+    def pause_for(self, delay):
+        self._cue_time += delay
+        while self.et() < self._cue_time:
+            if self._keep_going:
+                self._event.wait()
+                self.wakeups += 1
+
+
+class CountingClock(clock.Clock):
+    """ The current Clock, counting how often the waiting thread wakes. """
+    def __init__(self):
+        super().__init__()
+        self.wakeups = 0
+
+    def pause_for(self, delay):
+        super().pause_for(delay)
+        self.wakeups += 1
+
+
+def run_cycle(clk, num_pauses, pause_time, drifts):
+    clk.start()
+    for _ in range(num_pauses):
+        clk.pause_for(pause_time)
+    drifts.append(clk.et() - num_pauses * pause_time)
+    clk.stop()
+
+
+def run_jobs(clocks, num_pauses, pause_time):
+    drifts = []
+    threads = [
+        threading.Thread(
+            target=run_cycle, args=(clk, num_pauses, pause_time, drifts))
+        for clk in clocks
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, drifts
+
+
+def report(name, elapsed, wakeups, drifts):
+    print('{:10s} {:10.0f} {:10.2f} {:10.2f}'.format(
+        name, wakeups / elapsed,
+        statistics.mean(drifts) * 1000.0, max(drifts) * 1000.0))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        '-j', '--jobs', help='concurrent jobs', type=int, default=10)
+    arg_parser.add_argument(
+        '-s', '--scale', help='time compression', type=float, default=1000.0)
+    arg_parser.add_argument(
+        '-p', '--period', help='simulated seconds per pause', type=float,
+        default=60.0)
+    arg_parser.add_argument(
+        '-t', '--tick', help='sleep_time of the polling clock', type=float,
+        default=0.01)
+    args = arg_parser.parse_args()
+    injection.configure()
+    settings.use_base({'sleep_time': args.tick}).configure()
+
+    num_pauses = int(3600.0 / args.period)
+    pause_time = args.period / args.scale
+    print('{} jobs, {} pauses of {:.1f} ms each'.format(
+        args.jobs, num_pauses, pause_time * 1000.0))
+    print('{:10s} {:>10s} {:>10s} {:>10s}'.format(
+        'clock', 'wakeups/s', 'drift ms', 'max ms'))
+
+    clocks = [PollingClock(args.tick) for _ in range(args.jobs)]
+    elapsed, drifts = run_jobs(clocks, num_pauses, pause_time)
+    report('polling', elapsed, sum(clk.wakeups for clk in clocks), drifts)
+
+    heap = clock.TimerHeap.get_instance()
+    heap_wakeups = heap.wakeups
+    clocks = [CountingClock() for _ in range(args.jobs)]
+    elapsed, drifts = run_jobs(clocks, num_pauses, pause_time)
+    wakeups = heap.wakeups - heap_wakeups
+    wakeups += sum(clk.wakeups for clk in clocks)
+    report('timer heap', elapsed, wakeups, drifts)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+"""
+Compare converting the zones of many multizone lights between raw and logical
+units one component at a time, with as_raw() and as_logical(), against doing
+it with the array functions in units, both in Python and, if it's installed,
+with NumPy.
+
+Run from the root of the project:
+    python -m benchmarks.color_array_bench [-l LIGHTS] [-z ZONES]
+"""
+
+import argparse
+import random
+import time
+from unittest import mock
+
+from bardolph.controller import units
+from bardolph.vm.vm_codes import Register
+
+_COLOR_REGS = (Register.HUE, Register.SATURATION, Register.BRIGHTNESS)
+
+
+def legacy_as_logical(batch):
+    return [
+        [[units.as_logical(reg, value) for reg, value in zip(_COLOR_REGS, color)]
+         + [color[3]] for color in zones]
+        for zones in batch]
+
+
+def legacy_as_raw(batch):
+    return [
+        [[units.as_raw(reg, value) for reg, value in zip(_COLOR_REGS, color)]
+         + [round(color[3])] for color in zones]
+        for zones in batch]
+
+
+def best_time(fn, batch, rounds=3) -> float:
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn(batch)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def python_only(fn):
+    def wrapper(batch):
+        with mock.patch.object(units, 'numpy', None):
+            return fn(batch)
+    return wrapper
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        '-l', '--lights', help='number of lights', type=int, default=1000)
+    arg_parser.add_argument(
+        '-z', '--zones', help='zones per light', type=int, default=82)
+    args = arg_parser.parse_args()
+
+    rand = random.Random(1)
+    raw = [[[rand.randint(0, 65535), rand.randint(0, 65535),
+             rand.randint(0, 65535), rand.randint(1500, 9000)]
+            for _ in range(args.zones)] for _ in range(args.lights)]
+    logical = units.colors_as_logical(raw)
+
+    print('{} lights x {} zones, NumPy {}'.format(
+        args.lights, args.zones,
+        'available' if units.numpy is not None else 'not installed'))
+    print('{:12s} {:>12s} {:>12s} {:>12s}'.format(
+        'conversion', 'legacy ms', 'python ms', 'numpy ms'))
+    for name, legacy_fn, fn, batch in (
+            ('to logical', legacy_as_logical, units.colors_as_logical, raw),
+            ('to raw', legacy_as_raw, units.colors_as_raw, logical)):
+        assert fn(batch) == legacy_fn(batch)
+        times = [best_time(legacy_fn, batch), best_time(python_only(fn), batch)]
+        numpy_time = '-'
+        if units.numpy is not None:
+            numpy_time = '{:.1f}'.format(best_time(fn, batch) * 1e3)
+        print('{:12s} {:12.1f} {:12.1f} {:>12s}'.format(
+            name, times[0] * 1e3, times[1] * 1e3, numpy_time))
+
+
+if __name__ == '__main__':
+    main()
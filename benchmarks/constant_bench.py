@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+"""
+Compare a script that uses macros inside expressions, compiled with the
+macros' values put directly into the code, against the code generated
+before, which pushed each macro by name for the VM to look up among the
+constants at run time and kept every CONSTANT instruction.
+
+For each, the benchmark reports the size of the program and the time per
+iteration of its loop, with and without the optimizer.
+
+Run from the root of the project:
+    python -m benchmarks.constant_bench [-n ITERATIONS]
+"""
+
+import argparse
+import time
+from unittest import mock
+
+from bardolph.lib import clock, injection, settings
+from bardolph.parser import expr_parser, parse
+from bardolph.parser.optimizer import Optimizer
+from bardolph.vm.machine import Machine
+
+
+class LegacyVisitor(expr_parser.Visitor):
+    """ Ignores the call context, so that macros are pushed by name. """
+    def __init__(self, code_gen, call_context=None):
+        super().__init__(code_gen)
+
+
+SCRIPT = """
+    units raw
+    define min_hue 1000 define max_hue 60000 define step 250
+    define sat 30000 define bright 40000 define fade 10
+    assign level min_hue
+    repeat {} begin
+        hue {level + step}
+        saturation {sat + step * 2}
+        brightness {bright - step}
+        duration {fade * 2}
+        assign level {level + step}
+        if {level > max_hue - step} begin assign level min_hue end
+    end
+"""
+
+
+def compile_script(script, legacy, optimize):
+    if not legacy:
+        return parse.Parser().parse(script, optimize)
+    with mock.patch.object(expr_parser, 'Visitor', LegacyVisitor), \
+            mock.patch.object(
+                Optimizer, '_drop_constants', lambda self: False):
+        return parse.Parser().parse(script, optimize)
+
+
+def best_time(program, rounds=3) -> float:
+    best = None
+    for _ in range(rounds):
+        machine = Machine()
+        start = time.perf_counter()
+        machine.run(program)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        '-n', '--iterations', help='iterations of the loop', type=int,
+        default=100000)
+    args = arg_parser.parse_args()
+    injection.configure()
+    settings.use_base({}).configure()
+    clock.configure()
+
+    script = SCRIPT.replace('{}', str(args.iterations), 1)
+    print('{} iterations'.format(args.iterations))
+    print('{:18s} {:>12s} {:>12s}'.format('code', 'instructions', 'ns/iter'))
+    for name, legacy, optimize in (
+            ('legacy', True, False),
+            ('legacy, optimized', True, True),
+            ('current', False, False),
+            ('current, optimized', False, True)):
+        program = compile_script(script, legacy, optimize)
+        elapsed = best_time(program)
+        print('{:18s} {:12d} {:12.0f}'.format(
+            name, len(program), elapsed * 1e9 / args.iterations))
+
+
+if __name__ == '__main__':
+    main()
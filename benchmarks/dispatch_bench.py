@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+
+"""
+Compare instructions per second for the VM dispatch loop, before and after
+programs were pre-decoded, using the scripts in scripts/ and examples/.
+
+Run from the root of the project:
+    python -m benchmarks.dispatch_bench [-r REPEAT]
+"""
+
+import argparse
+import glob
+import logging
+import os
+import time
+
+from bardolph.controller import i_controller, light_set
+from bardolph.fakes import fake_lifx
+from bardolph.lib import i_lib, injection, settings
+from bardolph.parser.parse import Parser
+from bardolph.vm.loader import Loader
+from bardolph.vm.machine import Machine
+from bardolph.vm.vm_codes import JumpCondition, OpCode
+
+
+class BenchClock(i_lib.Clock):
+    """
+    Never sleeps. Stops the machine after a fixed number of waits so that
+    scripts containing infinite loops still finish.
+    """
+    def __init__(self, max_waits):
+        self.machine = None
+        self._max_waits = max_waits
+        self._num_waits = 0
+
+    def start(self):
+        self._num_waits = 0
+
+    def pause_for(self, _):
+        self._num_waits += 1
+        if self._num_waits >= self._max_waits:
+            self.machine.stop()
+
+    def wait_until(self, time_pattern):
+        self.pause_for(0)
+
+
+class LegacyDispatch:
+    """
+    Reproduces the loop that Machine.run used before programs were
+    pre-decoded: a dictionary lookup on the opcode for every instruction,
+    handlers that re-read the current instruction, and a membership test to
+    decide whether to advance the PC. The handlers themselves are the
+    Machine's own, so only the dispatch overhead differs.
+    """
+    _jump_if = {
+        JumpCondition.ALWAYS: {True: True, False: True},
+        JumpCondition.IF_FALSE: {True: False, False: True},
+        JumpCondition.IF_TRUE: {True: True, False: False}
+    }
+
+    def __init__(self, machine):
+        self._machine = machine
+        self._program = []
+        self._pc = 0
+        self._fn_table = {}
+        for op_code, (fn, num_params) in machine._fn_table.items():
+            self._fn_table[op_code] = self._wrap(fn, num_params)
+        self._fn_table[OpCode.DEC_BRANCH] = self._dec_branch
+        self._fn_table[OpCode.END] = self._end
+        self._fn_table[OpCode.JSR] = self._jsr
+        self._fn_table[OpCode.JUMP] = self._jump
+        self._fn_table[OpCode.WAIT] = self._wait
+
+    @property
+    def current_inst(self):
+        return self._program[self._pc]
+
+    def run(self, program, counting=False) -> int:
+        loader = Loader()
+        loader.load(program, self._machine._variables)
+        self._program = loader.code
+        self._pc = 0
+        self._machine._keep_running = True
+        self._machine._clock.start()
+        count = 0
+        while (self._machine._keep_running
+               and self._pc < len(self._program)):
+            inst = self._program[self._pc]
+            if inst.op_code == OpCode.STOP:
+                break
+            self._fn_table[inst.op_code]()
+            if inst.op_code not in (
+                    OpCode.DEC_BRANCH, OpCode.END, OpCode.JSR, OpCode.JUMP):
+                self._pc += 1
+            if counting:
+                count += 1
+        return count
+
+    def _wrap(self, fn, num_params):
+        if num_params == 0:
+            return fn
+        if num_params == 1:
+            return lambda: fn(self.current_inst.param0)
+        return lambda: fn(self.current_inst.param0, self.current_inst.param1)
+
+    def _dec_branch(self):
+        inst = self.current_inst
+        address = self._machine._dec_branch(
+            inst.param0, self._pc + inst.param1)
+        self._pc = self._pc + 1 if address is None else address
+
+    def _end(self):
+        self._pc = self._machine._end()
+
+    def _jsr(self):
+        inst = self.current_inst
+        rtn = self._machine._variables.get(inst.param0)
+        self._pc = self._machine._jsr(self._pc + 1, rtn.get_address())
+
+    def _wait(self):
+        # Nothing suspends the machine here, so the wait is never repeated.
+        self._machine._wait(self._pc)
+
+    def _jump(self):
+        inst = self.current_inst
+        if self._jump_if[inst.param0][bool(self._machine._reg.result)]:
+            self._pc += inst.param1
+        else:
+            self._pc += 1
+
+
+def configure(clock):
+    injection.configure()
+    settings.use_base({
+        'log_level': logging.CRITICAL,
+        'single_light_discover': True,
+        'use_fakes': True
+    }).configure()
+    logging.disable(logging.CRITICAL)
+    injection.bind_instance(clock).to(i_lib.Clock)
+    fake_lifx.configure()
+    light_set.configure()
+
+
+def clear_call_lists():
+    # The fakes record every call; keep the lists from growing across runs.
+    lifx = injection.provide(i_controller.Lifx)
+    lifx.clear()
+    for light in lifx.get_lights():
+        light.clear()
+
+
+def time_runs(run_fn, repeat, rounds=5) -> float:
+    """ Best of several rounds, to reduce noise from the rest of the system. """
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            run_fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_file(file_name, repeat, clock):
+    program = Parser().load(file_name)
+    if program is None:
+        return None
+
+    machine = Machine()
+    clock.machine = machine
+    legacy = LegacyDispatch(machine)
+    machine.reset()
+    num_insts = legacy.run(program, True)
+
+    def run_legacy():
+        clear_call_lists()
+        machine.reset()
+        legacy.run(program)
+
+    def run_decoded():
+        clear_call_lists()
+        machine.reset()
+        machine.run(program)
+
+    before = time_runs(run_legacy, repeat)
+    after = time_runs(run_decoded, repeat)
+    total = num_insts * repeat
+    return num_insts, total / before, total / after
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        '-r', '--repeat', help='runs per script', type=int, default=200)
+    arg_parser.add_argument(
+        '-w', '--waits', help='maximum waits per run', type=int, default=100)
+    args = arg_parser.parse_args()
+    clock = BenchClock(args.waits)
+    configure(clock)
+
+    file_names = sorted(
+        glob.glob(os.path.join('scripts', '*.ls'))
+        + glob.glob(os.path.join('examples', '*.ls')))
+    print('{:28s} {:>7s} {:>12s} {:>12s} {:>8s}'.format(
+        'script', 'insts', 'before ips', 'after ips', 'speedup'))
+    for file_name in file_names:
+        result = bench_file(file_name, args.repeat, clock)
+        if result is None:
+            print('{:28s} parse error'.format(file_name))
+            continue
+        num_insts, before, after = result
+        print('{:28s} {:7d} {:12.0f} {:12.0f} {:7.2f}x'.format(
+            file_name, num_insts, before, after, after / before))
+
+
+if __name__ == '__main__':
+    main()
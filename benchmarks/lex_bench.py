@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+"""
+Measure tokens per second for the lexer on a synthetic script, and compare
+with the lexer it replaced, which split the input into lines up front and
+tried a series of regular expressions on each token.
+
+Run from the root of the project:
+    python -m benchmarks.lex_bench [-l LINES]
+"""
+
+import argparse
+import os
+import random
+import re
+import tempfile
+import time
+
+from bardolph.lib.time_pattern import TimePattern
+from bardolph.parser.lex import Lex
+from bardolph.parser.token_types import TokenTypes
+
+
+class LegacyLex:
+    """ The previous implementation of Lex. """
+    EXPR_REGEX = re.compile(r'^\{.*?\}$')
+    TOKEN_REGEX = re.compile(r'#.*$|".*?"|\{.*?\}|\S+')
+    NAME_REGEX = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*$')
+    NUMBER_REGEX = re.compile(r'^\-?[0-9]*\.?[0-9]+$')
+    REG_REGEX = re.compile(
+        '^hue$|^saturation$|^brightness$|^duration$|^time$|^kelvin$')
+
+    def __init__(self, input_string):
+        self._lines = iter(input_string.split('\n'))
+        self._tokens = None
+        self._next_line()
+
+    def _next_line(self):
+        current_line = next(self._lines, None)
+        if current_line is None:
+            self._tokens = None
+        else:
+            self._tokens = self.TOKEN_REGEX.finditer(current_line)
+
+    @classmethod
+    def _unabbreviate(cls, token):
+        return {
+            'h': 'hue', 's': 'saturation', 'b': 'brightness', 'k': 'kelvin'
+        }.get(token, token)
+
+    def _token_type(self, token):
+        token_type = TokenTypes.__members__.get(token.upper(), None)
+        if token_type is not None:
+            return token_type
+        pairs = (
+            (self.EXPR_REGEX, TokenTypes.EXPRESSION),
+            (self.REG_REGEX, TokenTypes.REGISTER),
+            (TimePattern.REGEX, TokenTypes.TIME_PATTERN),
+            (self.NUMBER_REGEX, TokenTypes.NUMBER),
+            (self.NAME_REGEX, TokenTypes.NAME)
+        )
+        for reg_expr, token_type in pairs:
+            if reg_expr.match(token):
+                return token_type
+        return TokenTypes.UNKNOWN
+
+    def next_token(self):
+        token_type = None
+        while token_type is None:
+            match = None if self._tokens is None else next(self._tokens, None)
+            while match is None:
+                self._next_line()
+                if self._tokens is None:
+                    return (TokenTypes.EOF, '')
+                match = next(self._tokens, None)
+            token = LegacyLex._unabbreviate(
+                match.string[match.start():match.end()])
+            if token[0] != '#':
+                if token[0] == '"':
+                    token = token[1:-1]
+                    token_type = TokenTypes.LITERAL_STRING
+                else:
+                    token_type = self._token_type(token)
+                    if token_type == TokenTypes.EXPRESSION:
+                        token = token[1:-1]
+        return (token_type, token)
+
+
+LINE_TEMPLATES = (
+    'hue {} saturation 75 brightness {} kelvin 2700 set "Light {}"',
+    'h {} s 50 b {} k 3500 duration 1.5 set group "Group {}"',
+    'on "Light {}" off location "Location {}" # comment {}',
+    'time at 1{}:*0 or 2*:{}5 wait # {}',
+    'assign x {} if {{x < {}}} begin hue {} end',
+    'set "Strip" zone {} {} with_name_{}',
+)
+
+
+def make_script(num_lines, seed=0):
+    rand = random.Random(seed)
+    lines = []
+    for _ in range(num_lines):
+        template = rand.choice(LINE_TEMPLATES)
+        lines.append(template.format(
+            rand.randint(0, 9), rand.randint(0, 5), rand.randint(0, 99)))
+    return '\n'.join(lines) + '\n'
+
+
+def count_tokens(lexer) -> int:
+    count = 0
+    token_type, _ = lexer.next_token()
+    while token_type != TokenTypes.EOF:
+        count += 1
+        token_type, _ = lexer.next_token()
+    return count
+
+
+def best_time(fn, rounds=3):
+    best = None
+    result = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        '-l', '--lines', help='lines in the script', type=int, default=100000)
+    args = arg_parser.parse_args()
+    script = make_script(args.lines)
+
+    with tempfile.NamedTemporaryFile(
+            'w', suffix='.ls', delete=False) as script_file:
+        script_file.write(script)
+        file_name = script_file.name
+
+    def lex_file():
+        with open(file_name, 'r') as srce:
+            return count_tokens(Lex(srce))
+
+    try:
+        runs = (
+            ('legacy, string', lambda: count_tokens(LegacyLex(script))),
+            ('current, string', lambda: count_tokens(Lex(script))),
+            ('current, file', lex_file)
+        )
+        print('{} lines, {} bytes'.format(args.lines, len(script)))
+        print('{:18s} {:>9s} {:>9s} {:>12s}'.format(
+            'lexer', 'tokens', 'seconds', 'tokens/s'))
+        for name, run in runs:
+            elapsed, num_tokens = best_time(run)
+            print('{:18s} {:9d} {:9.3f} {:12.0f}'.format(
+                name, num_tokens, elapsed, num_tokens / elapsed))
+    finally:
+        os.remove(file_name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+"""
+Measure how the cost of maintaining group and location memberships grows
+with the number of lights, using synthetic fleets of fake lights.
+
+For each fleet size, the benchmark times a discovery, a refresh in which
+every light moves to a different group and location, and a garbage
+collection that removes half of the lights. It also times the membership
+updates alone, both with the reverse index used by LightSet and with the
+linear scan that it replaced.
+
+Run from the root of the project:
+    python -m benchmarks.light_set_bench [-s SIZE ...]
+"""
+
+import argparse
+import logging
+import time
+
+from bardolph.controller import i_controller
+from bardolph.controller.light_set import LightSet
+from bardolph.fakes import fake_lifx
+from bardolph.lib import injection, settings
+
+
+class Member:
+    """ Stands in for a Light; membership code only needs these. """
+    def __init__(self, name, group, location):
+        self.name = name
+        self.group = group
+        self.location = location
+
+
+class LegacyMembership:
+    """
+    The previous implementation, which kept a set of Lights for each group
+    and location, and scanned all of them to find a light by name.
+    """
+    @classmethod
+    def update(cls, light, current_set_name, set_dict):
+        if current_set_name not in set_dict:
+            LegacyMembership.remove(light, set_dict)
+            set_dict[current_set_name] = set([light])
+        elif light not in set_dict[current_set_name]:
+            LegacyMembership.remove(light, set_dict)
+            set_dict[current_set_name].add(light)
+
+    @classmethod
+    def remove(cls, light, set_dict):
+        target_set_names = []
+        for set_name in set_dict.keys():
+            the_set = set_dict[set_name]
+            target_light = None
+            for member in the_set:
+                if member.name == light.name:
+                    target_light = member
+                    break
+            if target_light is not None:
+                the_set.discard(target_light)
+                if len(the_set) == 0:
+                    target_set_names.append(set_name)
+        for set_name in target_set_names:
+            del set_dict[set_name]
+
+
+def configure():
+    injection.configure()
+    settings.use_base({
+        'log_level': logging.CRITICAL,
+        'single_light_discover': True,
+        'use_fakes': True
+    }).configure()
+    logging.disable(logging.CRITICAL)
+    fake_lifx.configure()
+
+
+def make_fleet(size, shift=0):
+    # About ten lights per group and a hundred per location.
+    num_groups = max(1, size // 10)
+    num_locations = max(1, size // 100)
+    return [
+        ('Light {}'.format(i),
+         'Group {}'.format((i + shift) % num_groups),
+         'Location {}'.format((i + shift) % num_locations),
+         [0, 0, 0, 0], False)
+        for i in range(size)
+    ]
+
+
+def make_members(size, shift=0):
+    return [Member(init[0], init[1], init[2])
+            for init in make_fleet(size, shift)]
+
+
+def elapsed_ms(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000.0
+
+
+def bench_light_set(size):
+    lifx = injection.provide(i_controller.Lifx)
+    lifx.init_from(make_fleet(size))
+    lights = LightSet()
+    discover = elapsed_ms(lights.discover)
+
+    lifx.init_from(make_fleet(size, 1))
+    refresh = elapsed_ms(lights.refresh)
+
+    for light in list(lights.lights)[::2]:
+        light._birth = 0
+    collect = elapsed_ms(lights._garbage_collect)
+    return discover, refresh, collect
+
+
+def bench_membership(size):
+    """ Move every light to a new group, and then remove them all. """
+    before = make_members(size)
+    after = make_members(size, 1)
+
+    def run_legacy():
+        group_dict = {}
+        for light in before + after:
+            LegacyMembership.update(light, light.group, group_dict)
+        for light in after:
+            LegacyMembership.remove(light, group_dict)
+
+    def run_indexed():
+        group_dict = {}
+        index = {}
+        for light in before + after:
+            LightSet._update_membership(light, light.group, group_dict, index)
+        for light in after:
+            LightSet._remove_membership(light.name, group_dict, index)
+
+    return elapsed_ms(run_legacy), elapsed_ms(run_indexed)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        '-s', '--sizes', help='number of lights in each fleet', type=int,
+        nargs='+', default=[10, 100, 500, 1000, 2000, 5000])
+    args = arg_parser.parse_args()
+    configure()
+
+    print('{:>6s} {:>11s} {:>11s} {:>11s} {:>11s} {:>11s} {:>8s}'.format(
+        'lights', 'discover', 'refresh', 'gc', 'legacy', 'indexed',
+        'speedup'))
+    for size in args.sizes:
+        discover, refresh, collect = bench_light_set(size)
+        legacy, indexed = bench_membership(size)
+        print('{:6d} {:9.1f}ms {:9.1f}ms {:9.1f}ms {:9.1f}ms {:9.1f}ms '
+              '{:7.1f}x'.format(
+                  size, discover, refresh, collect, legacy, indexed,
+                  legacy / indexed))
+
+
+if __name__ == '__main__':
+    main()
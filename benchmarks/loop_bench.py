@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+"""
+Compare counted loops compiled with the DEC_BRANCH and ADD_INCR instructions
+against the code that was generated before, which decremented the counter
+and stepped the index variable with separate push, op, and pop instructions
+and then jumped back to the test at the top of the loop.
+
+For each, the benchmark reports the number of instructions dispatched per
+iteration and the time per iteration, with and without the optimizer.
+
+Run from the root of the project:
+    python -m benchmarks.loop_bench [-n ITERATIONS]
+"""
+
+import argparse
+import time
+from unittest import mock
+
+from bardolph.lib import clock, injection, settings
+from bardolph.parser import parse
+from bardolph.parser.loop_parser import LoopParser, LoopType
+from bardolph.vm.machine import Machine
+from bardolph.vm.vm_codes import LoopVar, OpCode
+
+
+class LegacyLoopParser(LoopParser):
+    """ Generates loops the way LoopParser did before. """
+    def repeat(self, code_gen, call_context) -> bool:
+        self._next_token()
+        if not self._detect_loop_type(code_gen):
+            return False
+        if not self._pre_loop(code_gen, call_context):
+            return False
+        loop_top = code_gen.mark()
+        if not self._loop_test(code_gen):
+            return False
+        if self._loop_type != LoopType.INFINITE:
+            exit_loop_marker = code_gen.if_start()
+        if not (self._loop_body() and self._legacy_post(code_gen)):
+            return False
+        code_gen.jump_back(loop_top)
+        if self._loop_type != LoopType.INFINITE:
+            code_gen.if_end(exit_loop_marker)
+        code_gen.add_instruction(OpCode.END_LOOP)
+        return True
+
+    def _legacy_post(self, code_gen) -> bool:
+        if self._loop_type not in (LoopType.COUNTED, LoopType.CYCLE):
+            return True
+        code_gen.decrement(LoopVar.COUNTER)
+        if self._index_var is not None:
+            code_gen.addition(self._index_var, LoopVar.INCR)
+            code_gen.add_instruction(OpCode.POP, self._index_var)
+        return True
+
+
+def compile_script(script, legacy, optimize):
+    loop_parser = LegacyLoopParser if legacy else LoopParser
+    with mock.patch.object(parse, 'LoopParser', loop_parser):
+        return parse.Parser().parse(script, optimize)
+
+
+def count_dispatches(program) -> int:
+    machine = Machine()
+    machine._load(program)
+    count = 0
+
+    def counted(fn):
+        def wrapper():
+            nonlocal count
+            count += 1
+            return fn()
+        return wrapper
+
+    machine._code = [counted(fn) for fn in machine._code]
+    machine._keep_running = True
+    machine._execute()
+    return count
+
+
+def best_time(program, rounds=3) -> float:
+    best = None
+    for _ in range(rounds):
+        machine = Machine()
+        start = time.perf_counter()
+        machine.run(program)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        '-n', '--iterations', help='iterations of the loop', type=int,
+        default=200000)
+    args = arg_parser.parse_args()
+    injection.configure()
+    settings.use_base({}).configure()
+    clock.configure()
+
+    script = 'repeat {} with x from 0 to 360 begin assign y x end'.format(
+        args.iterations)
+    print('{} iterations'.format(args.iterations))
+    print('{:18s} {:>12s} {:>12s}'.format(
+        'code', 'inst/iter', 'ns/iter'))
+    for name, legacy, optimize in (
+            ('legacy', True, False),
+            ('legacy, optimized', True, True),
+            ('current', False, False),
+            ('current, optimized', False, True)):
+        program = compile_script(script, legacy, optimize)
+        dispatches = count_dispatches(program)
+        elapsed = best_time(program)
+        print('{:18s} {:12.1f} {:12.0f}'.format(
+            name, dispatches / args.iterations,
+            elapsed * 1e9 / args.iterations))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+"""
+Compare access to the VM's registers by Register with the implementation of
+Registers that it replaced, which built the attribute name from the enum on
+every access.
+
+The first part measures get_by_enum() and set_by_enum() directly. The second
+runs a program of the kind used in tests/vm_math_test.py, with PUSH, POP, and
+MOVE instructions on registers, through the Machine. There, the legacy
+version also uses the general-purpose handlers for those instructions rather
+than having the registers' accessors bound when the program is decoded.
+
+Run from the root of the project:
+    python -m benchmarks.register_bench [-n REPETITIONS]
+"""
+
+import argparse
+import time
+
+from bardolph.controller.units import UnitMode
+from bardolph.lib import clock, injection, settings
+from bardolph.vm import machine
+from bardolph.vm.instruction import Instruction
+from bardolph.vm.vm_codes import LoopVar, OpCode, Operator
+from bardolph.vm.vm_codes import Register
+
+
+class LegacyRegisters:
+    """ The previous implementation of Registers. """
+    def __init__(self):
+        self.hue = 0
+        self.saturation = 0
+        self.brightness = 0
+        self.kelvin = 0
+        self.duration = 0
+        self.first_zone = None
+        self.last_zone = None
+        self.power = False
+        self.result = None
+        self.name = None
+        self.operand = None
+        self.time = 0
+        self.unit_mode = UnitMode.LOGICAL
+
+    def get_color(self) -> [int]:
+        return [self.hue, self.saturation, self.brightness, self.kelvin]
+
+    def get_by_enum(self, reg):
+        return getattr(self, reg.name.lower())
+
+    def set_by_enum(self, reg, value):
+        setattr(self, reg.name.lower(), value)
+
+    def reset(self):
+        self.__init__()
+
+    def get_power(self):
+        return 65535 if self.power else 0
+
+
+class LegacyMachine(machine.Machine):
+    """ Decodes every instruction with its general-purpose handler. """
+    def __init__(self):
+        super().__init__()
+        self._reg = LegacyRegisters()
+        self._vm_math._reg = self._reg
+
+    def _decode_register_op(self, inst):
+        return None
+
+
+REGS = (Register.HUE, Register.SATURATION, Register.BRIGHTNESS,
+        Register.KELVIN, Register.DURATION, Register.TIME)
+
+
+def access(reg_class, repetitions) -> float:
+    regs = reg_class()
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        for reg in REGS:
+            regs.set_by_enum(reg, regs.get_by_enum(reg) + 1)
+    return time.perf_counter() - start
+
+
+def register_program(repetitions):
+    # Each iteration of the loop does 8 register accesses.
+    return [
+        Instruction(OpCode.LOOP),
+        Instruction(OpCode.MOVEQ, repetitions, LoopVar.COUNTER),
+        Instruction(OpCode.PUSH, Register.HUE),
+        Instruction(OpCode.PUSH, Register.SATURATION),
+        Instruction(OpCode.OP, Operator.ADD),
+        Instruction(OpCode.POP, Register.BRIGHTNESS),
+        Instruction(OpCode.MOVE, Register.BRIGHTNESS, Register.KELVIN),
+        Instruction(OpCode.MOVE, Register.KELVIN, Register.DURATION),
+        Instruction(OpCode.PUSH, Register.DURATION),
+        Instruction(OpCode.POP, Register.TIME),
+        Instruction(OpCode.DEC_BRANCH, LoopVar.COUNTER, -8),
+        Instruction(OpCode.END_LOOP)
+    ]
+
+
+def run_program(machine_class, repetitions) -> float:
+    vm = machine_class()
+    program = register_program(repetitions)
+    start = time.perf_counter()
+    vm.run(program)
+    return time.perf_counter() - start
+
+
+def best_time(fn, *args, rounds=3) -> float:
+    return min(fn(*args) for _ in range(rounds))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        '-n', '--repetitions', help='repetitions of each test', type=int,
+        default=200000)
+    args = arg_parser.parse_args()
+    injection.configure()
+    settings.use_base({}).configure()
+    clock.configure()
+
+    num_accesses = args.repetitions * len(REGS) * 2
+    print('{:24s} {:>12s} {:>12s}'.format('test', 'legacy ns', 'current ns'))
+    legacy = best_time(access, LegacyRegisters, args.repetitions)
+    current = best_time(access, machine.Registers, args.repetitions)
+    print('{:24s} {:12.1f} {:12.1f}'.format(
+        'per get or set', legacy * 1e9 / num_accesses,
+        current * 1e9 / num_accesses))
+
+    legacy = best_time(run_program, LegacyMachine, args.repetitions)
+    current = best_time(run_program, machine.Machine, args.repetitions)
+    print('{:24s} {:12.1f} {:12.1f}'.format(
+        'per loop iteration', legacy * 1e9 / args.repetitions,
+        current * 1e9 / args.repetitions))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+"""
+Measure the time from starting a large, machine-generated script until the
+first light changes, with and without streaming, along with the time to
+run the whole script. For comparison, the script is also run from the
+program cache.
+
+Run from the root of the project:
+    python -m benchmarks.stream_bench [-c COMMANDS]
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from bardolph.controller import i_controller, light_set, program_cache
+from bardolph.controller.script_job import ScriptJob
+from bardolph.fakes import fake_clock, fake_lifx
+from bardolph.lib import injection, settings
+
+
+def configure(stream_threshold, clear_cache=True):
+    injection.configure()
+    settings.use_base({
+        'log_level': logging.CRITICAL,
+        'single_light_discover': True,
+        'stream_threshold': stream_threshold,
+        'use_fakes': True
+    }).configure()
+    logging.disable(logging.CRITICAL)
+    fake_clock.configure()
+    fake_lifx.configure()
+    light_set.configure()
+    if clear_cache:
+        program_cache.configure()
+
+
+def make_script(num_commands):
+    # Resembles the output of a snapshot or an animation generator.
+    names = ('Table', 'Top', 'Middle', 'Bottom', 'Chair')
+    lines = ['units raw duration 0']
+    for i in range(num_commands):
+        lines.append(
+            'hue {} saturation {} brightness {} kelvin 2700 set "{}"'.format(
+                i % 65536, (i * 7) % 65536, (i * 13) % 65536,
+                names[i % len(names)]))
+    return '\n'.join(lines) + '\n'
+
+
+def watch_first_change():
+    """ Return a list that gets the time of the first color change. """
+    first_change = []
+    lifx = injection.provide(i_controller.Lifx)
+    for light in lifx.get_lights():
+        original = light.set_color
+
+        def set_color(color, duration=0, rapid=False, original=original):
+            if len(first_change) == 0:
+                first_change.append(time.perf_counter())
+            original(color, duration, rapid)
+
+        light.set_color = set_color
+    return first_change
+
+
+def bench(file_name, stream_threshold, clear_cache=True):
+    configure(stream_threshold, clear_cache)
+    first_change = watch_first_change()
+    start = time.perf_counter()
+    job = ScriptJob.from_file(file_name)
+    job.execute()
+    end = time.perf_counter()
+    return first_change[0] - start, end - start
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        '-c', '--commands', help='commands in the script', type=int,
+        default=50000)
+    args = arg_parser.parse_args()
+
+    with tempfile.NamedTemporaryFile(
+            'w', suffix='.ls', delete=False) as script_file:
+        script_file.write(make_script(args.commands))
+        file_name = script_file.name
+    try:
+        print('{} commands, {} bytes'.format(
+            args.commands, os.stat(file_name).st_size))
+        print('{:12s} {:>14s} {:>10s}'.format(
+            'mode', 'first change', 'total'))
+        runs = (
+            ('whole', None, True),
+            ('cached', None, False),
+            ('streaming', 0, True)
+        )
+        for name, threshold, clear_cache in runs:
+            first, total = bench(file_name, threshold, clear_cache)
+            print('{:12s} {:12.1f}ms {:8.2f}s'.format(
+                name, first * 1000.0, total))
+    finally:
+        os.remove(file_name)
+
+
+if __name__ == '__main__':
+    main()
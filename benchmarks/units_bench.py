@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+"""
+Compare a loop that sets lights to fixed colors in logical units, with the
+conversion to raw units done by the optimizer at compile time, against the
+code generated before, in which every COLOR instruction converted the
+contents of the registers as it was executed.
+
+Run from the root of the project:
+    python -m benchmarks.units_bench [-n ITERATIONS]
+"""
+
+import argparse
+import time
+from unittest import mock
+
+from bardolph.lib import settings
+from bardolph.parser.optimizer import Optimizer
+from bardolph.parser.parse import Parser
+from bardolph.vm.machine import Machine
+from bardolph.vm.vm_codes import OpCode
+from tests import test_module
+
+
+SCRIPT = """
+    saturation 80 brightness 60 kelvin 2700 duration 0.5
+    repeat {} begin
+        hue 0 set "Top"
+        hue 120 set "Middle"
+        hue 240 set "Bottom"
+        hue 60 set "Top" and "Middle" and "Bottom"
+    end
+"""
+
+
+def compile_script(script, legacy):
+    if not legacy:
+        return Parser().parse(script, True)
+    with mock.patch.object(Optimizer, '_fold_units', lambda self: False):
+        return Parser().parse(script, True)
+
+
+def best_time(program, rounds=3) -> float:
+    best = None
+    for _ in range(rounds):
+        machine = Machine()
+        start = time.perf_counter()
+        machine.run(program)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        '-n', '--iterations', help='iterations of the loop', type=int,
+        default=20000)
+    args = arg_parser.parse_args()
+    test_module.configure()
+    settings.use_base({'log_level': 50}).configure()
+
+    script = SCRIPT.replace('{}', str(args.iterations), 1)
+    colors = args.iterations * 6
+    print('{} color instructions'.format(colors))
+    print('{:10s} {:>10s} {:>12s}'.format('code', 'colorq', 'ns/color'))
+    for name, legacy in (('legacy', True), ('current', False)):
+        program = compile_script(script, legacy)
+        num_colorq = sum(
+            1 for inst in program if inst.op_code == OpCode.COLORQ)
+        elapsed = best_time(program)
+        print('{:10s} {:10d} {:12.0f}'.format(
+            name, num_colorq, elapsed * 1e9 / colors))
+
+
+if __name__ == '__main__':
+    main()
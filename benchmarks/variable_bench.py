@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+"""
+Compare a script that calls a routine from inside nested loops, run with
+variables resolved to slots when the program is loaded, against the CallStack
+that it replaced, which kept the variables of each frame in a dictionary and
+looked them up by name on every access.
+
+Run from the root of the project:
+    python -m benchmarks.variable_bench [-n ITERATIONS]
+"""
+
+import argparse
+from collections import deque
+import time
+
+from bardolph.lib import clock, injection, settings
+from bardolph.parser.parse import Parser
+from bardolph.vm import machine
+from bardolph.vm.vm_codes import LoopVar
+
+
+class LegacyStackFrame:
+    def __init__(self, variables=None, return_addr=None):
+        self.vars = variables if variables is not None else {}
+        self.return_addr = return_addr if return_addr is not None else 0
+
+    def clear(self):
+        self.vars.clear()
+        self.return_addr = 0
+
+
+class LegacyLoopFrame(LegacyStackFrame):
+    def __init__(self, variables):
+        super().__init__(variables, None)
+        self._loop_var = {}
+
+    def get_loop_var(self, index):
+        return self._loop_var.get(index, None)
+
+    def set_loop_var(self, index, value):
+        self._loop_var[index] = value
+
+
+class LegacyCallStack:
+    """ The previous implementation of CallStack. """
+    def __init__(self):
+        self._stack = deque()
+        self._root_frame = LegacyStackFrame()
+        self._stack.append(self._root_frame)
+        self._current = LegacyStackFrame()
+        self._constants = {}
+
+    def reset(self) -> None:
+        self._stack.clear()
+        self._root_frame.clear()
+        self._stack.append(self._root_frame)
+        self._current.clear()
+        self._constants.clear()
+
+    @property
+    def top(self):
+        return self._stack[-1]
+
+    def put_param(self, name, value) -> None:
+        self._current.vars[name] = value
+
+    def put_constant(self, name, value) -> None:
+        if name not in self._constants:
+            self._constants[name] = value
+
+    def put_variable(self, index, value) -> None:
+        if isinstance(index, LoopVar):
+            return self.top.set_loop_var(index, value)
+        dest = self._root_frame if index in self._root_frame.vars else self.top
+        dest.vars[index] = value
+
+    def set_return(self, address) -> None:
+        self._current.return_addr = address
+
+    def get_return(self) -> int:
+        return self.top.return_addr
+
+    def get_variable(self, index):
+        if isinstance(index, LoopVar):
+            if isinstance(self.top, LegacyLoopFrame):
+                return self.top.get_loop_var(index)
+            return None
+        for place in (self._constants, self.top.vars, self._root_frame.vars):
+            if index in place:
+                return place[index]
+        return None
+
+    def push_current(self) -> None:
+        self._stack.append(self._current)
+        self._current = LegacyStackFrame()
+
+    def enter_loop(self) -> None:
+        self._stack.append(LegacyLoopFrame(self.top.vars))
+
+    def exit_loop(self) -> None:
+        self._stack.pop()
+
+    def pop_current(self) -> None:
+        self._current = self._stack.pop()
+        self._current.clear()
+
+
+class LegacyMachine(machine.Machine):
+    """ Looks up every variable by name, in a LegacyCallStack. """
+    def __init__(self):
+        super().__init__()
+        self._call_stack = LegacyCallStack()
+        self._vm_math._call_stack = self._call_stack
+
+    def _resolve(self, program):
+        return None
+
+
+SCRIPT = """
+    units raw
+    assign total 0
+    define accumulate with amount scale begin
+        assign scaled {amount * scale}
+        assign total {total + scaled}
+        if {total > 1000000} begin assign total 0 end
+    end
+    repeat {} with i from 0 to 100 begin
+        repeat 10 with j from 1 to 10 begin
+            accumulate i j
+        end
+    end
+    hue total
+"""
+
+
+def best_time(machine_class, program, rounds=3) -> float:
+    best = None
+    for _ in range(rounds):
+        vm = machine_class()
+        start = time.perf_counter()
+        vm.run(program)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        '-n', '--iterations', help='iterations of the outer loop', type=int,
+        default=10000)
+    args = arg_parser.parse_args()
+    injection.configure()
+    settings.use_base({}).configure()
+    clock.configure()
+
+    calls = args.iterations * 10
+    print('{} calls'.format(calls))
+    print('{:18s} {:>12s} {:>12s}'.format('code', 'legacy ns', 'current ns'))
+    for name, optimize in (('unoptimized', False), ('optimized', True)):
+        program = Parser().parse(
+            SCRIPT.replace('{}', str(args.iterations), 1), optimize)
+        legacy = best_time(LegacyMachine, program)
+        current = best_time(machine.Machine, program)
+        print('{:18s} {:12.0f} {:12.0f}'.format(
+            name, legacy * 1e9 / calls, current * 1e9 / calls))
+
+
+if __name__ == '__main__':
+    main()
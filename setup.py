@@ -21,6 +21,7 @@ setup(
         'bardolph.vm'
     ],
     install_requires=['lifxlan'],
+    extras_require={'numpy': ['numpy']},
     python_requires='>=3.5',
     entry_points={
         'console_scripts': [
@@ -3,8 +3,10 @@
 import unittest
 
 from tests.activity_log_test import ActivityLogTest
+from tests.async_machine_test import AsyncMachineTest
 from tests.call_context_test import CallContextTest
 from tests.call_stack_test import CallStackTest
+from tests.cancel_test import CancelTest
 from tests.clock_test import ClockTest
 from tests.code_gen_test import CodeGenTest
 from tests.define_test import DefineTest
@@ -17,8 +19,11 @@ from tests.lex_test import LexTest
 from tests.light_set_test import LightSetTest
 from tests.log_config_test import LogConfigTest
 from tests.machine_test import MachineTest
+from tests.optimizer_test import OptimizerTest
 from tests.parser_test import ParserTest
+from tests.program_cache_test import ProgramCacheTest
 from tests.settings_test import SettingsTest
+from tests.stream_test import StreamTest
 from tests.time_pattern_test import TimePatternTest
 from tests.units_test import UnitsTest
 from tests.vm_math_test import VmMathTest
@@ -28,8 +33,10 @@ tests = unittest.TestSuite()
 
 for test_class in (
     ActivityLogTest,
+    AsyncMachineTest,
     CallContextTest,
     CallStackTest,
+    CancelTest,
     ClockTest,
     CodeGenTest,
     DefineTest,
@@ -42,8 +49,11 @@ for test_class in (
     LightSetTest,
     LogConfigTest,
     MachineTest,
+    OptimizerTest,
     ParserTest,
+    ProgramCacheTest,
     SettingsTest,
+    StreamTest,
     TimePatternTest,
     UnitsTest,
     VmMathTest,
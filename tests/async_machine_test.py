@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+import asyncio
+import threading
+import time
+import unittest
+
+from bardolph.controller import i_controller
+from bardolph.controller.script_job import ScriptJob
+from bardolph.fakes.fake_lifx import Action
+from bardolph.lib import clock
+from bardolph.lib.injection import provide
+from bardolph.parser.parse import Parser
+from bardolph.vm.async_machine import AsyncMachine
+from bardolph.vm.machine import Machine
+
+from . import test_module
+
+class AsyncMachineTest(unittest.TestCase):
+    def setUp(self):
+        test_module.configure()
+        self._lifx = provide(i_controller.Lifx)
+
+    def _call_lists(self):
+        result = {light.get_label(): list(light.get_call_list())
+                  for light in self._lifx.get_lights()}
+        for light in self._lifx.get_lights():
+            light.clear()
+        return result
+
+    def test_same_as_machine(self):
+        script = """
+            units raw duration 5
+            define set_zone with z h begin
+                hue h set "Strip" zone z
+            end
+            saturation 100 brightness 200 kelvin 2700
+            repeat 3 with i from 0 to 2 begin
+                set_zone i {i * 100}
+                time 1 hue {i * 10} set "Top" and group "Pole"
+            end
+            get "Table" hue {hue + 1} set "Bottom"
+            hue 0 set "Strip" zone 0 4 to hue 400
+            on "Chair" off all
+        """
+        program = Parser().parse(script, True)
+        Machine().run(program)
+        expected = self._call_lists()
+        asyncio.run(AsyncMachine().run(program))
+        self.assertDictEqual(self._call_lists(), expected)
+
+        Machine().run_stream(Parser().parse_stream(script))
+        expected = self._call_lists()
+        asyncio.run(AsyncMachine().run_stream(Parser().parse_stream(script)))
+        self.assertDictEqual(self._call_lists(), expected)
+
+    def test_many_machines(self):
+        # Each script waits before setting the color. With all of them on
+        # one event loop, the waits overlap, and no thread is needed for any
+        # of them while it waits.
+        clock.configure()
+        num_scripts = 200
+        programs = [
+            Parser().parse(
+                'units raw time 200 hue {} set "Top"'.format(i))
+            for i in range(num_scripts)
+        ]
+
+        async def run_all():
+            await asyncio.gather(
+                *(AsyncMachine().run(program) for program in programs))
+
+        threads_before = threading.active_count()
+        start = time.monotonic()
+        asyncio.run(run_all())
+        self.assertLess(time.monotonic() - start, 2.0)
+        self.assertLess(threading.active_count() - threads_before, 50)
+        calls = self._call_lists()['Top']
+        self.assertEqual(len(calls), num_scripts)
+        self.assertListEqual(
+            sorted(call[1][0][0] for call in calls), list(range(num_scripts)))
+
+    def test_stop(self):
+        clock.configure()
+        machine = AsyncMachine()
+        program = Parser().parse('time 60 set "Top"')
+
+        async def run():
+            threading.Timer(0.05, machine.stop).start()
+            await machine.run(program)
+
+        start = time.monotonic()
+        asyncio.run(run())
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertListEqual(self._call_lists()['Top'], [])
+
+    def test_suspend_resume(self):
+        clock.configure()
+        machine = AsyncMachine()
+        program = Parser().parse("""
+            units raw assign n 0
+            repeat 3 with i from 1 to 3 begin
+                assign n {n + i}
+                time 100 hue i set "Top"
+            end
+        """)
+
+        async def run():
+            threading.Timer(0.15, machine.suspend).start()
+            await machine.run(program)
+
+        asyncio.run(run())
+        self.assertTrue(machine.is_suspended)
+        self.assertEqual(machine.get_variable('n'), 3)
+        self.assertEqual(len(self._call_lists()['Top']), 1)
+        asyncio.run(machine.resume())
+        self.assertEqual(machine.get_variable('n'), 6)
+        self.assertListEqual(
+            [call[1][0][0] for call in self._call_lists()['Top']], [2, 3])
+
+    def test_checkpoint(self):
+        clock.configure()
+        job = ScriptJob.from_string("""
+            units raw
+            repeat 3 with i from 1 to 3 begin
+                time 100 hue i set "Top"
+            end
+        """, True)
+        threading.Timer(0.15, job.request_suspend).start()
+        job.execute()
+        self.assertTrue(job.is_suspended())
+        checkpoint = job.checkpoint()
+
+        restored = ScriptJob.from_checkpoint(checkpoint, True)
+        self.assertTrue(restored.is_suspended())
+        restored.resume()
+        self.assertFalse(restored.is_suspended())
+        self.assertListEqual(
+            [call[1][0][0] for call in self._call_lists()['Top']], [1, 2, 3])
+
+    def test_script_job(self):
+        job = ScriptJob.from_string(
+            'units raw hue 1 saturation 2 brightness 3 kelvin 4 set "Top"',
+            True)
+        self.assertTrue(job.is_async)
+        asyncio.run(job.execute_async())
+        job.execute()
+        self.assertListEqual(
+            self._call_lists()['Top'],
+            [(Action.SET_COLOR, ([1, 2, 3, 4], 0))] * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 
+import pickle
 import unittest
 from bardolph.vm.call_stack import CallStack
+from bardolph.vm.vm_codes import LoopVar
 
 class CallStackTest(unittest.TestCase):
     def test_push_pop(self):
@@ -28,6 +30,51 @@ class CallStackTest(unittest.TestCase):
         stack.reset()
         self.assertIsNone(stack.get_variable('a'))
 
+    def test_slots(self):
+        stack = CallStack()
+        a = stack.global_index('a')
+        stack.put_global(a, 1)
+        self.assertEqual(stack.get_variable('a'), 1)
+
+        # Inside a routine, a local falls back to the global of the same
+        # name, and a write goes to the global once it has been assigned.
+        layout = {'a': 0, 'b': 1}
+        b = stack.global_index('b')
+        stack.put_param_slot(layout, 1, 2)
+        stack.push_frame(layout, 7)
+        self.assertEqual(stack.get_local(0, a), 1)
+        self.assertEqual(stack.get_local(1, b), 2)
+        stack.put_local(0, a, 3)
+        self.assertEqual(stack.get_global(a), 3)
+        stack.put_local(1, b, 4)
+        self.assertIsNone(stack.get_global(b))
+        self.assertEqual(stack.get_variable('b'), 4)
+        self.assertEqual(stack.get_return(), 7)
+
+        stack.pop_current()
+        self.assertIsNone(stack.get_variable('b'))
+        self.assertEqual(stack.get_variable('a'), 3)
+
+    def test_checkpoint(self):
+        stack = CallStack()
+        stack.put_variable('a', 1)
+        stack.global_index('b')
+        stack.enter_loop()
+        stack.put_variable(LoopVar.COUNTER, 5)
+        state = pickle.loads(pickle.dumps(stack.checkpoint()))
+        stack.put_variable('a', 2)
+
+        restored = CallStack()
+        restored.restore(state)
+        self.assertEqual(restored.get_variable('a'), 1)
+        self.assertIsNone(restored.get_variable('b'))
+        self.assertEqual(restored.get_variable(LoopVar.COUNTER), 5)
+
+        # The loop still shares the variables of the enclosing frame.
+        restored.put_variable('c', 3)
+        restored.exit_loop()
+        self.assertEqual(restored.get_variable('c'), 3)
+
 
 if __name__ == '__main__':
     unittest.main()
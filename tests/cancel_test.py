@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+from datetime import datetime, timedelta
+import time
+import unittest
+
+from bardolph.controller import i_controller
+from bardolph.controller.script_job import ScriptJob
+from bardolph.lib import clock
+from bardolph.lib.cancel_token import CancelToken
+from bardolph.lib.injection import provide
+from bardolph.lib.job_control import JobControl
+
+from . import test_module
+
+# Longest acceptable time between a request to stop and the end of the job.
+_MAX_STOP_LATENCY = 0.05
+
+
+class CancelTest(unittest.TestCase):
+    def setUp(self):
+        test_module.configure()
+        clock.configure()
+        self._lifx = provide(i_controller.Lifx)
+
+    def _call_count(self):
+        # Commands to all lights are recorded by the Lifx, not the lights.
+        return len(self._lifx.get_call_list()) + sum(
+            len(light.get_call_list()) for light in self._lifx.get_lights())
+
+    def _assert_quick_stop(self, script):
+        for use_async in (False, True):
+            j_control = JobControl(use_async=use_async)
+            j_control.add_job(ScriptJob.from_string(script, use_async))
+            max_wait = 100
+            while j_control.stats.started == 0 and max_wait > 0:
+                time.sleep(0.01)
+                max_wait -= 1
+            # Let the job get into the wait.
+            time.sleep(0.1)
+            self.assertTrue(j_control.stop_current())
+            max_wait = 100
+            while j_control.has_jobs() and max_wait > 0:
+                time.sleep(0.01)
+                max_wait -= 1
+            self.assertFalse(j_control.has_jobs())
+            self.assertEqual(j_control.stats.stopped, 1)
+            self.assertLess(j_control.stats.max_stop, _MAX_STOP_LATENCY)
+            self.assertEqual(self._call_count(), 0)
+
+    def test_token(self):
+        token = CancelToken()
+        calls = []
+        token.add_callback(lambda: calls.append('first'))
+        removed = lambda: calls.append('removed')
+        token.add_callback(removed)
+        token.remove_callback(removed)
+        self.assertFalse(token.is_cancelled)
+        self.assertIsNone(token.cancelled_at)
+
+        token.cancel()
+        token.cancel()
+        self.assertTrue(token.is_cancelled)
+        self.assertIsNotNone(token.cancelled_at)
+        token.add_callback(lambda: calls.append('late'))
+        self.assertListEqual(calls, ['first', 'late'])
+
+    def test_stop_wait(self):
+        self._assert_quick_stop('time 600 on all')
+
+    def test_stop_time_pattern(self):
+        # A time of day that won't come around during the test.
+        later = datetime.now() + timedelta(hours=2)
+        self._assert_quick_stop(
+            'time at {}:{:02d} on all'.format(later.hour, later.minute))
+
+    def test_stop_before_start(self):
+        for use_async in (False, True):
+            job = ScriptJob.from_string('on all time 1 off all', use_async)
+            job.request_stop()
+            start = time.monotonic()
+            job.execute()
+            self.assertLess(time.monotonic() - start, _MAX_STOP_LATENCY)
+            self.assertEqual(self._call_count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,32 +1,27 @@
 #!/usr/bin/env python3
 
+import asyncio
+from datetime import datetime
+import threading
+import time
 import unittest
 from unittest.mock import patch
 
 from bardolph.lib import clock, injection, settings, time_pattern
 
 class MockNow:
-    def __init__(self, hour, minute):
-        self._hour = hour
-        self._minute = minute
-
-    @property
-    def hour(self):
-        self._minute += 1
-        if self._minute == 60:
-            self._minute = 0
-            self._hour += 1
-            if self._hour == 24:
-                self._hour = 0
-        return self._hour
-        
-    @property
-    def minute(self):
-        return self._minute
-    
-    def time_equals(self, hour, minute):
-        return hour == self._hour and minute == self._minute
-        
+    """
+    Returns each of the given times in turn from now(), and then keeps
+    returning the last one.
+    """
+    def __init__(self, *times):
+        self._times = list(times)
+
+    def now(self):
+        if len(self._times) > 1:
+            return self._times.pop(0)
+        return self._times[0]
+
 
 class ClockTest(unittest.TestCase):
     def setUp(self):
@@ -45,26 +40,150 @@ class ClockTest(unittest.TestCase):
             self.assertAlmostEqual(delta, self._precision, 1)
             time_0 = time_1
         clk.stop()
+
+    def test_pause_for(self):
+        clk = clock.Clock()
+        clk.start()
+        for _ in range(5):
+            clk.pause_for(0.05)
+        self.assertAlmostEqual(clk.et(), 0.25, 1)
+        self.assertGreaterEqual(clk.et(), 0.25)
+        clk.stop()
+
+    def test_stop(self):
+        clk = clock.Clock()
+        clk.start()
+        threading.Timer(0.05, clk.stop).start()
+        clk.pause_for(60.0)
+        self.assertLess(clk.et(), 1.0)
+
+    def test_stop_cancels_timer(self):
+        # A wait cut short doesn't leave its deadline behind in the heap.
+        heap = clock.TimerHeap.get_instance()
+        size = heap.size
+        for _ in range(20):
+            clk = clock.Clock()
+            clk.start()
+            threading.Timer(0.01, clk.stop).start()
+            clk.pause_for(3600.0)
+        time.sleep(0.05)
+        self.assertLessEqual(heap.size, size)
+
+        wakeups = heap.wakeups
+        time.sleep(0.2)
+        self.assertEqual(heap.wakeups, wakeups)
+
+    def test_suspend(self):
+        clk = clock.Clock()
+        clk.start()
+        threading.Timer(0.1, clk.suspend).start()
+        clk.pause_for(0.3)
+        time.sleep(0.2)
+        clk.resume()
+        self.assertAlmostEqual(clk.et(), 0.1, 1)
+
+        # The rest of the interrupted pause.
+        start = time.monotonic()
+        clk.pause_for(0)
+        self.assertAlmostEqual(time.monotonic() - start, 0.2, 1)
+        self.assertGreaterEqual(clk.et(), 0.3)
+        clk.stop()
+
+    def test_concurrent(self):
+        # Many clocks share the one timer thread.
+        delays = [0.02 * i for i in range(1, 21)]
+        results = {}
+
+        def run(delay):
+            clk = clock.Clock()
+            clk.start()
+            clk.pause_for(delay)
+            results[delay] = clk.et()
+
+        threads = [threading.Thread(target=run, args=(delay,))
+                   for delay in reversed(delays)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for delay in delays:
+            self.assertGreaterEqual(results[delay], delay)
+            self.assertLess(results[delay], delay + 0.1)
            
     @patch('bardolph.lib.clock.datetime')
     def test_time_pattern(self, patch_datetime):
-        mock_now = MockNow(9, 55)
-        patch_datetime.now = lambda: mock_now
-        
+        # Sleeps once, straight to the matching minute.
+        patch_datetime.now = MockNow(
+            datetime(2020, 1, 1, 9, 59, 59, 900000),
+            datetime(2020, 1, 1, 10, 0, 0)).now
         clk = clock.Clock()
         clk.start()
-        
+        start = time.monotonic()
         clk.wait_until(time_pattern.TimePattern.from_string('10:*'))
-        self.assertTrue(mock_now.time_equals(10, 0))
-        
-        clk.wait_until(time_pattern.TimePattern.from_string('10:1*'))
-        self.assertTrue(mock_now.time_equals(10, 10))
-        
+        elapsed = time.monotonic() - start
+        self.assertGreaterEqual(elapsed, 0.1)
+        self.assertLess(elapsed, 0.5)
+
+        # Already matches: returns immediately.
+        patch_datetime.now = MockNow(datetime(2020, 1, 1, 10, 15, 30)).now
+        start = time.monotonic()
         clk.wait_until(time_pattern.TimePattern.from_string('10:*5'))
-        self.assertTrue(mock_now.time_equals(10, 15))
-        
+        self.assertLess(time.monotonic() - start, 0.1)
         clk.stop()
 
+    @patch('bardolph.lib.clock.datetime')
+    def test_wait_until_stop(self, patch_datetime):
+        patch_datetime.now = MockNow(datetime(2020, 1, 1, 9, 0)).now
+        clk = clock.Clock()
+        clk.start()
+        threading.Timer(0.05, clk.stop).start()
+        start = time.monotonic()
+        clk.wait_until(time_pattern.TimePattern.from_string('21:00'))
+        self.assertLess(time.monotonic() - start, 1.0)
+
+    def test_async_pause_for(self):
+        async def run():
+            clk = clock.AsyncClock()
+            clk.start()
+            for _ in range(5):
+                await clk.pause_for(0.05)
+            return clk.et()
+
+        elapsed = asyncio.run(run())
+        self.assertGreaterEqual(elapsed, 0.25)
+        self.assertAlmostEqual(elapsed, 0.25, 1)
+
+    def test_async_concurrent(self):
+        # Many clocks wait at the same time on one event loop.
+        delays = [0.01 * i for i in range(1, 201)]
+
+        async def run(delay):
+            clk = clock.AsyncClock()
+            clk.start()
+            await clk.pause_for(delay)
+            return clk.et()
+
+        async def run_all():
+            return await asyncio.gather(*(run(delay) for delay in delays))
+
+        start = time.monotonic()
+        results = asyncio.run(run_all())
+        self.assertLess(time.monotonic() - start, max(delays) + 0.5)
+        for delay, result in zip(delays, results):
+            self.assertGreaterEqual(result, delay)
+            self.assertLess(result, delay + 0.2)
+
+    def test_async_stop(self):
+        clk = clock.AsyncClock()
+
+        async def run():
+            clk.start()
+            threading.Timer(0.05, clk.stop).start()
+            await clk.pause_for(60.0)
+            return clk.et()
+
+        self.assertLess(asyncio.run(run()), 1.0)
+
 
 if __name__ == '__main__':
     unittest.main()
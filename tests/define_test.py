@@ -33,6 +33,16 @@ class DefineTest(unittest.TestCase):
         self._runner.test_code(
             script, 'Top', [(Action.SET_COLOR, ([1, 2, 3, 4], 500))])
 
+    def test_define_in_expression(self):
+        script = """
+            units raw define x 500 define y 2
+            define f with z begin hue {z * y} set "Top" end
+            saturation 1 brightness 2 kelvin 3 duration {x + 1}
+            f x
+        """
+        self._runner.test_code(
+            script, 'Top', [(Action.SET_COLOR, ([1000, 1, 2, 3], 501))])
+
     def test_assign_registers(self):
         script = """
             assign y 0
@@ -180,6 +190,35 @@ class DefineTest(unittest.TestCase):
             (Action.SET_COLOR, ([50, 0, 0, 0], 0))
         ])
 
+    def test_local_becomes_global(self):
+        script = """
+            # A variable assigned inside a routine is local until a global of
+            # the same name exists.
+
+            units raw saturation 1 brightness 2 kelvin 3
+            define f with n begin
+                assign t n
+                repeat 2 with i from 1 to 2 begin assign t {t + i} end
+                hue t set "Top"
+            end
+
+            f 10
+            assign t 0
+            f 20
+            hue t set "Top"
+            assign n 5
+            f 30
+            hue n set "Top"
+        """
+        self._runner.run_script(script)
+        self._runner.check_call_list('Top', [
+            (Action.SET_COLOR, ([13, 1, 2, 3], 0)),
+            (Action.SET_COLOR, ([23, 1, 2, 3], 0)),
+            (Action.SET_COLOR, ([23, 1, 2, 3], 0)),
+            (Action.SET_COLOR, ([33, 1, 2, 3], 0)),
+            (Action.SET_COLOR, ([5, 1, 2, 3], 0))
+        ])
+
     def test_simple_routines(self):
         script = """
             hue 180 saturation 50 brightness 50 duration 100 time 0 kelvin 0
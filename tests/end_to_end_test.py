@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
 
+import logging
 import unittest
 
-from bardolph.controller import i_controller
+from bardolph.controller import i_controller, light_set, units
 from bardolph.fakes.fake_lifx import Action
+from bardolph.lib import settings
 from bardolph.lib.injection import provide
+from bardolph.vm.vm_codes import Register
 from tests.script_runner import ScriptRunner
 from tests import test_module
 
@@ -57,6 +60,25 @@ class EndToEndTest(unittest.TestCase):
                 expected = []
             self.assertListEqual(light.get_call_list(), expected)
 
+    def test_counted_loop(self):
+        script = """
+            units raw saturation 1 brightness 2 kelvin 3
+            repeat 3 with i from 10 to 30 begin hue i set "Top" end
+            repeat 1 with i from 40 to 50 begin hue i set "Top" end
+            repeat 0 with i from 60 to 70 begin hue i set "Top" end
+        """
+        self._runner.run_script(script)
+        lifx = provide(i_controller.Lifx)
+        for light in lifx.get_lights():
+            if light.get_label() == 'Top':
+                expected = [
+                    (Action.SET_COLOR, ([hue, 1, 2, 3], 0))
+                    for hue in (10, 20, 30, 40)
+                ]
+            else:
+                expected = []
+            self.assertListEqual(light.get_call_list(), expected)
+
     def test_mixed_and(self):
         script = """
             units raw hue 10 saturation 20 brightness 30 kelvin 40
@@ -73,6 +95,38 @@ class EndToEndTest(unittest.TestCase):
         self._runner.test_code(script, 'Strip',
             [(Action.GET_ZONE_COLOR, (5, 6))])
 
+    def test_gradient(self):
+        script = """
+            units raw saturation 100 brightness 200 kelvin 2500 duration 9
+            hue 0 set "Strip" zone 2 6 to hue 400 kelvin 2900
+        """
+        self._runner.test_code(script, 'Strip', [
+            (Action.SET_ZONE_COLORS, (2, [
+                [0, 100, 200, 2500], [100, 100, 200, 2600],
+                [200, 100, 200, 2700], [300, 100, 200, 2800],
+                [400, 100, 200, 2900]], 9))])
+
+    def test_gradient_logical(self):
+        script = """
+            saturation 100 brightness 100 kelvin 2700
+            hue 0 set "Strip" zone 0 15 to hue 337.5 and "Table"
+        """
+        self._runner.run_script(script)
+        lifx = provide(i_controller.Lifx)
+        strip = [light for light in lifx.get_lights()
+                 if light.get_label() == 'Strip'][0]
+        calls = strip.get_call_list()
+        self.assertEqual(len(calls), 1)
+        action, (first_zone, colors, duration) = calls[0]
+        self.assertEqual(action, Action.SET_ZONE_COLORS)
+        self.assertEqual(first_zone, 0)
+        self.assertEqual(duration, 0)
+        self.assertListEqual(
+            [color[0] for color in colors],
+            [units.as_raw(Register.HUE, 22.5 * zone) for zone in range(16)])
+        self._runner.check_call_list(
+            'Table', [(Action.SET_COLOR, ([61439, 65535, 65535, 2700], 0))])
+
     def test_group(self):
         script = """
             units raw
@@ -191,5 +245,24 @@ class EndToEndTest(unittest.TestCase):
             (Action.SET_COLOR, ([6000, 2000, 32768, 0], 1))
         ])
 
+    def test_elide_redundant(self):
+        settings.use_base({
+            'elide_redundant': True,
+            'log_level': logging.ERROR,
+            'single_light_discover': True,
+            'use_fakes': True
+        }).configure()
+        light_set.configure()
+        script = """
+            units raw saturation 1 brightness 2 kelvin 3
+            hue 10 set "Table" hue 10 set "Table" hue 20 set "Table"
+        """
+        self._runner.test_code(script, 'Table', [
+            (Action.SET_COLOR, ([10, 1, 2, 3], 0)),
+            (Action.SET_COLOR, ([20, 1, 2, 3], 0))
+        ])
+        self.assertEqual(
+            provide(i_controller.LightSet).cache_stats.suppressed, 1)
+
 if __name__ == '__main__':
     unittest.main()
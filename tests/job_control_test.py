@@ -1,5 +1,7 @@
 #!/usr/bin/env python
 
+import asyncio
+import threading
 import time
 import unittest.mock
 
@@ -50,6 +52,77 @@ class InfiniteJob(StoppableJob):
             time.sleep(0.01)
 
 
+class BlockingJob(job_control.Job):
+    """ Runs until released, then records the thread it ran on. """
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+        self.thread_name = None
+
+    def execute(self):
+        self.release.wait(5.0)
+        self.thread_name = threading.current_thread().name
+
+
+class SleepingJob(job_control.Job):
+    """ Waits on the event loop without occupying a thread. """
+    def __init__(self, delay):
+        super().__init__()
+        self._delay = delay
+        self.done = False
+
+    async def execute_async(self):
+        await asyncio.sleep(self._delay)
+        self.done = True
+
+
+class SuspendableJob(job_control.Job):
+    """ Counts up until suspended or stopped, and resumes the count. """
+    def __init__(self, call_list):
+        super().__init__()
+        self._call_list = call_list
+        self._suspended = False
+        self._stop_requested = False
+        self.count = 0
+
+    def execute(self):
+        self._call_list.append('execute')
+        self._run()
+
+    def resume(self):
+        self._call_list.append('resume')
+        self._suspended = False
+        self._run()
+
+    def request_suspend(self):
+        self._suspended = True
+        return True
+
+    def is_suspended(self):
+        return self._suspended
+
+    def request_stop(self):
+        self._stop_requested = True
+
+    def _run(self):
+        while not (self._suspended or self._stop_requested):
+            if self.count == 20:
+                return
+            self.count += 1
+            time.sleep(0.01)
+
+
+class LingeringJob(SuspendableJob):
+    """ After being stopped, doesn't finish until released. """
+    def __init__(self, call_list):
+        super().__init__(call_list)
+        self.release = threading.Event()
+
+    def execute(self):
+        super().execute()
+        self.release.wait(1.0)
+
+
 class TrackedJob(StoppableJob):
     def __init__(self, job_id, call_list):
         super().__init__()
@@ -103,5 +176,163 @@ class JobControlTest(unittest.TestCase):
         self.assertEqual(job1.call_count, 1)
         self.assertEqual(job2.call_count, 1)
 
+    def test_reuse_threads(self):
+        j_control = job_control.JobControl(2)
+        jobs = [BlockingJob() for _ in range(6)]
+        for job in jobs:
+            job.release.set()
+            j_control.add_job(job)
+        self.wait_for_threads(j_control)
+        self.assertLessEqual(len({job.thread_name for job in jobs}), 2)
+        self.assertEqual(j_control.stats.started, 6)
+        self.assertEqual(j_control.queue_depth, 0)
+
+    def test_background_limit(self):
+        j_control = job_control.JobControl(3, 2)
+        jobs = [BlockingJob() for _ in range(3)]
+        self.assertIsNotNone(j_control.spawn_job(jobs[0], 'bg 0'))
+        self.assertIsNotNone(j_control.spawn_job(jobs[1], 'bg 1'))
+        self.assertIsNone(j_control.spawn_job(jobs[2], 'bg 2'))
+        self.assertEqual(len(j_control.get_background()), 2)
+
+        # A foreground job still gets a thread.
+        job = TestJob()
+        j_control.add_job(job)
+        max_wait = 100
+        while job.execute.call_count == 0 and max_wait > 0:
+            time.sleep(0.01)
+            max_wait -= 1
+        job.execute.assert_called_once()
+
+        jobs[0].release.set()
+        jobs[1].release.set()
+        self.wait_for_threads(j_control)
+        self.assertIsNotNone(j_control.spawn_job(jobs[2], 'bg 2'))
+        jobs[2].release.set()
+        self.wait_for_threads(j_control)
+
+    def test_background_wait(self):
+        j_control = job_control.JobControl(2, 1, spawn_timeout=5.0)
+        first = BlockingJob()
+        second = BlockingJob()
+        second.release.set()
+        j_control.spawn_job(first, 'first')
+        threading.Timer(0.1, first.release.set).start()
+        self.assertIsNotNone(j_control.spawn_job(second, 'second'))
+        self.wait_for_threads(j_control)
+        self.assertIsNotNone(second.thread_name)
+
+    def test_queue_depth(self):
+        j_control = job_control.JobControl(2)
+        jobs = [BlockingJob() for _ in range(3)]
+        for job in jobs:
+            j_control.add_job(job)
+        max_wait = 100
+        while j_control.stats.started == 0 and max_wait > 0:
+            time.sleep(0.01)
+            max_wait -= 1
+        self.assertEqual(j_control.queue_depth, 2)
+        for job in jobs:
+            job.release.set()
+        self.wait_for_threads(j_control)
+        self.assertEqual(j_control.queue_depth, 0)
+        self.assertGreater(j_control.stats.max_wait, 0.0)
+
+    def test_async(self):
+        j_control = job_control.JobControl(
+            max_background=200, use_async=True)
+        call_list = []
+        for job_num in range(3):
+            j_control.add_job(TrackedJob(job_num, call_list))
+        jobs = [SleepingJob(0.2) for _ in range(200)]
+        threads_before = threading.active_count()
+        start = time.monotonic()
+        for job in jobs:
+            self.assertIsNotNone(j_control.spawn_job(job))
+        self.assertLess(threading.active_count() - threads_before, 10)
+        self.wait_for_threads(j_control)
+        self.assertLess(time.monotonic() - start, 2.0)
+        self.assertTrue(all(job.done for job in jobs))
+        self.assertListEqual(call_list, [0, 1, 2])
+        self.assertEqual(j_control.stats.started, 203)
+
+    def test_priority(self):
+        j_control = job_control.JobControl()
+        blocker = BlockingJob()
+        j_control.add_job(blocker)
+        call_list = []
+        for job_id, priority in (
+                ('bg', job_control.Priority.BACKGROUND),
+                ('sched', job_control.Priority.SCHEDULED),
+                ('int 0', job_control.Priority.INTERACTIVE),
+                ('int 1', job_control.Priority.INTERACTIVE)):
+            j_control.add_job(
+                TrackedJob(job_id, call_list), job_id, priority)
+        self.assertListEqual(
+            [agent.name for agent in j_control.get_queued()],
+            ['int 0', 'int 1', 'sched', 'bg'])
+        blocker.release.set()
+        self.wait_for_threads(j_control)
+        self.assertListEqual(call_list, ['int 0', 'int 1', 'sched', 'bg'])
+        self.assertEqual(
+            j_control.stats_for(job_control.Priority.INTERACTIVE).started, 2)
+        self.assertEqual(j_control.stats.started, 5)
+
+    def test_preempt(self):
+        j_control = job_control.JobControl()
+        call_list = []
+        effect = SuspendableJob(call_list)
+        j_control.add_job(effect, 'effect', job_control.Priority.BACKGROUND)
+        time.sleep(0.05)
+        j_control.add_job(
+            TrackedJob('off', call_list), 'off',
+            job_control.Priority.INTERACTIVE)
+        self.wait_for_threads(j_control)
+        self.assertListEqual(call_list, ['execute', 'off', 'resume'])
+        self.assertEqual(effect.count, 20)
+        background = j_control.stats_for(job_control.Priority.BACKGROUND)
+        self.assertEqual(background.preempted, 1)
+        self.assertEqual(background.started, 2)
+        self.assertLess(
+            j_control.stats_for(job_control.Priority.INTERACTIVE).max_wait,
+            0.1)
+
+    def test_stop_suspended(self):
+        j_control = job_control.JobControl()
+        call_list = []
+        effect = SuspendableJob(call_list)
+        blocker = BlockingJob()
+        j_control.add_job(effect, 'effect', job_control.Priority.BACKGROUND)
+        time.sleep(0.05)
+        j_control.add_job(blocker, 'blocker')
+        max_wait = 100
+        while max_wait > 0 and not (
+                j_control.get_current() is not None
+                and j_control.get_current().job is blocker):
+            time.sleep(0.01)
+            max_wait -= 1
+        self.assertTrue(j_control.stop_job('effect'))
+        blocker.release.set()
+        self.wait_for_threads(j_control)
+        self.assertListEqual(call_list, ['execute'])
+
+    def test_preempt_stopped(self):
+        j_control = job_control.JobControl()
+        call_list = []
+        effect = LingeringJob(call_list)
+        j_control.add_job(effect, 'effect', job_control.Priority.BACKGROUND)
+        time.sleep(0.05)
+        self.assertTrue(j_control.stop_current())
+        j_control.add_job(
+            TrackedJob('off', call_list), 'off',
+            job_control.Priority.INTERACTIVE)
+        effect.release.set()
+        self.wait_for_threads(j_control)
+        self.assertListEqual(call_list, ['execute', 'off'])
+        background = j_control.stats_for(job_control.Priority.BACKGROUND)
+        self.assertEqual(background.started, 1)
+        self.assertEqual(background.preempted, 0)
+        self.assertEqual(j_control.stats.stopped, 1)
+
 if __name__ == "__main__":
     unittest.main()
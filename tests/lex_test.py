@@ -1,21 +1,31 @@
 #!/usr/bin/env python
 
+import io
 import unittest
 
 from bardolph.parser.lex import Lex
 from bardolph.parser.token_types import TokenTypes
 
 class LexTest(unittest.TestCase):
-    def test_token_regex(self):
-        test_input = """word "hello there you " 123.456 -abc- %
+    def test_token_boundaries(self):
+        input_string = """word "hello there you " 123.456 -abc- %
             # comment1 # comment2"""
-        expected_strings = [
-            'word', '"hello there you "', '123.456', '-abc-', '%',
-            '# comment1 # comment2'
+        expected_tokens = [
+            TokenTypes.NAME, TokenTypes.LITERAL_STRING, TokenTypes.NUMBER,
+            TokenTypes.UNKNOWN, TokenTypes.UNKNOWN
         ]
-        actual_strings = [m.string[m.start():m.end()]
-                          for m in Lex.TOKEN_REGEX.finditer(test_input)]
-        self.assertListEqual(actual_strings, expected_strings)
+        expected_strings = ['word', 'hello there you ', '123.456', '-abc-', '%']
+        self._lex_and_compare(input_string, expected_tokens, expected_strings)
+
+    def test_unterminated_string(self):
+        # A quote that isn't closed on the same line isn't a string.
+        input_string = 'set "Top\n"\n"" x'
+        expected_tokens = [
+            TokenTypes.SET, TokenTypes.UNKNOWN, TokenTypes.UNKNOWN,
+            TokenTypes.LITERAL_STRING, TokenTypes.NAME
+        ]
+        expected_strings = ['set', '"Top', '"', '', 'x']
+        self._lex_and_compare(input_string, expected_tokens, expected_strings)
 
     def test_time_pattern(self):
         lexer = Lex('12:34')
@@ -100,6 +110,43 @@ class LexTest(unittest.TestCase):
         ]
         self._lex_and_compare(input_string, expected_tokens, expected_strings)
 
+    def test_positions(self):
+        input_string = 'hue 5 # comment\n\n  set "a b" {x + 1}\n\tzone'
+        expected = [
+            (TokenTypes.REGISTER, 1, 1),
+            (TokenTypes.NUMBER, 1, 5),
+            (TokenTypes.SET, 3, 3),
+            (TokenTypes.LITERAL_STRING, 3, 7),
+            (TokenTypes.EXPRESSION, 3, 13),
+            (TokenTypes.ZONE, 4, 2)
+        ]
+        lexer = Lex(input_string)
+        for token_type, line, column in expected:
+            self.assertEqual(lexer.next_token()[0], token_type)
+            self.assertEqual(lexer.get_line_number(), line)
+            self.assertEqual(lexer.get_column(), column)
+        self.assertEqual(lexer.next_token()[0], TokenTypes.EOF)
+
+    def test_file_input(self):
+        input_string = 'set "Top"\r\nhue 5\non all\n'
+        expected_tokens = [
+            TokenTypes.SET, TokenTypes.LITERAL_STRING, TokenTypes.REGISTER,
+            TokenTypes.NUMBER, TokenTypes.ON, TokenTypes.ALL
+        ]
+        expected_strings = ['set', 'Top', 'hue', '5', 'on', 'all']
+        self._lex_and_compare(
+            io.StringIO(input_string, newline=''), expected_tokens,
+            expected_strings)
+
+    def test_attached_punctuation(self):
+        input_string = '5} hue, "a"c {x}y'
+        expected_tokens = [
+            TokenTypes.UNKNOWN, TokenTypes.UNKNOWN, TokenTypes.LITERAL_STRING,
+            TokenTypes.NAME, TokenTypes.EXPRESSION, TokenTypes.NAME
+        ]
+        expected_strings = ['5}', 'hue,', 'a', 'c', 'x', 'y']
+        self._lex_and_compare(input_string, expected_tokens, expected_strings)
+
     def _lex_and_compare(self, input_string, expected_tokens, expected_strings):
         actual_tokens = []
         actual_strings = []
@@ -1,11 +1,15 @@
 #!/usr/bin/env python
 
+import threading
+import time
 import unittest
 
 from bardolph.controller import i_controller
 from bardolph.controller import light_set
 from bardolph.fakes import fake_lifx
+from bardolph.fakes.fake_lifx import Action
 from bardolph.lib import injection, settings
+from bardolph.lib.cancel_token import CancelToken
 
 class LightSetTest(unittest.TestCase):      
     def setUp(self):
@@ -124,5 +128,322 @@ class LightSetTest(unittest.TestCase):
         location = tested_set.get_location(self._location1)
         self._assert_names_equal(location, self._light1, self._light3)
 
+    def test_membership_index(self):
+        tested_set = light_set.LightSet()
+        tested_set.discover()
+        lifx = injection.provide(i_controller.Lifx)
+        lifx.init_from([
+            (self._light0, self._group1, self._location0, self._color, False),
+            (self._light1, self._group2, self._location0, self._color, False),
+        ])
+        tested_set.discover()
+        self.assertEqual(tested_set._group_index[self._light0], self._group1)
+        self.assertEqual(tested_set._group_index[self._light1], self._group2)
+        self.assertEqual(
+            tested_set._location_index[self._light1], self._location0)
+        self.assertIsNone(tested_set.get_group(self._group0))
+        self._assert_names_equal(
+            tested_set.get_group(self._group1),
+            self._light0, self._light2, self._light3)
+
+        for name in (self._light0, self._light1, self._light2):
+            tested_set.get_light(name)._birth = 0
+        tested_set._garbage_collect()
+        self.assertListEqual(list(tested_set._group_index), [self._light3])
+        self.assertListEqual(list(tested_set.group_names), [self._group1])
+        self.assertListEqual(
+            list(tested_set.location_names), [self._location1])
+
+    def test_state_cache(self):
+        settings.use_base({
+            'single_light_discover': True,
+            'state_cache_ttl': 60,
+            'use_fakes': True
+        }).configure()
+        tested_set = light_set.LightSet()
+        tested_set.discover()
+        stats = tested_set.cache_stats
+        light = tested_set.get_light(self._light0)
+        impl = light._impl
+
+        self.assertListEqual(light.get_color(), self._color)
+        self.assertListEqual(light.get_color(), self._color)
+        self.assertEqual(len(impl.calls_to(Action.GET_COLOR)), 1)
+        self.assertEqual((stats.hits, stats.misses, stats.stale), (1, 1, 0))
+
+        # Write-through, both for a single light and for all lights.
+        color = [10, 20, 30, 40]
+        light.set_color(color, 0)
+        self.assertListEqual(light.get_color(), color)
+        tested_set.set_power(65535, 0)
+        self.assertEqual(light.get_power(), 65535)
+        self.assertEqual(len(impl.calls_to(Action.GET_COLOR)), 1)
+        self.assertEqual(len(impl.calls_to(Action.GET_POWER)), 0)
+
+        # During a transition, the light is read for its current state.
+        light.set_color([1, 2, 3, 4], 1000)
+        light.get_color()
+        tested_set.set_power(0, 1000)
+        light.get_power()
+        self.assertEqual(len(impl.calls_to(Action.GET_COLOR)), 2)
+        self.assertEqual(len(impl.calls_to(Action.GET_POWER)), 1)
+
+        # Expired entries are read from the light again.
+        light._cache._ttl = 0.01
+        time.sleep(0.02)
+        light.get_color()
+        self.assertEqual(len(impl.calls_to(Action.GET_COLOR)), 3)
+        self.assertEqual(stats.stale, 1)
+
+        # Discovery replaces the Light, along with its cache.
+        tested_set.discover()
+        tested_set.get_light(self._light0).get_power()
+        self.assertEqual(len(impl.calls_to(Action.GET_POWER)), 2)
+
+    def test_elide_redundant(self):
+        settings.use_base({
+            'elide_redundant': True,
+            'single_light_discover': True,
+            'state_cache_ttl': 60,
+            'use_fakes': True
+        }).configure()
+        tested_set = light_set.LightSet()
+        tested_set.discover()
+        stats = tested_set.cache_stats
+        light = tested_set.get_light(self._light0)
+        impl = light._impl
+        color = [10, 20, 30, 40]
+
+        light.set_color(color, 0)
+        light.set_color(color, 0)
+        light.set_color([10.1, 20, 30, 40], 0)
+        light.set_power(65535, 0)
+        light.set_power(65535, 0)
+        self.assertEqual(len(impl.calls_to(Action.SET_COLOR)), 1)
+        self.assertEqual(len(impl.calls_to(Action.SET_POWER)), 1)
+        self.assertEqual(stats.suppressed, 3)
+
+        # Repeating a command during its transition isn't redundant.
+        light.set_color([1, 2, 3, 4], 60000)
+        light.set_color([1, 2, 3, 4], 60000)
+        self.assertEqual(len(impl.calls_to(Action.SET_COLOR)), 3)
+
+        # A state read from the light also allows a command to be skipped.
+        impl._power = 12345
+        light.invalidate_cache()
+        light.get_power()
+        light.set_power(12345, 0)
+        self.assertEqual(len(impl.calls_to(Action.SET_POWER)), 1)
+
+        # Turning the power off is always sent.
+        light.set_power(0, 0)
+        light.set_power(0, 0)
+        self.assertEqual(len(impl.calls_to(Action.SET_POWER)), 3)
+
+        # Setting all lights is skipped only if every light is already there.
+        lifx = injection.provide(i_controller.Lifx)
+        tested_set.set_color(color, 0)
+        tested_set.set_color(color, 0)
+        self.assertEqual(len(lifx.calls_to(Action.SET_COLOR)), 1)
+        light.set_color([5, 5, 5, 5], 0)
+        tested_set.set_color(color, 0)
+        self.assertEqual(len(lifx.calls_to(Action.SET_COLOR)), 2)
+
+    def test_external_change(self):
+        settings.use_base({
+            'elide_redundant': True,
+            'single_light_discover': True,
+            'state_cache_ttl': 60,
+            'use_fakes': True
+        }).configure()
+        tested_set = light_set.LightSet()
+        tested_set.discover()
+        light = tested_set.get_light(self._light0)
+        impl = light._impl
+        color = [10, 20, 30, 40]
+
+        # The light is changed by something else, such as a phone app or a
+        # wall switch. Once a read shows the change, the next command is
+        # sent, even though it repeats the previous one.
+        light.set_color(color, 0)
+        light.set_power(65535, 0)
+        impl._color = [1, 2, 3, 4]
+        impl._power = 0
+        light.invalidate_cache()
+        light.get_color()
+        light.get_power()
+        light.set_color(color, 0)
+        light.set_power(65535, 0)
+        self.assertEqual(len(impl.calls_to(Action.SET_COLOR)), 2)
+        self.assertEqual(len(impl.calls_to(Action.SET_POWER)), 2)
+        self.assertListEqual(impl._color, color)
+        self.assertEqual(impl._power, 65535)
+
+    def test_elide_zones(self):
+        settings.use_base({
+            'elide_redundant': True,
+            'single_light_discover': True,
+            'state_cache_ttl': 60,
+            'use_fakes': True
+        }).configure()
+        lifx = injection.provide(i_controller.Lifx)
+        lifx.init_from([('Strip', 'Group', 'Location', self._color, True)])
+        tested_set = light_set.LightSet()
+        tested_set.discover()
+        light = tested_set.get_light('Strip')
+        impl = light._impl
+        color = [10, 20, 30, 40]
+
+        light.set_zone_color(2, 6, color, 0)
+        light.set_zone_color(3, 5, color, 0)
+        light.set_zone_color(3, 7, color, 0)
+        self.assertEqual(len(impl.calls_to(Action.SET_ZONE_COLOR)), 2)
+
+        light.set_color(color, 0)
+        light.set_zone_color(0, 16, color, 0)
+        self.assertEqual(len(impl.calls_to(Action.SET_ZONE_COLOR)), 2)
+        light.set_color(color, 0)
+        self.assertEqual(len(impl.calls_to(Action.SET_COLOR)), 1)
+
+        light.set_zone_color(0, 1, [1, 1, 1, 1], 0)
+        light.set_color(color, 0)
+        self.assertEqual(len(impl.calls_to(Action.SET_COLOR)), 2)
+
+        # A read of the zones shows their colors.
+        light.set_zone_color(0, 2, self._color, 0)
+        self.assertEqual(len(impl.calls_to(Action.SET_ZONE_COLOR)), 4)
+        light.invalidate_cache()
+        light.get_color_zones(0, 16)
+        light.set_zone_color(3, 5, color, 0)
+        light.set_zone_color(0, 2, self._color, 0)
+        self.assertEqual(len(impl.calls_to(Action.SET_ZONE_COLOR)), 4)
+
+    def test_elide_zone_colors(self):
+        settings.use_base({
+            'elide_redundant': True,
+            'single_light_discover': True,
+            'state_cache_ttl': 60,
+            'use_fakes': True
+        }).configure()
+        lifx = injection.provide(i_controller.Lifx)
+        lifx.init_from([('Strip', 'Group', 'Location', self._color, True)])
+        tested_set = light_set.LightSet()
+        tested_set.discover()
+        light = tested_set.get_light('Strip')
+        impl = light._impl
+        colors = [[10, 20, 30, 40], [50, 60, 70, 80], [90, 100, 110, 120]]
+
+        light.set_zone_colors(4, colors, 0)
+        self.assertListEqual(
+            impl.get_call_list(),
+            [(Action.SET_ZONE_COLORS, (4, colors, 0))])
+        light.set_zone_colors(4, colors, 0)
+        light.set_zone_color(5, 6, colors[1], 0)
+        self.assertEqual(len(impl.calls_to(Action.SET_ZONE_COLORS)), 1)
+        self.assertEqual(len(impl.calls_to(Action.SET_ZONE_COLOR)), 0)
+
+        light.set_zone_colors(5, colors, 0)
+        self.assertEqual(len(impl.calls_to(Action.SET_ZONE_COLORS)), 2)
+
+        # A read that disagrees means that the zones were changed by
+        # something else.
+        impl.set_zone_color(0, 16, self._color, 0)
+        light.invalidate_cache()
+        self.assertListEqual(light.get_color_zones(5, 8), [self._color] * 3)
+        light.set_zone_colors(5, colors, 0)
+        self.assertEqual(len(impl.calls_to(Action.SET_ZONE_COLORS)), 3)
+
+    def test_set_color_multiple(self):
+        tested_set = light_set.LightSet()
+        tested_set.discover()
+        color = [10, 20, 30, 40]
+        lights = tested_set.get_group(self._group0)
+        results = tested_set.set_color_multiple(lights, color, 5)
+        self.assertEqual(len(results), 2)
+        for light, result in results:
+            self.assertTrue(result)
+            self.assertListEqual(
+                light._impl.get_call_list(),
+                [(Action.SET_COLOR, (color, 5))])
+
+    def test_dispatch_concurrent(self):
+        tested_set = light_set.LightSet()
+        tested_set.discover()
+        delay = 0.2
+
+        def slow_command(light):
+            time.sleep(delay)
+            return light.name
+
+        lights = list(tested_set.lights)
+        start = time.time()
+        results = tested_set.dispatch(
+            [(light, slow_command) for light in lights])
+        elapsed = time.time() - start
+        self.assertLess(elapsed, delay * len(lights) / 2)
+        self.assertListEqual(
+            results, [(light, light.name) for light in lights])
+
+    def _init_slow_lights(self, latency, slowest_latency):
+        lifx = injection.provide(i_controller.Lifx)
+        lifx.init_from([
+            (self._light0, self._group0, self._location0, self._color, False,
+                latency),
+            (self._light1, self._group0, self._location1, self._color, False,
+                latency),
+            (self._light2, self._group1, self._location0, self._color, False,
+                latency),
+            (self._light3, self._group1, self._location1, self._color, False,
+                slowest_latency)
+        ])
+
+    def test_discover_parallel(self):
+        # Probing each light makes 4 queries.
+        latency = 0.05
+        self._init_slow_lights(latency, latency)
+        tested_set = light_set.LightSet()
+        start = time.time()
+        self.assertTrue(tested_set.discover())
+        elapsed = time.time() - start
+        self.assertLess(elapsed, latency * 4 * 4 / 2)
+        self.assertEqual(len(tested_set.light_names), 4)
+        self.assertEqual(tested_set.successful_discovers, 1)
+
+    def test_discover_async(self):
+        latency = 0.02
+        self._init_slow_lights(latency, latency * 10)
+        tested_set = light_set.LightSet()
+        tested_set.discover_async()
+        self.assertTrue(tested_set.is_discovering)
+
+        # The fast lights are available before the slow one.
+        self.assertTrue(
+            tested_set.wait_for_lights([self._light0, self._light2], 5.0))
+        self.assertIsNone(tested_set.get_light(self._light3))
+        self.assertTrue(tested_set.is_discovering)
+
+        self.assertTrue(tested_set.wait_for_lights([self._light3], 5.0))
+        self.assertTrue(tested_set.wait_for_lights(None, 5.0))
+        self.assertFalse(tested_set.is_discovering)
+        self._assert_names_equal(
+            tested_set.get_group(self._group1), self._light2, self._light3)
+
+        # Once discovery is over, a missing light doesn't cause a wait.
+        start = time.time()
+        self.assertFalse(tested_set.wait_for_lights(['missing'], 5.0))
+        self.assertLess(time.time() - start, 1.0)
+
+    def test_wait_cancelled(self):
+        latency = 0.02
+        self._init_slow_lights(latency, 0.5)
+        tested_set = light_set.LightSet()
+        tested_set.discover_async()
+        token = CancelToken()
+        threading.Timer(0.05, token.cancel).start()
+        start = time.time()
+        self.assertFalse(
+            tested_set.wait_for_lights([self._light3], 5.0, token))
+        self.assertLess(time.time() - start, 0.05 + 0.05)
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,13 +1,21 @@
 #!/usr/bin/env python3
 
+import os
+import tempfile
+import threading
+import time
 import unittest
 
 from bardolph.controller import i_controller
 from bardolph.controller.units import UnitMode
+from bardolph.lib import clock
 from bardolph.lib.injection import provide
+from bardolph.parser.parse import Parser
+from bardolph.vm.checkpoint import Checkpoint
 from bardolph.vm.instruction import Instruction
-from bardolph.vm.machine import Machine
-from bardolph.vm.vm_codes import OpCode, Operand, Register
+from bardolph.vm.machine import Machine, Registers
+from bardolph.vm.vm_codes import JumpCondition, LoopVar, OpCode, Operand
+from bardolph.vm.vm_codes import Operator, Register
 
 from . import test_module
 
@@ -76,6 +84,183 @@ class MachineTest(unittest.TestCase):
         light_set = provide(i_controller.LightSet)
         light = light_set.get_light(name)._impl
         self.assertTrue(light.was_set(color))
+    def test_jump(self):
+        program = [
+            Instruction(OpCode.MOVEQ, 1, 'x'),
+            Instruction(OpCode.MOVEQ, False, Register.RESULT),
+            Instruction(OpCode.JUMP, JumpCondition.IF_TRUE, 3),
+            Instruction(OpCode.MOVEQ, 2, 'x'),
+            Instruction(OpCode.JUMP, JumpCondition.ALWAYS, 2),
+            Instruction(OpCode.MOVEQ, 3, 'x'),
+            Instruction(OpCode.MOVEQ, True, Register.RESULT),
+            Instruction(OpCode.JUMP, JumpCondition.IF_FALSE, 2),
+            Instruction(OpCode.MOVEQ, 4, 'y')
+        ]
+        machine = Machine()
+        machine.run(program)
+        self.assertEqual(machine.get_variable('x'), 2)
+        self.assertEqual(machine.get_variable('y'), 4)
+
+    def test_dec_branch(self):
+        program = [
+            Instruction(OpCode.MOVEQ, 10, 'x'),
+            Instruction(OpCode.LOOP),
+            Instruction(OpCode.MOVEQ, 3, LoopVar.COUNTER),
+            Instruction(OpCode.MOVEQ, 5, LoopVar.INCR),
+            Instruction(OpCode.ADD_INCR, 'x'),
+            Instruction(OpCode.DEC_BRANCH, LoopVar.COUNTER, -1),
+            Instruction(OpCode.MOVE, LoopVar.COUNTER, 'y'),
+            Instruction(OpCode.END_LOOP)
+        ]
+        machine = Machine()
+        machine.run(program)
+        self.assertEqual(machine.get_variable('x'), 25)
+        self.assertEqual(machine.get_variable('y'), 0)
+
+    def test_undefined_routine(self):
+        program = [
+            Instruction(OpCode.MOVEQ, 1, 'x'),
+            Instruction(OpCode.JSR, 'undefined'),
+            Instruction(OpCode.MOVEQ, 2, 'x')
+        ]
+        machine = Machine()
+        with self.assertLogs(level='ERROR'):
+            machine.run(program)
+        self.assertEqual(machine.get_variable('x'), 1)
+
+    def test_registers(self):
+        reg = Registers()
+        for value, register in enumerate(Register):
+            reg.set_by_enum(register, value)
+        for value, register in enumerate(Register):
+            self.assertEqual(reg.get_by_enum(register), value)
+            self.assertEqual(getattr(reg, register.name.lower()), value)
+        reg.hue = 100
+        self.assertEqual(reg.get_by_enum(Register.HUE), 100)
+        reg.reset()
+        self.assertEqual(reg.unit_mode, UnitMode.LOGICAL)
+        with self.assertRaises(AttributeError):
+            reg.undefined = 0
+
+    def test_register_ops(self):
+        program = [
+            Instruction(OpCode.MOVEQ, 5, Register.HUE),
+            Instruction(OpCode.MOVE, Register.HUE, Register.SATURATION),
+            Instruction(OpCode.PUSH, Register.SATURATION),
+            Instruction(OpCode.PUSHQ, 2),
+            Instruction(OpCode.OP, Operator.MUL),
+            Instruction(OpCode.POP, Register.BRIGHTNESS),
+            Instruction(OpCode.MOVE, Register.BRIGHTNESS, 'x')
+        ]
+        machine = Machine()
+        machine.run(program)
+        self.assertListEqual(machine.color_from_reg(), [5, 5, 10, 0])
+        self.assertEqual(machine.get_variable('x'), 10)
+
+    def test_stop(self):
+        program = [
+            Instruction(OpCode.MOVEQ, 1, 'x'),
+            Instruction(OpCode.STOP),
+            Instruction(OpCode.MOVEQ, 2, 'x')
+        ]
+        machine = Machine()
+        machine.run(program)
+        self.assertEqual(machine.get_variable('x'), 1)
+
+    def test_suspend_resume(self):
+        clock.configure()
+        light = next(light for light in provide(i_controller.Lifx).get_lights()
+                     if light.get_label() == "Test g1 l1")
+        program = Parser().parse("""
+            units raw assign n 0
+            repeat 3 with i from 1 to 3 begin
+                assign n {n + i}
+                time 100 hue i set "Test g1 l1"
+            end
+        """)
+        machine = Machine()
+        thread = threading.Thread(target=machine.run, args=(program,))
+        thread.start()
+        time.sleep(0.15)
+        self.assertTrue(machine.suspend())
+        thread.join(1.0)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(machine.is_suspended)
+        self.assertEqual(len(light.get_call_list()), 1)
+        self.assertEqual(machine.get_variable('n'), 3)
+
+        time.sleep(0.2)
+        self.assertEqual(len(light.get_call_list()), 1)
+        machine.resume()
+        self.assertFalse(machine.is_suspended)
+        self.assertEqual(machine.get_variable('n'), 6)
+        self.assertListEqual(
+            [call[1][0][0] for call in light.get_call_list()], [1, 2, 3])
+
+    def test_suspend_pending(self):
+        clock.configure()
+        program = [
+            Instruction(OpCode.MOVEQ, 1, 'x'),
+            Instruction(OpCode.MOVEQ, 2, 'y')
+        ]
+        machine = Machine()
+        self.assertTrue(machine.suspend())
+        machine.run(program)
+        self.assertTrue(machine.is_suspended)
+        self.assertIsNone(machine.get_variable('x'))
+        machine.resume()
+        self.assertFalse(machine.is_suspended)
+        self.assertEqual(machine.get_variable('y'), 2)
+
+        # A reset discards a suspend that hasn't taken effect.
+        machine.suspend()
+        machine.reset()
+        machine.run(program)
+        self.assertFalse(machine.is_suspended)
+        self.assertEqual(machine.get_variable('y'), 2)
+
+        machine.cancel_token.cancel()
+        self.assertFalse(machine.suspend())
+
+    def test_checkpoint(self):
+        clock.configure()
+        light = next(light for light in provide(i_controller.Lifx).get_lights()
+                     if light.get_label() == "Test g1 l1")
+        program = Parser().parse("""
+            units raw
+            define show with x begin
+                repeat 2 with j from 0 to 1 begin
+                    time 50 hue {x * 10 + j} set "Test g1 l1"
+                end
+            end
+            assign n 0
+            repeat 3 with i from 1 to 3 begin
+                assign n {n + i}
+                show i
+            end
+        """)
+        machine = Machine()
+        thread = threading.Thread(target=machine.run, args=(program,))
+        thread.start()
+        time.sleep(0.13)
+        self.assertIsNone(machine.checkpoint())
+        machine.suspend()
+        thread.join(1.0)
+        checkpoint = machine.checkpoint()
+        self.assertIsNotNone(checkpoint)
+
+        # Continue from a copy of the checkpoint, on a different machine.
+        file_name = os.path.join(tempfile.mkdtemp(), 'checkpoint')
+        checkpoint.save(file_name)
+        restored = Machine()
+        restored.restore(Checkpoint.load(file_name))
+        self.assertTrue(restored.is_suspended)
+        self.assertEqual(restored.get_variable('n'), 3)
+        restored.resume()
+        self.assertEqual(restored.get_variable('n'), 6)
+        self.assertListEqual(
+            [call[1][0][0] for call in light.get_call_list()],
+            [10, 11, 20, 21, 30, 31])
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+
+import unittest
+
+from bardolph.controller import i_controller
+from bardolph.controller.script_job import ScriptJob
+from bardolph.lib import settings
+from bardolph.lib.injection import provide
+from bardolph.parser.optimizer import Optimizer
+from bardolph.parser.parse import Parser
+from bardolph.vm.instruction import Instruction
+from bardolph.vm.machine import Machine
+from bardolph.vm.vm_codes import JumpCondition, LoopVar, OpCode, Operator
+from bardolph.vm.vm_codes import Register
+
+from . import test_module
+
+class OptimizerTest(unittest.TestCase):
+    def setUp(self):
+        test_module.configure()
+        self._lifx = provide(i_controller.Lifx)
+
+    def _calls(self, program):
+        for light in self._lifx.get_lights():
+            light.clear()
+        Machine().run(program)
+        return {
+            light.get_label(): list(light.get_call_list())
+            for light in self._lifx.get_lights()
+        }
+
+    def test_fold(self):
+        optimizer = Optimizer()
+        program = optimizer.optimize([
+            Instruction(OpCode.PUSH, 17),
+            Instruction(OpCode.PUSHQ, 23),
+            Instruction(OpCode.OP, Operator.ADD),
+            Instruction(OpCode.PUSHQ, 2),
+            Instruction(OpCode.OP, Operator.MUL),
+            Instruction(OpCode.OP, Operator.USUB),
+            Instruction(OpCode.POP, Register.HUE)
+        ])
+        self.assertListEqual(program, [
+            Instruction(OpCode.MOVEQ, -80, Register.HUE)
+        ])
+        self.assertEqual(optimizer.stats.removed, 6)
+
+    def test_no_fold(self):
+        # Division by zero is left to be reported at run time.
+        program = [
+            Instruction(OpCode.PUSHQ, 1),
+            Instruction(OpCode.PUSHQ, 0),
+            Instruction(OpCode.OP, Operator.DIV),
+            Instruction(OpCode.POP, Register.HUE)
+        ]
+        self.assertEqual(len(Optimizer().optimize(program)), 4)
+
+    def test_move(self):
+        program = Optimizer().optimize([
+            Instruction(OpCode.PUSH, 'x'),
+            Instruction(OpCode.POP, Register.SATURATION),
+            Instruction(OpCode.PUSHQ, 5),
+            Instruction(OpCode.POP, LoopVar.COUNTER)
+        ])
+        self.assertListEqual(program, [
+            Instruction(OpCode.MOVE, 'x', Register.SATURATION),
+            Instruction(OpCode.MOVEQ, 5, LoopVar.COUNTER)
+        ])
+
+    def test_fuse(self):
+        program = Optimizer().optimize([
+            Instruction(OpCode.PUSH, LoopVar.COUNTER),
+            Instruction(OpCode.PUSHQ, 0),
+            Instruction(OpCode.OP, Operator.GT),
+            Instruction(OpCode.POP, Register.RESULT),
+            Instruction(OpCode.JUMP, JumpCondition.IF_FALSE, 2),
+            Instruction(OpCode.COLOR)
+        ])
+        self.assertListEqual(program, [
+            Instruction(OpCode.TEST, Operator.GT, LoopVar.COUNTER, 0),
+            Instruction(OpCode.JUMP, JumpCondition.IF_FALSE, 2),
+            Instruction(OpCode.COLOR)
+        ])
+
+    def test_jumps(self):
+        optimizer = Optimizer()
+        program = optimizer.optimize([
+            Instruction(OpCode.JUMP, JumpCondition.IF_TRUE, 3),
+            Instruction(OpCode.COLOR),
+            Instruction(OpCode.JUMP, JumpCondition.ALWAYS, 1),
+            Instruction(OpCode.JUMP, JumpCondition.ALWAYS, 3),
+            Instruction(OpCode.POWER),
+            Instruction(OpCode.COLOR),
+            Instruction(OpCode.WAIT)
+        ])
+        # Both jumps go straight to the wait, so nothing between the second
+        # one and the wait can be reached. Then the second jump is just to the
+        # next instruction.
+        self.assertListEqual(program, [
+            Instruction(OpCode.JUMP, JumpCondition.IF_TRUE, 2),
+            Instruction(OpCode.COLOR),
+            Instruction(OpCode.WAIT)
+        ])
+        self.assertEqual(optimizer.stats.jumps, 1)
+        self.assertEqual(optimizer.stats.dead, 3)
+
+    def test_constants(self):
+        script = """
+            define limit 3 define name "Top"
+            units raw assign x 0
+            repeat while {x < limit} begin
+                hue {x * limit} set name assign x {x + 1}
+            end
+        """
+        program = Parser().parse(script)
+        self.assertIn(Instruction(OpCode.PUSHQ, 3), program)
+        self.assertNotIn(Instruction(OpCode.PUSH, 'limit'), program)
+
+        parser = Parser()
+        optimized = parser.parse(script, True)
+        self.assertEqual(parser.optimizer_stats.constants, 2)
+        self.assertTrue(all(
+            inst.op_code != OpCode.CONSTANT for inst in optimized))
+        self.assertDictEqual(self._calls(optimized), self._calls(program))
+
+    def test_fold_units(self):
+        script = """
+            define f begin units raw hue 1000 set "Bottom" end
+            hue 120 saturation 50 brightness 25 kelvin 2700 duration 1.5
+            repeat 3 begin
+                set "Top"
+                units raw hue 30000 set "Top"
+                units logical hue 120 saturation 50 brightness 25 set "Top"
+            end
+            f set "Top"
+            get "Top" set "Bottom"
+        """
+        parser = Parser()
+        optimized = parser.parse(script, True)
+        colorq = [inst for inst in optimized if inst.op_code == OpCode.COLORQ]
+        # After the call to f and after the get, the registers aren't known.
+        self.assertEqual(parser.optimizer_stats.colors, 3)
+        self.assertEqual(len(colorq), 3)
+        self.assertEqual(
+            colorq[0], Instruction(
+                OpCode.COLORQ, [21845, 32768, 16384, 2700], 1500))
+        self.assertDictEqual(
+            self._calls(optimized), self._calls(Parser().parse(script)))
+
+        # Without knowing the state at the start, nothing is converted.
+        program = Optimizer().optimize([
+            Instruction(OpCode.MOVEQ, 100, Register.HUE),
+            Instruction(OpCode.COLOR)
+        ])
+        self.assertEqual(program[1], Instruction(OpCode.COLOR))
+
+    def test_elide(self):
+        program = Optimizer().optimize([
+            Instruction(OpCode.MOVEQ, 'Top', Register.NAME),
+            Instruction(OpCode.COLOR),
+            Instruction(OpCode.MOVEQ, 'Top', Register.NAME),
+            Instruction(OpCode.COLOR),
+            Instruction(OpCode.MOVEQ, 'Top', Register.NAME),
+            Instruction(OpCode.JUMP, JumpCondition.ALWAYS, -1)
+        ])
+        # The last MOVEQ is the target of a jump, so it stays.
+        self.assertListEqual(program, [
+            Instruction(OpCode.MOVEQ, 'Top', Register.NAME),
+            Instruction(OpCode.COLOR),
+            Instruction(OpCode.COLOR),
+            Instruction(OpCode.MOVEQ, 'Top', Register.NAME),
+            Instruction(OpCode.JUMP, JumpCondition.ALWAYS, -1)
+        ])
+
+    def test_elide_after_routine(self):
+        script = """
+            define f begin set "Bottom" end
+            set "Top" f set "Top"
+        """
+        program = Parser().parse(script, True)
+        self.assertDictEqual(self._calls(program), self._calls(
+            Parser().parse(script)))
+
+    def test_same_behavior(self):
+        script = """
+            units raw saturation 1 brightness 2 kelvin 3 duration 4
+            assign x 5
+            define f with y begin
+                hue {y * 2 + 3 * 4} set "Top"
+                if {y > 10 - 2} begin set "Bottom" end
+                else begin set "Top" end
+            end
+            repeat 4 with i from 1 to 20 begin f i end
+            repeat 2 with j cycle begin hue j set "Top" end
+            repeat while {x < 3 * 3} begin assign x {x + 1} set "Top" end
+            if {not x != 9} begin hue {-x} set "Top" end
+        """
+        parser = Parser()
+        optimized = parser.parse(script, True)
+        self.assertGreater(parser.optimizer_stats.removed, 0)
+        expected = self._calls(Parser().parse(script))
+        self.assertGreater(len(expected['Top']), 10)
+        self.assertDictEqual(self._calls(optimized), expected)
+
+    def test_script_job(self):
+        settings.use_base({'log_level': 50, 'use_fakes': True}).configure()
+        job = ScriptJob.from_string('set "Top" set "Top" repeat 2 on "Top"')
+        self.assertIsNotNone(job.optimizer_stats)
+        self.assertGreater(job.optimizer_stats.removed, 0)
+
+        settings.use_base({'optimize': False}).configure()
+        job = ScriptJob.from_string('set "Top" set "Top"')
+        self.assertIsNone(job.optimizer_stats)
+
+    def test_required_lights(self):
+        program = Parser().parse(
+            'set "Top" set "Bottom" on "Top" set "Middle"', True)
+        self.assertSetEqual(
+            ScriptJob.required_lights(program), {'Top', 'Bottom', 'Middle'})
+        program = Parser().parse('set "Top" set group "Pole"', True)
+        self.assertIsNone(ScriptJob.required_lights(program))
+
+
+if __name__ == '__main__':
+    unittest.main()
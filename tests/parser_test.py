@@ -4,9 +4,10 @@ import logging
 import unittest
 
 from bardolph.controller.units import UnitMode
+from bardolph.lib.time_pattern import TimePattern
 from bardolph.parser.parse import Parser
 from bardolph.vm.instruction import Instruction
-from bardolph.vm.vm_codes import OpCode, Operand, Register
+from bardolph.vm.vm_codes import OpCode, Operand, Register, SetOp
 
 
 def _filter(inst_list):
@@ -68,5 +69,16 @@ class ParserTest(unittest.TestCase):
         self.assertEqual(expected, actual,
                          "Multi-zone failed: {} {}".format(expected, actual))
 
+    def test_time_pattern_union(self):
+        program = self.parser.parse('time at 10:15 or 11:45 or 2*:*0 set all')
+        expected = TimePattern.from_string('10:15')
+        expected.union(TimePattern.from_string('11:45'))
+        expected.union(TimePattern.from_string('2*:*0'))
+        patterns = [inst for inst in program
+                    if inst.op_code == OpCode.TIME_PATTERN]
+        self.assertListEqual(
+            patterns,
+            [Instruction(OpCode.TIME_PATTERN, SetOp.INIT, expected)])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from bardolph.controller.program_cache import ProgramCache
+from bardolph.lib import injection, settings
+from bardolph.parser.parse import Parser
+
+
+class CountingParser(Parser):
+    def __init__(self):
+        super().__init__()
+        self.parse_count = 0
+
+    def parse(self, input_string, optimize=False):
+        self.parse_count += 1
+        return super().parse(input_string, optimize)
+
+
+class ProgramCacheTest(unittest.TestCase):
+    def setUp(self):
+        injection.configure()
+        settings.use_base({}).configure()
+        self._dir = tempfile.mkdtemp()
+        self._script = os.path.join(self._dir, 'test.ls')
+        self._write_script('hue 5 set "Top"')
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _write_script(self, text):
+        with open(self._script, 'w') as out_file:
+            out_file.write(text)
+
+    def test_memory(self):
+        cache = ProgramCache()
+        parser = CountingParser()
+        first = cache.load(self._script, parser)
+        second = cache.load(self._script, parser)
+        self.assertIsNotNone(first)
+        self.assertListEqual(first, second)
+        self.assertEqual(parser.parse_count, 1)
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache.hits, 1)
+
+    def test_modified(self):
+        cache = ProgramCache()
+        parser = CountingParser()
+        first = cache.load(self._script, parser)
+        self._write_script('hue 6 set "Top"')
+        os.utime(self._script, ns=(0, 0))
+        second = cache.load(self._script, parser)
+        self.assertNotEqual(first, second)
+        self.assertEqual(parser.parse_count, 2)
+        self.assertEqual(cache.misses, 2)
+
+    def test_optimize_is_separate(self):
+        cache = ProgramCache()
+        parser = CountingParser()
+        cache.load(self._script, parser)
+        cache.load(self._script, parser, True)
+        self.assertEqual(parser.parse_count, 2)
+
+    def test_disk(self):
+        cache_path = os.path.join(self._dir, 'cache')
+        parser = CountingParser()
+        first = ProgramCache(cache_path).load(self._script, parser)
+
+        cache = ProgramCache(cache_path)
+        second = cache.load(self._script, parser)
+        self.assertListEqual(first, second)
+        self.assertEqual(parser.parse_count, 1)
+        self.assertEqual(cache.disk_hits, 1)
+        self.assertEqual(cache.misses, 0)
+
+    def test_parse_error(self):
+        self._write_script('hue')
+        cache = ProgramCache()
+        parser = CountingParser()
+        self.assertIsNone(cache.load(self._script, parser))
+        self.assertIsNone(cache.load(self._script, parser))
+        self.assertEqual(parser.parse_count, 2)
+
+    def test_missing_file(self):
+        cache = ProgramCache()
+        self.assertIsNone(
+            cache.load(os.path.join(self._dir, 'none.ls'), Parser()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+
+from bardolph.controller import i_controller
+from bardolph.controller.script_job import ScriptJob
+from bardolph.fakes.fake_lifx import Action
+from bardolph.lib import settings
+from bardolph.lib.injection import provide
+from bardolph.parser.parse import Parser
+from bardolph.vm.machine import Machine
+
+from . import test_module
+
+class StreamTest(unittest.TestCase):
+    def setUp(self):
+        test_module.configure()
+        self._lifx = provide(i_controller.Lifx)
+
+    def _calls_to(self, name):
+        for light in self._lifx.get_lights():
+            if light.get_label() == name:
+                return light.get_call_list()
+        return None
+
+    def _run_both(self, script):
+        # Return the calls made by run() and run_stream() for "Top".
+        Machine().run(Parser().parse(script))
+        expected = list(self._calls_to('Top'))
+        for light in self._lifx.get_lights():
+            light.clear()
+        Machine().run_stream(Parser().parse_stream(script))
+        return expected, self._calls_to('Top')
+
+    def test_parse_stream(self):
+        script = 'hue 5 set "Top" on "Top" repeat 2 begin set "Top" end'
+        chunks = list(Parser().parse_stream(script))
+        self.assertEqual(len(chunks), 4)
+        program = [inst for chunk in chunks for inst in chunk]
+        self.assertListEqual(program, Parser().parse(script))
+
+    def test_incremental(self):
+        script = """
+            units raw saturation 1 brightness 2 kelvin 3
+            hue 10 set "Top" hue 20 set "Top" hue 30 set "Top"
+        """
+        calls_seen = []
+
+        def watched_stream():
+            for chunk in Parser().parse_stream(script):
+                calls_seen.append(len(self._calls_to('Top')))
+                yield chunk
+
+        Machine().run_stream(watched_stream())
+        self.assertListEqual(self._calls_to('Top'), [
+            (Action.SET_COLOR, ([10, 1, 2, 3], 0)),
+            (Action.SET_COLOR, ([20, 1, 2, 3], 0)),
+            (Action.SET_COLOR, ([30, 1, 2, 3], 0))
+        ])
+        # By the time the last "set" was parsed, the others had been sent.
+        self.assertEqual(calls_seen[-1], 2)
+
+    def test_fallback(self):
+        script = """
+            units raw hue 10 saturation 1 brightness 2 kelvin 3 set "Top"
+            define f with x begin hue x set "Top" end
+            hue 20 set "Top"
+            repeat 2 with i from 30 to 40 begin f i end
+            if {hue > 5} begin hue 50 set "Top" end
+        """
+        expected, actual = self._run_both(script)
+        self.assertEqual(len(expected), 5)
+        self.assertListEqual(actual, expected)
+
+    def test_suspend(self):
+        script = 'units raw hue 10 set "Top" repeat 2 begin set "Top" end'
+        machine = Machine()
+
+        def suspending_stream():
+            for chunk in Parser().parse_stream(script):
+                yield chunk
+                # Requested before the loop has been loaded.
+                self.assertTrue(machine.suspend())
+
+        machine.run_stream(suspending_stream())
+        self.assertTrue(machine.is_suspended)
+        self.assertEqual(len(self._calls_to('Top')), 1)
+        machine.resume()
+        self.assertFalse(machine.is_suspended)
+        self.assertEqual(len(self._calls_to('Top')), 3)
+
+    def test_job(self):
+        settings.use_base({
+            'log_level': 50,
+            'single_light_discover': True,
+            'stream_threshold': 0,
+            'use_fakes': True
+        }).configure()
+        script = 'units raw hue 10 set "Top" repeat 2 set "Top" Unknown'
+        with tempfile.NamedTemporaryFile(
+                'w', suffix='.ls', delete=False) as script_file:
+            script_file.write(script)
+        try:
+            job = ScriptJob.from_file(script_file.name)
+            self.assertTrue(job.is_streaming)
+            job.execute()
+        finally:
+            os.remove(script_file.name)
+
+        # The first "set" runs. Because of the syntax error, the loop
+        # doesn't.
+        self.assertEqual(len(self._calls_to('Top')), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,7 @@
 #!/usr/bin/env python
 
+from datetime import datetime
+import pickle
 import unittest
 
 from bardolph.lib.time_pattern import TimePattern
@@ -117,5 +119,84 @@ class TimePatternTest(unittest.TestCase):
         self.assertFalse(pattern.match(1, 5))
         self.assertFalse(pattern.match(10, 50))
 
+    def test_exact_union(self):
+        pattern = TimePattern.from_string('10:15')
+        pattern.union(TimePattern.from_string('11:45'))
+        self.assertTrue(pattern.match(10, 15))
+        self.assertTrue(pattern.match(11, 45))
+        self.assertFalse(pattern.match(10, 45))
+        self.assertFalse(pattern.match(11, 15))
+
+    def test_last_minute(self):
+        pattern = TimePattern.from_string('*:*9')
+        self.assertTrue(pattern.match(23, 59))
+        self.assertFalse(pattern.match(24, 9))
+        self.assertFalse(pattern.match(0, 69))
+
+    def test_serialize(self):
+        pattern = TimePattern.from_string('1*:*5')
+        self.assertEqual(repr(pattern), 'TimePattern("1*", "*5")')
+        self.assertEqual(eval(repr(pattern)), pattern)
+        pattern.union(TimePattern.from_string('21:00'))
+        self.assertTrue(repr(pattern).startswith('TimePattern.from_bits('))
+        self.assertEqual(eval(repr(pattern)), pattern)
+        copied = pickle.loads(pickle.dumps(pattern))
+        self.assertEqual(copied, pattern)
+        self.assertTrue(copied.match(21, 0))
+
+    def _assert_next(self, pattern, after, expected):
+        self.assertEqual(pattern.next_match(after), expected)
+
+    def test_next_match(self):
+        pattern = TimePattern.from_string('*5:*0')
+        day = datetime(2020, 3, 1)
+        next_day = datetime(2020, 3, 2)
+        self._assert_next(
+            pattern, day.replace(hour=4, minute=59), day.replace(hour=5))
+        self._assert_next(
+            pattern, day.replace(hour=5, minute=0, second=30),
+            day.replace(hour=5))
+        self._assert_next(
+            pattern, day.replace(hour=5, minute=1),
+            day.replace(hour=5, minute=10))
+        self._assert_next(
+            pattern, day.replace(hour=5, minute=51), day.replace(hour=15))
+        self._assert_next(
+            pattern, day.replace(hour=15, minute=50, second=59),
+            day.replace(hour=15, minute=50))
+        self._assert_next(
+            pattern, day.replace(hour=16), next_day.replace(hour=5))
+
+        pattern = TimePattern.from_string('21:00')
+        self._assert_next(
+            pattern, day.replace(hour=21, minute=1), next_day.replace(hour=21))
+        self._assert_next(
+            pattern, datetime(2020, 12, 31, 22), datetime(2021, 1, 1, 21))
+
+        pattern = TimePattern.from_string('*:*')
+        self._assert_next(
+            pattern, day.replace(hour=23, minute=59, second=1),
+            day.replace(hour=23, minute=59))
+
+    def test_next_match_union(self):
+        pattern = TimePattern.from_string('10:15')
+        pattern.union(TimePattern.from_string('*:*5'))
+        day = datetime(2020, 3, 1)
+        self._assert_next(
+            pattern, day.replace(hour=9, minute=58),
+            day.replace(hour=10, minute=5))
+        self._assert_next(
+            pattern, day.replace(hour=10, minute=16),
+            day.replace(hour=10, minute=25))
+        self._assert_next(
+            pattern, day.replace(hour=23, minute=56),
+            datetime(2020, 3, 2, 0, 5))
+        for hour in range(24):
+            for minute in range(60):
+                after = day.replace(hour=hour, minute=minute)
+                found = pattern.next_match(after)
+                self.assertTrue(pattern.match(found.hour, found.minute))
+                self.assertGreaterEqual(found, after)
+
 if __name__ == '__main__':
     unittest.main()
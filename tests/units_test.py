@@ -1,10 +1,26 @@
 #!/usr/bin/env python
 
 import unittest
+from unittest import mock
 
 from bardolph.controller import units
 from bardolph.vm.vm_codes import Register
 
+_COLOR_REGS = (
+    Register.HUE, Register.SATURATION, Register.BRIGHTNESS, Register.KELVIN)
+
+def _logical_colors():
+    return [
+        [0, 0, 0, 2500], [360.0, 100, 100, 9000], [120, 33, 67, 4000],
+        [-30, 50.5, 150, 3500.5], [719.9, 0.5, 99.99, 2700], [180.25, 1, 2, 3]
+    ]
+
+def _raw_colors():
+    return [
+        [0, 0, 0, 2500], [65535, 65535, 65535, 9000],
+        [21845, 21627, 43908, 4000], [1, 32768, 65534, 3500]
+    ]
+
 class UnitsTest(unittest.TestCase):
 
     def test_as_raw(self):
@@ -40,6 +56,33 @@ class UnitsTest(unittest.TestCase):
         self.assertEqual(units.as_raw("HUE", 360.0), 0)
         self.assertAlmostEqual(
             units.as_logical("SATURATION", 21627), 33.0, places)
+    def _check_arrays(self):
+        logical = _logical_colors()
+        self.assertListEqual(units.colors_as_raw(logical), [
+            [units.as_raw(reg, value) if reg != Register.KELVIN
+             else round(value) for reg, value in zip(_COLOR_REGS, color)]
+            for color in logical])
+        raw = _raw_colors()
+        self.assertListEqual(units.colors_as_logical(raw), [
+            [units.as_logical(reg, value)
+             for reg, value in zip(_COLOR_REGS, color)]
+            for color in raw])
+
+        # A batch, such as the zones of several lights.
+        batch = [raw, raw[:1], [], raw[1:]]
+        converted = units.colors_as_logical(batch)
+        self.assertListEqual(
+            converted, [units.colors_as_logical(inner) for inner in batch])
+
+    def test_arrays(self):
+        with mock.patch.object(units, 'numpy', None):
+            self._check_arrays()
+
+    @unittest.skipIf(units.numpy is None, 'NumPy is not installed')
+    def test_arrays_numpy(self):
+        with mock.patch.object(units, '_NUMPY_THRESHOLD', 0):
+            self._check_arrays()
+
 
 if __name__ == '__main__':
     unittest.main()
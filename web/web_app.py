@@ -6,7 +6,7 @@ import platform
 
 from bardolph.lib.i_lib import Settings
 from bardolph.lib.injection import inject, injected
-from bardolph.lib.job_control import JobControl
+from bardolph.lib.job_control import JobControl, Priority
 
 from bardolph.controller.script_job import ScriptJob
 from bardolph.controller.snapshot import ScriptSnapshot, TextSnapshot
@@ -14,9 +14,11 @@ from bardolph.controller.snapshot import ScriptSnapshot, TextSnapshot
 
 class ScriptControl:
     def __init__(self, file_name, run_background=False, title='', path='',
-                background='', color='', icon=''):
+                background='', color='', icon='',
+                priority=Priority.INTERACTIVE):
         self.file_name = html.escape(file_name)
         self.run_background = run_background
+        self.priority = priority
         self.path = html.escape(path)
         self.title = html.escape(title)
         self.background = html.escape(background)
@@ -31,9 +33,22 @@ class WebApp:
 
     def __init__(self):
         self._scripts = {}
-        self._jobs = JobControl()
+        self._jobs = self._make_job_control()
         self._load_manifest()
 
+    @inject(Settings)
+    def _make_job_control(self, settings=injected):
+        return JobControl(
+            int(settings.get_value('max_job_threads', 4)),
+            int(settings.get_value('max_background_jobs', 3)),
+            float(settings.get_value('background_wait_time', 0)),
+            self._use_async())
+
+    @classmethod
+    @inject(Settings)
+    def _use_async(cls, settings=injected) -> bool:
+        return bool(settings.get_value('async_jobs', False))
+
     @inject(Settings)
     def _load_manifest(self, settings=injected):
         # If manifest_name is explicitly None, don't attempt to load a file.
@@ -51,19 +66,20 @@ class WebApp:
             background = script_config['background']
             color = script_config['color']
             icon = script_config.get('icon', 'litBulb')
+            priority = Priority[
+                script_config.get('priority', 'interactive').upper()]
             new_script = ScriptControl(file_name, run_background, title, path,
-                                        background, color, icon)
+                                        background, color, icon, priority)
             self._scripts[path] = new_script
 
     @inject(Settings)
     def queue_script(self, script_control, settings=injected):
         fname = join(
             settings.get_value("script_path", "."), script_control.file_name)
-        job = ScriptJob.from_file(fname)
+        job = ScriptJob.from_file(fname, WebApp._use_async())
         if script_control.run_background:
-            self._jobs.spawn_job(job, script_control.path)
-        else:
-            self._jobs.add_job(job, script_control.path)
+            return self._jobs.spawn_job(job, script_control.path) is not None
+        self._jobs.add_job(job, script_control.path, script_control.priority)
         return True
 
     def queue_file(self, file_name, run_background=False):
@@ -91,6 +107,12 @@ class WebApp:
             'background_jobs': self._jobs.get_background(),
             'current_job': self._jobs.get_current(),
             'queued_jobs': self._jobs.get_queued(),
+            'queue_depth': self._jobs.queue_depth,
+            'mean_wait': self._jobs.stats.mean_wait,
+            'stats': self._jobs.stats,
+            'class_waits': [
+                (priority.name.lower(), self._jobs.stats_for(priority))
+                for priority in sorted(Priority, reverse=True)],
             'lights': TextSnapshot().generate().text,
             'py_version': platform.python_version()
         }
@@ -9,7 +9,8 @@ def configure():
 
     settings_init = settings.use_base(config_values.functional)
     settings_init.add_overrides({
-        'log_to_console': False
+        'log_to_console': False,
+        'program_cache_path': 'generated/programs'
     })
     ini = os.getenv('BARDOLPH_INI')
     if ini: